@@ -4,8 +4,8 @@ from logging import Logger
 
 import torch
 
-from invokeai.app.services.object_serializer.object_serializer_disk import ObjectSerializerDisk
 from invokeai.app.services.object_serializer.object_serializer_forward_cache import ObjectSerializerForwardCache
+from invokeai.app.services.object_serializer.object_serializer_safetensors import ObjectSerializerSafetensors
 from invokeai.app.services.shared.sqlite.sqlite_util import init_db
 from invokeai.backend.stable_diffusion.diffusion.conditioning_data import ConditioningFieldData
 from invokeai.backend.util.logging import InvokeAILogger
@@ -21,7 +21,9 @@ from ..services.download import DownloadQueueService
 from ..services.image_files.image_files_disk import DiskImageFileStorage
 from ..services.image_records.image_records_sqlite import SqliteImageRecordStorage
 from ..services.images.images_default import ImageService
+from ..services.invocation_cache.invocation_cache_base import InvocationCacheBase
 from ..services.invocation_cache.invocation_cache_memory import MemoryInvocationCache
+from ..services.invocation_cache.invocation_cache_sqlite import SqliteInvocationCache
 from ..services.invocation_services import InvocationServices
 from ..services.invocation_stats.invocation_stats_default import InvocationStatsService
 from ..services.invoker import Invoker
@@ -69,7 +71,12 @@ class ApiDependencies:
         if output_folder is None:
             raise ValueError("Output folder is not set")
 
-        image_files = DiskImageFileStorage(f"{output_folder}/images")
+        image_files = DiskImageFileStorage(
+            f"{output_folder}/images",
+            max_cache_bytes=int(config.image_cache_memory * 2**20),
+            write_workers=config.image_write_workers,
+            max_deferred_bytes=int(config.intermediate_image_memory * 2**20),
+        )
 
         model_images_folder = config.models_path
 
@@ -86,12 +93,36 @@ class ApiDependencies:
         bulk_download = BulkDownloadService()
         image_records = SqliteImageRecordStorage(db=db)
         images = ImageService()
-        invocation_cache = MemoryInvocationCache(max_cache_size=config.node_cache_size)
+        node_cache_bytes = int(config.node_cache_memory * 2**20)
+        if config.node_cache_persist:
+            invocation_cache: InvocationCacheBase = SqliteInvocationCache(
+                db=db,
+                max_cache_size=config.node_cache_size,
+                max_cache_bytes=node_cache_bytes,
+                persist_tensors=config.session_checkpoints,
+            )
+        else:
+            invocation_cache = MemoryInvocationCache(
+                max_cache_size=config.node_cache_size, max_cache_bytes=node_cache_bytes
+            )
+        tensor_cache_bytes = int(config.tensor_cache_memory * 2**20)
         tensors = ObjectSerializerForwardCache(
-            ObjectSerializerDisk[torch.Tensor](output_folder / "tensors", ephemeral=True)
+            ObjectSerializerSafetensors[torch.Tensor](
+                output_folder / "tensors", ephemeral=not config.session_checkpoints
+            ),
+            max_cache_size=None,
+            max_cache_bytes=tensor_cache_bytes,
+            write_behind=config.tensor_write_behind,
+            collect_garbage=config.tensor_gc,
         )
         conditioning = ObjectSerializerForwardCache(
-            ObjectSerializerDisk[ConditioningFieldData](output_folder / "conditioning", ephemeral=True)
+            ObjectSerializerSafetensors[ConditioningFieldData](
+                output_folder / "conditioning", ephemeral=not config.session_checkpoints
+            ),
+            max_cache_size=None,
+            max_cache_bytes=tensor_cache_bytes,
+            write_behind=config.tensor_write_behind,
+            collect_garbage=config.tensor_gc,
         )
         download_queue_service = DownloadQueueService(event_bus=events)
         model_images_service = ModelImageFileStorageDisk(model_images_folder / "model_images")
@@ -2,51 +2,116 @@
 
 import asyncio
 import threading
-from queue import Empty, Queue
-from typing import Any
+import time
+from typing import Any, Optional
 
 from fastapi_events.dispatcher import dispatch
 
 from ..services.events.events_base import EventServiceBase
+from ..services.events.events_common import EventDispatchStatus
 
 
 class FastAPIEventService(EventServiceBase):
+    """Dispatches events emitted by any thread on the event loop it was created on.
+
+    Emitted events are queued, and the event loop is woken up once per burst of events, which are then dispatched in a
+    single batch. Events are dispatched as soon as the event loop is free, rather than when the queue is next polled.
+    """
+
     event_handler_id: int
-    __queue: Queue
-    __stop_event: threading.Event
+    __loop: asyncio.AbstractEventLoop
+    __lock: threading.Lock
+    # The events waiting to be dispatched, with the time they were emitted
+    __pending: list[tuple[str, Any, float]]
+    __wakeup_scheduled: bool
+    __ready: asyncio.Event
+    __stopped: bool
+    __dispatched: int
+    __batches: int
+    __latency_total: float
+    __max_latency: float
+    # The number of subscribers wanting progress images, by queue
+    __progress_image_subscribers: dict[str, int]
 
     def __init__(self, event_handler_id: int) -> None:
         self.event_handler_id = event_handler_id
-        self.__queue = Queue()
-        self.__stop_event = threading.Event()
-        asyncio.create_task(self.__dispatch_from_queue(stop_event=self.__stop_event))
+        self.__loop = asyncio.get_running_loop()
+        self.__lock = threading.Lock()
+        self.__pending = []
+        self.__wakeup_scheduled = False
+        self.__ready = asyncio.Event()
+        self.__stopped = False
+        self.__dispatched = 0
+        self.__batches = 0
+        self.__latency_total = 0.0
+        self.__max_latency = 0.0
+        self.__progress_image_subscribers = {}
+        asyncio.create_task(self.__dispatch_from_queue())
 
         super().__init__()
 
     def stop(self, *args, **kwargs):
-        self.__stop_event.set()
-        self.__queue.put(None)
+        with self.__lock:
+            self.__stopped = True
+        self.__wake_up()
 
     def dispatch(self, event_name: str, payload: Any) -> None:
-        self.__queue.put({"event_name": event_name, "payload": payload})
-
-    async def __dispatch_from_queue(self, stop_event: threading.Event):
-        """Get events on from the queue and dispatch them, from the correct thread"""
-        while not stop_event.is_set():
-            try:
-                event = self.__queue.get(block=False)
-                if not event:  # Probably stopping
-                    continue
-
-                dispatch(
-                    event.get("event_name"),
-                    payload=event.get("payload"),
-                    middleware_id=self.event_handler_id,
-                )
-
-            except Empty:
-                await asyncio.sleep(0.1)
-                pass
-
-            except asyncio.CancelledError as e:
-                raise e  # Raise a proper error
+        with self.__lock:
+            self.__pending.append((event_name, payload, time.monotonic()))
+            if self.__wakeup_scheduled:
+                # The event is dispatched with the others already waiting
+                return
+            self.__wakeup_scheduled = True
+        self.__wake_up()
+
+    def wants_progress_images(self, queue_id: str) -> bool:
+        with self.__lock:
+            return self.__progress_image_subscribers.get(queue_id, 0) > 0
+
+    def set_progress_image_subscribers(self, queue_id: str, count: int) -> None:
+        with self.__lock:
+            self.__progress_image_subscribers[queue_id] = count
+
+    def get_dispatch_status(self) -> Optional[EventDispatchStatus]:
+        with self.__lock:
+            return EventDispatchStatus(
+                queue_depth=len(self.__pending),
+                dispatched=self.__dispatched,
+                batches=self.__batches,
+                latency_seconds_total=self.__latency_total,
+                max_latency_seconds=self.__max_latency,
+            )
+
+    def __wake_up(self) -> None:
+        try:
+            # asyncio events are not thread-safe, so the event is set on the event loop
+            self.__loop.call_soon_threadsafe(self.__ready.set)
+        except RuntimeError:
+            # The event loop was closed, so there is no one left to dispatch to
+            pass
+
+    async def __dispatch_from_queue(self) -> None:
+        """Get events from the queue and dispatch them, from the correct thread"""
+        while True:
+            await self.__ready.wait()
+            self.__ready.clear()
+            with self.__lock:
+                events = self.__pending
+                self.__pending = []
+                self.__wakeup_scheduled = False
+                stopped = self.__stopped
+
+            for event_name, payload, _ in events:
+                dispatch(event_name, payload=payload, middleware_id=self.event_handler_id)
+
+            if events:
+                now = time.monotonic()
+                with self.__lock:
+                    self.__dispatched += len(events)
+                    self.__batches += 1
+                    for _, _, emitted_at in events:
+                        self.__latency_total += now - emitted_at
+                        self.__max_latency = max(self.__max_latency, now - emitted_at)
+
+            if stopped:
+                return
@@ -11,7 +11,10 @@ from fastapi.routing import APIRouter
 from pydantic import BaseModel, Field
 
 from invokeai.app.invocations.upscale import ESRGAN_MODELS
+from invokeai.app.services.events.events_common import EventDispatchStatus
+from invokeai.app.services.image_files.image_files_common import ImageFileCacheStatus
 from invokeai.app.services.invocation_cache.invocation_cache_common import InvocationCacheStatus
+from invokeai.app.services.object_serializer.object_serializer_common import ObjectSerializerStorageStatus
 from invokeai.backend.image_util.infill_methods.patchmatch import PatchMatch
 from invokeai.backend.image_util.safety_checker import SafetyChecker
 from invokeai.backend.util.logging import logging
@@ -70,6 +73,13 @@ class AppConfig(BaseModel):
     watermarking_methods: list[str] = Field(description="List of invisible watermark methods")
 
 
+class ObjectStorageStatus(BaseModel):
+    """Intermediate Object Storage Status Response"""
+
+    tensors: Optional[ObjectSerializerStorageStatus] = Field(description="The storage status of tensors")
+    conditioning: Optional[ObjectSerializerStorageStatus] = Field(description="The storage status of conditioning")
+
+
 @app_router.get("/version", operation_id="app_version", status_code=200, response_model=AppVersion)
 async def get_version() -> AppVersion:
     return AppVersion(version=__version__)
@@ -186,3 +196,36 @@ async def disable_invocation_cache() -> None:
 async def get_invocation_cache_status() -> InvocationCacheStatus:
     """Clears the invocation cache"""
     return ApiDependencies.invoker.services.invocation_cache.get_status()
+
+
+@app_router.get(
+    "/object_storage/status",
+    operation_id="get_object_storage_status",
+    responses={200: {"model": ObjectStorageStatus}},
+)
+async def get_object_storage_status() -> ObjectStorageStatus:
+    """Gets the disk space used by intermediate tensors and conditioning, and how much of it is still in use"""
+    return ObjectStorageStatus(
+        tensors=ApiDependencies.invoker.services.tensors.get_storage_status(),
+        conditioning=ApiDependencies.invoker.services.conditioning.get_storage_status(),
+    )
+
+
+@app_router.get(
+    "/image_cache/status",
+    operation_id="get_image_cache_status",
+    responses={200: {"model": ImageFileCacheStatus}},
+)
+async def get_image_cache_status() -> ImageFileCacheStatus:
+    """Gets the status of the in-memory cache of images"""
+    return ApiDependencies.invoker.services.image_files.get_cache_status()
+
+
+@app_router.get(
+    "/events/status",
+    operation_id="get_event_dispatch_status",
+    responses={200: {"model": Optional[EventDispatchStatus]}},
+)
+async def get_event_dispatch_status() -> Optional[EventDispatchStatus]:
+    """Gets how many events are waiting to be sent to clients, and how long they waited"""
+    return ApiDependencies.invoker.services.events.get_dispatch_status()
@@ -205,7 +205,7 @@ async def get_image_workflow(
     responses={
         200: {
             "description": "Return the full-resolution image",
-            "content": {"image/png": {}},
+            "content": {"image/png": {}, "image/webp": {}},
         },
         404: {"description": "Image not found"},
     },
@@ -223,7 +223,8 @@ async def get_image_full(
 
         response = FileResponse(
             path,
-            media_type="image/png",
+            # Images may be saved as PNG or other formats, as configured by `image_formats`
+            media_type=ApiDependencies.invoker.services.image_files.get_media_type(image_name),
             filename=image_name,
             content_disposition_type="inline",
         )
@@ -0,0 +1,142 @@
+from typing import Any
+
+import psutil
+import torch
+from fastapi import Response
+from fastapi.routing import APIRouter
+
+from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.services.object_serializer.object_serializer_base import ObjectSerializerBase
+from invokeai.app.services.object_serializer.object_serializer_forward_cache import ObjectSerializerForwardCache
+from invokeai.app.services.session_queue.session_queue_common import DEFAULT_QUEUE_ID
+from invokeai.app.util.metrics import CONTENT_TYPE, MetricsWriter
+
+from ..dependencies import ApiDependencies
+
+metrics_router = APIRouter(tags=["metrics"])
+
+
+def write_metrics(services: InvocationServices) -> str:
+    """Writes the performance metrics of the app in the Prometheus text exposition format"""
+    writer = MetricsWriter()
+
+    writer.histogram(
+        "invokeai_node_duration_seconds",
+        "Time spent executing nodes, by node type",
+        services.performance_statistics.get_node_durations(),
+        label_name="node_type",
+    )
+    writer.histogram(
+        "invokeai_queue_wait_seconds",
+        "Time between queue items being enqueued and their execution starting",
+        services.session_processor.get_wait_times(),
+    )
+    queue_counts = services.session_queue.get_queue_status_counts(DEFAULT_QUEUE_ID)
+    writer.gauge(
+        "invokeai_queue_items",
+        "Number of queue items, by status",
+        {status: queue_counts.get(status, 0) for status in ("pending", "in_progress")},
+        label_name="status",
+    )
+
+    writer.gauge("invokeai_ram_used_bytes", "Resident memory of the process", psutil.Process().memory_info().rss)
+    if torch.cuda.is_available():
+        writer.gauge("invokeai_vram_allocated_bytes", "VRAM allocated by tensors", torch.cuda.memory_allocated())
+
+    ram_cache = services.model_manager.load.ram_cache
+    counters = ram_cache.counters
+    writer.counter("invokeai_model_cache_hits_total", "Model cache hits", counters.hits)
+    writer.counter("invokeai_model_cache_misses_total", "Model cache misses", counters.misses)
+    writer.counter(
+        "invokeai_model_cache_evictions_total", "Models cleared from the cache to make space", counters.evictions
+    )
+    writer.counter(
+        "invokeai_model_cache_evicted_bytes_total",
+        "Size of the models cleared from the cache to make space",
+        counters.evicted_bytes,
+    )
+    writer.gauge("invokeai_model_cache_size_bytes", "Size of the models in the cache", ram_cache.cache_size())
+    writer.gauge(
+        "invokeai_model_cache_max_size_bytes", "Maximum size of the model cache", ram_cache.max_cache_size * 2**30
+    )
+
+    object_stores: dict[str, ObjectSerializerBase[Any]] = {
+        "tensors": services.tensors,
+        "conditioning": services.conditioning,
+    }
+    object_caches = {
+        name: store.get_status()
+        for name, store in object_stores.items()
+        if isinstance(store, ObjectSerializerForwardCache)
+    }
+    writer.gauge(
+        "invokeai_object_cache_size_bytes",
+        "Memory used by cached tensors and conditioning, by store",
+        {name: status.size_bytes for name, status in object_caches.items()},
+        label_name="store",
+    )
+    writer.counter(
+        "invokeai_object_cache_hits_total",
+        "Tensor and conditioning cache hits, by store",
+        {name: status.hits for name, status in object_caches.items()},
+        label_name="store",
+    )
+    writer.counter(
+        "invokeai_object_cache_misses_total",
+        "Tensor and conditioning cache misses, by store",
+        {name: status.misses for name, status in object_caches.items()},
+        label_name="store",
+    )
+    object_storage = {name: store.get_storage_status() for name, store in object_stores.items()}
+    writer.gauge(
+        "invokeai_object_storage_bytes",
+        "Disk space used by stored tensors and conditioning, by store",
+        {name: status.size_bytes for name, status in object_storage.items() if status is not None},
+        label_name="store",
+    )
+    writer.gauge(
+        "invokeai_object_storage_garbage_bytes",
+        "Disk space used by stored tensors and conditioning no longer in use, by store",
+        {name: status.garbage_size_bytes for name, status in object_storage.items() if status is not None},
+        label_name="store",
+    )
+
+    image_cache = services.image_files.get_cache_status()
+    writer.gauge("invokeai_image_cache_size_bytes", "Memory used by cached images", image_cache.size_bytes)
+    writer.counter("invokeai_image_cache_hits_total", "Image cache hits", image_cache.hits)
+    writer.counter("invokeai_image_cache_misses_total", "Image cache misses", image_cache.misses)
+    writer.gauge("invokeai_deferred_images_bytes", "Memory used by images not yet written", image_cache.deferred_bytes)
+
+    invocation_cache = services.invocation_cache.get_status()
+    writer.gauge("invokeai_invocation_cache_size", "Number of cached node outputs", invocation_cache.size)
+    writer.counter("invokeai_invocation_cache_hits_total", "Invocation cache hits", invocation_cache.hits)
+    writer.counter("invokeai_invocation_cache_misses_total", "Invocation cache misses", invocation_cache.misses)
+
+    dispatch_status = services.events.get_dispatch_status()
+    if dispatch_status is not None:
+        writer.gauge("invokeai_event_queue_depth", "Events waiting to be dispatched", dispatch_status.queue_depth)
+        writer.summary(
+            "invokeai_event_dispatch_lag_seconds",
+            "Time events waited between being emitted and dispatched",
+            dispatch_status.latency_seconds_total,
+            dispatch_status.dispatched,
+        )
+        writer.gauge(
+            "invokeai_event_dispatch_max_lag_seconds",
+            "Longest time an event waited between being emitted and dispatched",
+            dispatch_status.max_latency_seconds,
+        )
+
+    return writer.render()
+
+
+# Not a coroutine: measuring the stored objects lists their folders, which must not block the event loop.
+@metrics_router.get(
+    "/metrics",
+    operation_id="get_metrics",
+    response_class=Response,
+    responses={200: {"content": {CONTENT_TYPE: {}}}},
+)
+def get_metrics() -> Response:
+    """Gets the performance metrics of the app, in the Prometheus text exposition format"""
+    return Response(content=write_metrics(ApiDependencies.invoker.services), media_type=CONTENT_TYPE)
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from fastapi import Body, Path, Query
+from fastapi import Body, HTTPException, Path, Query
 from fastapi.routing import APIRouter
 from pydantic import BaseModel
 
@@ -15,8 +15,11 @@ from invokeai.app.services.session_queue.session_queue_common import (
     PruneResult,
     SessionQueueItem,
     SessionQueueItemDTO,
+    SessionQueueItemNode,
+    SessionQueueItemNotFoundError,
     SessionQueueStatus,
 )
+from invokeai.app.services.shared.graph import NodeNotFoundError
 from invokeai.app.services.shared.pagination import CursorPaginatedResults
 
 from ..dependencies import ApiDependencies
@@ -38,12 +41,14 @@ class SessionQueueAndProcessorStatus(BaseModel):
         201: {"model": EnqueueBatchResult},
     },
 )
-async def enqueue_batch(
+def enqueue_batch(
     queue_id: str = Path(description="The queue id to perform this operation on"),
     batch: Batch = Body(description="Batch to process"),
     prepend: bool = Body(default=False, description="Whether or not to prepend this batch in the queue"),
 ) -> EnqueueBatchResult:
     """Processes a batch and enqueues the output graphs for execution."""
+    # This is a sync route so that FastAPI runs it in its threadpool - creating and inserting the sessions of a large
+    # batch would otherwise block the event loop.
 
     return ApiDependencies.invoker.services.session_queue.enqueue_batch(queue_id=queue_id, batch=batch, prepend=prepend)
 
@@ -116,10 +121,8 @@ async def cancel_by_batch_ids(
 async def clear(
     queue_id: str = Path(description="The queue id to perform this operation on"),
 ) -> ClearResult:
-    """Clears the queue entirely, immediately canceling the currently-executing session"""
-    queue_item = ApiDependencies.invoker.services.session_queue.get_current(queue_id)
-    if queue_item is not None:
-        ApiDependencies.invoker.services.session_queue.cancel_queue_item(queue_item.item_id)
+    """Clears the queue entirely, immediately canceling the sessions being executed"""
+    ApiDependencies.invoker.services.session_queue.cancel_by_queue_id(queue_id)
     clear_result = ApiDependencies.invoker.services.session_queue.clear(queue_id)
     return clear_result
 
@@ -212,6 +215,38 @@ async def get_queue_item(
     return ApiDependencies.invoker.services.session_queue.get_queue_item(item_id)
 
 
+@session_queue_router.get(
+    "/{queue_id}/i/{item_id}/nodes/{node_id}",
+    operation_id="get_queue_item_node",
+    responses={
+        200: {"model": SessionQueueItemNode},
+        404: {"description": "The queue item or node was not found"},
+    },
+)
+async def get_queue_item_node(
+    queue_id: str = Path(description="The queue id to perform this operation on"),
+    item_id: int = Path(description="The queue item to get the node of"),
+    node_id: str = Path(description="The id of the node in the session's execution graph"),
+) -> SessionQueueItemNode:
+    """Gets a node of a queue item's session and its output, which invocation events may omit"""
+    services = ApiDependencies.invoker.services
+    # The session of a running queue item is only saved when it finishes, or when checkpointed
+    queue_item = services.session_processor.get_running_queue_item(item_id)
+    try:
+        if queue_item is None:
+            queue_item = services.session_queue.get_queue_item(item_id)
+    except SessionQueueItemNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    if queue_item.queue_id != queue_id:
+        raise HTTPException(status_code=404, detail=f"Queue item {item_id} not found in queue {queue_id}")
+    try:
+        node = queue_item.session.execution_graph.get_node(node_id)
+    except NodeNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    result = queue_item.session.results.get(node_id)
+    return SessionQueueItemNode(node=node.model_dump(), result=result.model_dump() if result is not None else None)
+
+
 @session_queue_router.put(
     "/{queue_id}/i/{item_id}/cancel",
     operation_id="cancel_queue_item",
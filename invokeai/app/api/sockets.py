@@ -1,16 +1,60 @@
 # Copyright (c) 2022 Kyle Schouviller (https://github.com/kyle0654)
 
+import asyncio
+import time
+from typing import Any, Optional
+
 from fastapi import FastAPI
 from fastapi_events.handlers.local import local_handler
 from fastapi_events.typing import Event
 from socketio import ASGIApp, AsyncServer
 
 from ..services.events.events_base import EventServiceBase
+from ..services.session_processor.session_processor_common import ProgressPreview, ProgressPreviewSettings
+from .dependencies import ApiDependencies
+
+# The events carrying a node, and for completed nodes its output
+INVOCATION_EVENTS = {"invocation_started", "invocation_complete", "invocation_error"}
 
 
 class SocketIO:
+    """Sends events to the socket.io clients subscribed to them.
+
+    Progress events of each queue item are coalesced: at most `progress_events_per_second` are sent to each queue's
+    clients, and only the latest progress event is sent, dropping those emitted in between. Progress events still
+    waiting to be sent are dropped once any other event of their queue item is sent, so they never arrive out of order.
+
+    Each subscriber of a queue may ask for progress images in a given format, size and rate with the
+    `progress_images` field of its `subscribe_queue` message, see `ProgressPreviewSettings`. Progress images are
+    encoded off the event loop, once for each format and size, and binary formats are sent as binary attachments. If no
+    subscriber of a queue wants progress images, they are not generated at all.
+
+    Invocation events carry the node and its output, which may be large. Subscribers that set `slim_events` in their
+    `subscribe_queue` message only get the node's id and type, and the output's type, and may fetch the full node and
+    output from the queue item's API.
+
+    :param app: The app to mount the socket.io server on
+    :param progress_events_per_second: The maximum rate of progress events sent to each queue's clients. If 0, all
+        progress events are sent.
+    """
+
     __sio: AsyncServer
     __app: ASGIApp
+    __progress_interval: float
+    # The latest progress events waiting to be sent, by queue and queue item
+    __pending_progress: dict[str, dict[int, dict[str, Any]]]
+    # The tasks that will send the waiting progress events of each queue
+    __progress_tasks: dict[str, "asyncio.Task[None]"]
+    # When progress events were last sent to each queue
+    __progress_sent_at: dict[str, float]
+    # The progress images wanted by each subscriber, by queue and subscriber
+    __progress_image_settings: dict[str, dict[str, ProgressPreviewSettings]]
+    # When progress images were last sent to each progress room
+    __progress_images_sent_at: dict[str, float]
+    # Whether each subscriber wants slim invocation events, by queue and subscriber
+    __slim_events: dict[str, dict[str, bool]]
+    # Keeps the events of each queue in order while progress images are encoded
+    __queue_locks: dict[str, asyncio.Lock]
 
     __sub_queue: str = "subscribe_queue"
     __unsub_queue: str = "unsubscribe_queue"
@@ -18,11 +62,21 @@ class SocketIO:
     __sub_bulk_download: str = "subscribe_bulk_download"
     __unsub_bulk_download: str = "unsubscribe_bulk_download"
 
-    def __init__(self, app: FastAPI):
+    def __init__(self, app: FastAPI, progress_events_per_second: float = 0) -> None:
+        self.__progress_interval = 1 / progress_events_per_second if progress_events_per_second > 0 else 0
+        self.__pending_progress = {}
+        self.__progress_tasks = {}
+        self.__progress_sent_at = {}
+        self.__progress_image_settings = {}
+        self.__progress_images_sent_at = {}
+        self.__slim_events = {}
+        self.__queue_locks = {}
+
         self.__sio = AsyncServer(async_mode="asgi", cors_allowed_origins="*")
         self.__app = ASGIApp(socketio_server=self.__sio, socketio_path="/ws/socket.io")
         app.mount("/ws", self.__app)
 
+        self.__sio.on("disconnect", handler=self._handle_disconnect)
         self.__sio.on(self.__sub_queue, handler=self._handle_sub_queue)
         self.__sio.on(self.__unsub_queue, handler=self._handle_unsub_queue)
         local_handler.register(event_name=EventServiceBase.queue_event, _func=self._handle_queue_event)
@@ -32,35 +86,177 @@ class SocketIO:
         self.__sio.on(self.__unsub_bulk_download, handler=self._handle_unsub_bulk_download)
         local_handler.register(event_name=EventServiceBase.bulk_download_event, _func=self._handle_bulk_download_event)
 
-    async def _handle_queue_event(self, event: Event):
-        await self.__sio.emit(
-            event=event[1]["event"],
-            data=event[1]["data"],
-            room=event[1]["data"]["queue_id"],
-        )
+    async def _handle_queue_event(self, event: Event) -> None:
+        event_name = event[1]["event"]
+        data = event[1]["data"]
+        queue_id = data["queue_id"]
+
+        if event_name == "generator_progress" and self.__progress_interval > 0:
+            self.__pending_progress.setdefault(queue_id, {})[data["queue_item_id"]] = data
+            if queue_id not in self.__progress_tasks:
+                delay = self.__progress_sent_at.get(queue_id, 0) + self.__progress_interval - time.monotonic()
+                self.__progress_tasks[queue_id] = asyncio.create_task(self.__send_progress(queue_id, max(delay, 0)))
+            return
+
+        async with self.__get_queue_lock(queue_id):
+            if event_name == "generator_progress":
+                await self.__emit_progress(queue_id, data)
+                return
+            if "queue_item_id" in data:
+                self.__pending_progress.get(queue_id, {}).pop(data["queue_item_id"], None)
+            if event_name in INVOCATION_EVENTS:
+                await self.__emit_invocation_event(queue_id, event_name, data)
+                return
+            await self.__sio.emit(event=event_name, data=data, room=queue_id)
+
+    async def __send_progress(self, queue_id: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        del self.__progress_tasks[queue_id]
+        async with self.__get_queue_lock(queue_id):
+            pending_progress = self.__pending_progress.pop(queue_id, {})
+            self.__progress_sent_at[queue_id] = time.monotonic()
+            for data in pending_progress.values():
+                await self.__emit_progress(queue_id, data)
+
+    async def __emit_progress(self, queue_id: str, data: dict[str, Any]) -> None:
+        """Sends a progress event to each progress room of the queue, with the progress image its subscribers want."""
+        progress_image = data["progress_image"]
+        rooms = {
+            get_progress_room(queue_id, settings): settings
+            for settings in self.__progress_image_settings.get(queue_id, {}).values()
+        }
+        encoded_images: dict[tuple[str, Optional[int]], Optional[dict[str, Any]]] = {}
+        now = time.monotonic()
+        for room, settings in rooms.items():
+            encoded_image = None
+            sent_at = self.__progress_images_sent_at.get(room, 0)
+            is_due = settings.max_per_second is None or now >= sent_at + 1 / settings.max_per_second
+            if isinstance(progress_image, ProgressPreview) and settings.format != "none" and is_due:
+                key = (settings.format, settings.max_size)
+                if key not in encoded_images:
+                    # Encoding takes a few milliseconds, which would hold up all other events
+                    encoded_images[key] = await asyncio.get_running_loop().run_in_executor(
+                        None, progress_image.encode, settings
+                    )
+                encoded_image = encoded_images[key]
+                self.__progress_images_sent_at[room] = now
+            await self.__sio.emit(event="generator_progress", data={**data, "progress_image": encoded_image}, room=room)
 
-    async def _handle_sub_queue(self, sid, data, *args, **kwargs) -> None:
+    async def __emit_invocation_event(self, queue_id: str, event_name: str, data: dict[str, Any]) -> None:
+        """Sends an invocation event, with the full node and output to the subscribers that want them."""
+        slim_events = self.__slim_events.get(queue_id, {}).values()
+        if not all(slim_events):
+            await self.__sio.emit(event=event_name, data=data, room=get_events_room(queue_id, slim=False))
+        if any(slim_events):
+            slim_data = get_slim_invocation_event(data)
+            await self.__sio.emit(event=event_name, data=slim_data, room=get_events_room(queue_id, slim=True))
+
+    def __get_queue_lock(self, queue_id: str) -> asyncio.Lock:
+        if queue_id not in self.__queue_locks:
+            self.__queue_locks[queue_id] = asyncio.Lock()
+        return self.__queue_locks[queue_id]
+
+    async def _handle_sub_queue(self, sid: str, data: Any, *args: Any, **kwargs: Any) -> None:
         if "queue_id" in data:
-            await self.__sio.enter_room(sid, data["queue_id"])
+            queue_id = data["queue_id"]
+            # Clients that do not ask for progress images get them as JPEG data URLs
+            settings = ProgressPreviewSettings.model_validate(data.get("progress_images") or {})
+            await self.__sio.enter_room(sid, queue_id)
+            await self.__leave_progress_room(sid, queue_id)
+            self.__progress_image_settings.setdefault(queue_id, {})[sid] = settings
+            await self.__sio.enter_room(sid, get_progress_room(queue_id, settings))
+            self.__update_progress_image_subscribers(queue_id)
+            await self.__leave_events_room(sid, queue_id)
+            slim = bool(data.get("slim_events", False))
+            self.__slim_events.setdefault(queue_id, {})[sid] = slim
+            await self.__sio.enter_room(sid, get_events_room(queue_id, slim))
 
-    async def _handle_unsub_queue(self, sid, data, *args, **kwargs) -> None:
+    async def _handle_unsub_queue(self, sid: str, data: Any, *args: Any, **kwargs: Any) -> None:
         if "queue_id" in data:
             await self.__sio.leave_room(sid, data["queue_id"])
+            await self.__leave_progress_room(sid, data["queue_id"])
+            self.__update_progress_image_subscribers(data["queue_id"])
+            await self.__leave_events_room(sid, data["queue_id"])
+            self.__forget_unsubscribed_queue(data["queue_id"])
+
+    async def _handle_disconnect(self, sid: str, *args: Any, **kwargs: Any) -> None:
+        # Disconnected clients leave their rooms, but their progress image settings must be forgotten too
+        for queue_id, subscriber_settings in list(self.__progress_image_settings.items()):
+            settings = subscriber_settings.pop(sid, None)
+            if settings is not None:
+                self.__forget_unsubscribed_progress_room(queue_id, settings)
+                self.__update_progress_image_subscribers(queue_id)
+        for queue_id, slim_events in list(self.__slim_events.items()):
+            if slim_events.pop(sid, None) is not None:
+                self.__forget_unsubscribed_queue(queue_id)
+
+    async def __leave_progress_room(self, sid: str, queue_id: str) -> None:
+        settings = self.__progress_image_settings.get(queue_id, {}).pop(sid, None)
+        if settings is not None:
+            await self.__sio.leave_room(sid, get_progress_room(queue_id, settings))
+            self.__forget_unsubscribed_progress_room(queue_id, settings)
+
+    def __forget_unsubscribed_progress_room(self, queue_id: str, settings: ProgressPreviewSettings) -> None:
+        """Forgets when progress images were last sent to a progress room once it has no subscribers left."""
+        if settings not in self.__progress_image_settings.get(queue_id, {}).values():
+            self.__progress_images_sent_at.pop(get_progress_room(queue_id, settings), None)
+
+    async def __leave_events_room(self, sid: str, queue_id: str) -> None:
+        slim = self.__slim_events.get(queue_id, {}).pop(sid, None)
+        if slim is not None:
+            await self.__sio.leave_room(sid, get_events_room(queue_id, slim))
+
+    def __forget_unsubscribed_queue(self, queue_id: str) -> None:
+        """Forgets the state kept for a queue once it has no subscribers left."""
+        if self.__slim_events.get(queue_id):
+            return
+        self.__slim_events.pop(queue_id, None)
+        self.__progress_image_settings.pop(queue_id, None)
+        self.__progress_sent_at.pop(queue_id, None)
+        # A held lock is still keeping events in order. Locks are acquired as soon as they are got, without awaiting in
+        # between, so a lock that is not held is not about to be either.
+        lock = self.__queue_locks.get(queue_id)
+        if lock is not None and not lock.locked():
+            del self.__queue_locks[queue_id]
+
+    def __update_progress_image_subscribers(self, queue_id: str) -> None:
+        count = sum(
+            1 for settings in self.__progress_image_settings.get(queue_id, {}).values() if settings.format != "none"
+        )
+        ApiDependencies.invoker.services.events.set_progress_image_subscribers(queue_id, count)
 
     async def _handle_model_event(self, event: Event) -> None:
         await self.__sio.emit(event=event[1]["event"], data=event[1]["data"])
 
-    async def _handle_bulk_download_event(self, event: Event):
+    async def _handle_bulk_download_event(self, event: Event) -> None:
         await self.__sio.emit(
             event=event[1]["event"],
             data=event[1]["data"],
             room=event[1]["data"]["bulk_download_id"],
         )
 
-    async def _handle_sub_bulk_download(self, sid, data, *args, **kwargs):
+    async def _handle_sub_bulk_download(self, sid: str, data: Any, *args: Any, **kwargs: Any) -> None:
         if "bulk_download_id" in data:
             await self.__sio.enter_room(sid, data["bulk_download_id"])
 
-    async def _handle_unsub_bulk_download(self, sid, data, *args, **kwargs):
+    async def _handle_unsub_bulk_download(self, sid: str, data: Any, *args: Any, **kwargs: Any) -> None:
         if "bulk_download_id" in data:
             await self.__sio.leave_room(sid, data["bulk_download_id"])
+
+
+def get_progress_room(queue_id: str, settings: ProgressPreviewSettings) -> str:
+    """Gets the room of the subscribers of a queue that want progress images with the given settings."""
+    return f"{queue_id}:progress:{settings.model_dump_json()}"
+
+
+def get_events_room(queue_id: str, slim: bool) -> str:
+    """Gets the room of the subscribers of a queue that want slim or full invocation events."""
+    return f"{queue_id}:events:{'slim' if slim else 'full'}"
+
+
+def get_slim_invocation_event(data: dict[str, Any]) -> dict[str, Any]:
+    """Replaces the node and output of an invocation event with their ids and types."""
+    slim_data = {**data, "node": {"id": data["node"]["id"], "type": data["node"]["type"]}}
+    if "result" in data:
+        slim_data["result"] = {"type": data["result"]["type"]}
+    return slim_data
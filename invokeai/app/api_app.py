@@ -27,7 +27,7 @@ import invokeai.frontend.web as web_dir
 from invokeai.app.api.no_cache_staticfiles import NoCacheStaticFiles
 from invokeai.app.invocations.model import ModelIdentifierField
 from invokeai.app.services.config.config_default import get_config
-from invokeai.app.services.session_processor.session_processor_common import ProgressImage
+from invokeai.app.services.session_processor.session_processor_common import ProgressImage, ProgressPreviewSettings
 from invokeai.backend.util.devices import get_torch_device_name
 
 from ..backend.util.logging import InvokeAILogger
@@ -38,6 +38,7 @@ from .api.routers import (
     boards,
     download_queue,
     images,
+    metrics,
     model_manager,
     session_queue,
     utilities,
@@ -94,7 +95,7 @@ app.add_middleware(
     middleware_id=event_handler_id,
 )
 
-socket_io = SocketIO(app)
+socket_io = SocketIO(app, progress_events_per_second=app_config.progress_events_per_second)
 
 app.add_middleware(
     CORSMiddleware,
@@ -117,6 +118,8 @@ app.include_router(board_images.board_images_router, prefix="/api")
 app.include_router(app_info.app_router, prefix="/api")
 app.include_router(session_queue.session_queue_router, prefix="/api")
 app.include_router(workflows.workflows_router, prefix="/api")
+# Metrics are served at the conventional path for Prometheus scrapers
+app.include_router(metrics.metrics_router)
 
 
 # Build a custom OpenAPI to include all outputs
@@ -158,6 +161,7 @@ def custom_openapi() -> dict[str, Any]:
             (OutputFieldJSONSchemaExtra, "serialization"),
             (ModelIdentifierField, "serialization"),
             (ProgressImage, "serialization"),
+            (ProgressPreviewSettings, "serialization"),
         ],
         ref_template="#/components/schemas/{model}",
     )
@@ -32,6 +32,8 @@ ATTENTION_TYPE = Literal["auto", "normal", "xformers", "sliced", "torch-sdp"]
 ATTENTION_SLICE_SIZE = Literal["auto", "balanced", "max", 1, 2, 3, 4, 5, 6, 7, 8]
 LOG_FORMAT = Literal["plain", "color", "syslog", "legacy"]
 LOG_LEVEL = Literal["debug", "info", "warning", "error", "critical"]
+IMAGE_FORMAT = Literal["png", "png_uncompressed", "webp_lossless"]
+IMAGE_FORMAT_CATEGORY = Literal["intermediate", "general", "mask", "control", "user", "other"]
 CONFIG_SCHEMA_VERSION = "4.0.0"
 
 
@@ -82,6 +84,7 @@ class InvokeAIAppConfig(BaseSettings):
         allow_headers: Headers allowed for CORS.
         ssl_certfile: SSL certificate file for HTTPS. See https://www.uvicorn.org/settings/#https.
         ssl_keyfile: SSL key file for HTTPS. See https://www.uvicorn.org/settings/#https.
+        progress_events_per_second: Maximum number of denoising progress events sent to each queue's clients per second. Only the latest progress of each queue item is sent, older progress is dropped. If 0, every progress event is sent.
         log_tokenization: Enable logging of parsed prompt tokens.
         patchmatch: Enable patchmatch inpaint code.
         models_dir: Path to the models directory.
@@ -102,6 +105,10 @@ class InvokeAIAppConfig(BaseSettings):
         ram: Maximum memory amount used by memory model cache for rapid switching (GB).
         vram: Amount of VRAM reserved for model storage (GB).
         convert_cache: Maximum size of on-disk converted models cache (GB).
+        tensor_cache_memory: Maximum memory used by each of the RAM caches of intermediate tensors and conditioning, which avoid reloading them from disk (MB). The least recently used are evicted first. Those still referenced by an in-progress session are only evicted if the limit cannot be met otherwise.
+        tensor_write_behind: Write intermediate tensors and conditioning to disk in the background, so nodes don't wait for the disk. They are used from memory until written.
+        tensor_gc: Delete intermediate tensors and conditioning once the sessions using them finish, unless cached node outputs reference them. Otherwise, they are kept until shutdown, or indefinitely if `session_checkpoints` is enabled.
+        image_cache_memory: Maximum memory used to keep recently used images decoded in RAM, so they are not reloaded from disk (MB).
         lazy_offload: Keep models in VRAM until their space is needed.
         log_memory_usage: If True, a memory snapshot will be captured before and after every model cache operation, and the result will be logged (at debug level). There is a time cost to capturing the memory snapshots, so it is recommended to only enable this feature if you are actively inspecting the model cache's behaviour.
         device: Preferred execution device. `auto` will choose the device depending on the hardware platform and the installed torch capabilities.<br>Valid values: `auto`, `cpu`, `cuda`, `cuda:1`, `mps`
@@ -111,10 +118,18 @@ class InvokeAIAppConfig(BaseSettings):
         attention_slice_size: Slice size, valid when attention_type=="sliced".<br>Valid values: `auto`, `balanced`, `max`, `1`, `2`, `3`, `4`, `5`, `6`, `7`, `8`
         force_tiled_decode: Whether to enable tiled VAE decode (reduces memory consumption with some performance penalty).
         pil_compress_level: The compress_level setting of PIL.Image.save(), used for PNG encoding. All settings are lossless. 0 = no compression, 1 = fastest with slightly larger filesize, 9 = slowest with smallest filesize. 1 is typically the best setting.
+        image_write_workers: Number of threads encoding and writing images in the background, so nodes don't wait for PNG encoding. If 0, images are written before the node that saved them continues.
+        intermediate_image_memory: Maximum memory used to keep intermediate images in RAM instead of writing them to disk, until they are viewed. Once exceeded, the least recently used intermediate images are written to disk (MB). If 0, intermediate images are always written.
+        image_formats: Format to save images as, by image category (`general`, `mask`, `control`, `user` or `other`), or `intermediate` for all intermediate images. Images of unlisted categories are saved as `png`, compressed as set by `pil_compress_level`. `png_uncompressed` is fastest to save but largest. `webp_lossless` is smaller than `png` and slower to save, and does not embed the metadata and workflow in the file - they are only stored in the database. Images other than RGB or RGBA, e.g. masks, are saved as `png` instead of `webp_lossless`.
         max_queue_size: Maximum number of items in the session queue.
+        session_processor_workers: Number of session processor workers. Each worker dequeues and executes queue items independently. All workers execute nodes on the device selected by the `device` setting.
+        session_checkpoints: Persist the progress of each session after every completed node. Sessions interrupted by a crash or restart then resume from their last completed node, instead of being canceled. Intermediate tensors and conditioning are kept on disk, rather than in a temporary directory, so that resumed sessions can load them.
+        session_max_resumes: Maximum number of times a session is resumed after a crash or restart, when `session_checkpoints` is enabled. A session still in progress after that many resumes is failed instead, as it may be what crashes the app.
         allow_nodes: List of nodes to allow. Omit to allow all.
         deny_nodes: List of nodes to deny. Omit to deny none.
         node_cache_size: How many cached nodes to keep in memory.
+        node_cache_memory: Maximum memory used by cached node outputs (MB). The least recently used outputs are evicted when either this or `node_cache_size` is exceeded.
+        node_cache_persist: Store cached node outputs in the database, so they are reused after a restart. Outputs that reference intermediate tensors or conditioning are only stored when `session_checkpoints` is enabled, as those are otherwise deleted on shutdown.
         hashing_algorithm: Model hashing algorthim for model installs. 'blake3_multi' is best for SSDs. 'blake3_single' is best for spinning disk HDDs. 'random' disables hashing, instead assigning a UUID to models. Useful when using a memory db to reduce model installation time, or if you don't care about storing stable hashes for models. Alternatively, any other hashlib algorithm is accepted, though these are not nearly as performant as blake3.<br>Valid values: `blake3_multi`, `blake3_single`, `random`, `md5`, `sha1`, `sha224`, `sha256`, `sha384`, `sha512`, `blake2b`, `blake2s`, `sha3_224`, `sha3_256`, `sha3_384`, `sha3_512`, `shake_128`, `shake_256`
         remote_api_tokens: List of regular expression and token pairs used when downloading models from URLs. The download URL is tested against the regex, and if it matches, the token is provided in as a Bearer token.
         scan_models_on_startup: Scan the models directory on startup, registering orphaned models. This is typically only used in conjunction with `use_memory_db` for testing purposes.
@@ -139,6 +154,7 @@ class InvokeAIAppConfig(BaseSettings):
     allow_headers:            list[str] = Field(default=["*"],              description="Headers allowed for CORS.")
     ssl_certfile:        Optional[Path] = Field(default=None,               description="SSL certificate file for HTTPS. See https://www.uvicorn.org/settings/#https.")
     ssl_keyfile:         Optional[Path] = Field(default=None,               description="SSL key file for HTTPS. See https://www.uvicorn.org/settings/#https.")
+    progress_events_per_second:   float = Field(default=10, ge=0,           description="Maximum number of denoising progress events sent to each queue's clients per second. Only the latest progress of each queue item is sent, older progress is dropped. If 0, every progress event is sent.")
 
     # MISC FEATURES
     log_tokenization:              bool = Field(default=False,              description="Enable logging of parsed prompt tokens.")
@@ -170,6 +186,10 @@ class InvokeAIAppConfig(BaseSettings):
     ram:                          float = Field(default_factory=get_default_ram_cache_size, gt=0, description="Maximum memory amount used by memory model cache for rapid switching (GB).")
     vram:                         float = Field(default=DEFAULT_VRAM_CACHE, ge=0, description="Amount of VRAM reserved for model storage (GB).")
     convert_cache:                float = Field(default=DEFAULT_CONVERT_CACHE, ge=0, description="Maximum size of on-disk converted models cache (GB).")
+    tensor_cache_memory:          float = Field(default=512, ge=0,          description="Maximum memory used by each of the RAM caches of intermediate tensors and conditioning, which avoid reloading them from disk (MB). The least recently used are evicted first. Those still referenced by an in-progress session are only evicted if the limit cannot be met otherwise.")
+    tensor_write_behind:           bool = Field(default=True,               description="Write intermediate tensors and conditioning to disk in the background, so nodes don't wait for the disk. They are used from memory until written.")
+    tensor_gc:                     bool = Field(default=True,               description="Delete intermediate tensors and conditioning once the sessions using them finish, unless cached node outputs reference them. Otherwise, they are kept until shutdown, or indefinitely if `session_checkpoints` is enabled.")
+    image_cache_memory:           float = Field(default=256, ge=0,          description="Maximum memory used to keep recently used images decoded in RAM, so they are not reloaded from disk (MB).")
     lazy_offload:                  bool = Field(default=True,               description="Keep models in VRAM until their space is needed.")
     log_memory_usage:              bool = Field(default=False,              description="If True, a memory snapshot will be captured before and after every model cache operation, and the result will be logged (at debug level). There is a time cost to capturing the memory snapshots, so it is recommended to only enable this feature if you are actively inspecting the model cache's behaviour.")
 
@@ -183,12 +203,20 @@ class InvokeAIAppConfig(BaseSettings):
     attention_slice_size: ATTENTION_SLICE_SIZE = Field(default="auto",      description='Slice size, valid when attention_type=="sliced".')
     force_tiled_decode:            bool = Field(default=False,              description="Whether to enable tiled VAE decode (reduces memory consumption with some performance penalty).")
     pil_compress_level:             int = Field(default=1,                  description="The compress_level setting of PIL.Image.save(), used for PNG encoding. All settings are lossless. 0 = no compression, 1 = fastest with slightly larger filesize, 9 = slowest with smallest filesize. 1 is typically the best setting.")
+    image_write_workers:            int = Field(default=2, ge=0,            description="Number of threads encoding and writing images in the background, so nodes don't wait for PNG encoding. If 0, images are written before the node that saved them continues.")
+    intermediate_image_memory:    float = Field(default=512, ge=0,          description="Maximum memory used to keep intermediate images in RAM instead of writing them to disk, until they are viewed. Once exceeded, the least recently used intermediate images are written to disk (MB). If 0, intermediate images are always written.")
+    image_formats: dict[IMAGE_FORMAT_CATEGORY, IMAGE_FORMAT] = Field(default={}, description="Format to save images as, by image category (`general`, `mask`, `control`, `user` or `other`), or `intermediate` for all intermediate images. Images of unlisted categories are saved as `png`, compressed as set by `pil_compress_level`. `png_uncompressed` is fastest to save but largest. `webp_lossless` is smaller than `png` and slower to save, and does not embed the metadata and workflow in the file - they are only stored in the database. Images other than RGB or RGBA, e.g. masks, are saved as `png` instead of `webp_lossless`.")
     max_queue_size:                 int = Field(default=10000, gt=0,        description="Maximum number of items in the session queue.")
+    session_processor_workers:      int = Field(default=1, ge=1,            description="Number of session processor workers. Each worker dequeues and executes queue items independently. All workers execute nodes on the device selected by the `device` setting.")
+    session_checkpoints:           bool = Field(default=False,              description="Persist the progress of each session after every completed node. Sessions interrupted by a crash or restart then resume from their last completed node, instead of being canceled. Intermediate tensors and conditioning are kept on disk, rather than in a temporary directory, so that resumed sessions can load them.")
+    session_max_resumes:            int = Field(default=3, ge=0,            description="Maximum number of times a session is resumed after a crash or restart, when `session_checkpoints` is enabled. A session still in progress after that many resumes is failed instead, as it may be what crashes the app.")
 
     # NODES
     allow_nodes:    Optional[list[str]] = Field(default=None,               description="List of nodes to allow. Omit to allow all.")
     deny_nodes:     Optional[list[str]] = Field(default=None,               description="List of nodes to deny. Omit to deny none.")
     node_cache_size:                int = Field(default=512,                description="How many cached nodes to keep in memory.")
+    node_cache_memory:            float = Field(default=64, ge=0,           description="Maximum memory used by cached node outputs (MB). The least recently used outputs are evicted when either this or `node_cache_size` is exceeded.")
+    node_cache_persist:            bool = Field(default=False,              description="Store cached node outputs in the database, so they are reused after a restart. Outputs that reference intermediate tensors or conditioning are only stored when `session_checkpoints` is enabled, as those are otherwise deleted on shutdown.")
 
     # MODEL INSTALL
     hashing_algorithm: HASHING_ALGORITHMS = Field(default="blake3_single",  description="Model hashing algorthim for model installs. 'blake3_multi' is best for SSDs. 'blake3_single' is best for spinning disk HDDs. 'random' disables hashing, instead assigning a UUID to models. Useful when using a memory db to reduce model installation time, or if you don't care about storing stable hashes for models. Alternatively, any other hashlib algorithm is accepted, though these are not nearly as performant as blake3.")
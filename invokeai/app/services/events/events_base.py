@@ -3,11 +3,13 @@
 
 from typing import Any, Dict, List, Optional, Union
 
-from invokeai.app.services.session_processor.session_processor_common import ProgressImage
+from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
+from invokeai.app.services.events.events_common import EventDispatchStatus
+from invokeai.app.services.session_processor.session_processor_common import ProgressPreview
 from invokeai.app.services.session_queue.session_queue_common import (
     BatchStatus,
     EnqueueBatchResult,
-    SessionQueueItem,
+    SessionQueueItemWithoutGraph,
     SessionQueueStatus,
 )
 from invokeai.app.util.misc import get_timestamp
@@ -26,6 +28,18 @@ class EventServiceBase:
     def dispatch(self, event_name: str, payload: Any) -> None:
         pass
 
+    def wants_progress_images(self, queue_id: str) -> bool:
+        """Whether any subscriber of a queue's events wants progress images. If not, they need not be generated."""
+        return True
+
+    def set_progress_image_subscribers(self, queue_id: str, count: int) -> None:
+        """Sets the number of subscribers wanting progress images of a queue."""
+        pass
+
+    def get_dispatch_status(self) -> Optional[EventDispatchStatus]:
+        """Gets the status of event dispatching, if events are dispatched from a queue."""
+        return None
+
     def _emit_bulk_download_event(self, event_name: str, payload: dict) -> None:
         """Bulk download events are emitted to a room with queue_id as the room name"""
         payload["timestamp"] = get_timestamp()
@@ -66,12 +80,12 @@ class EventServiceBase:
         graph_execution_state_id: str,
         node_id: str,
         source_node_id: str,
-        progress_image: Optional[ProgressImage],
+        progress_image: Optional[ProgressPreview],
         step: int,
         order: int,
         total_steps: int,
     ) -> None:
-        """Emitted when there is generation progress"""
+        """Emitted when there is generation progress. The progress image is encoded as requested by each subscriber."""
         self.__emit_queue_event(
             event_name="generator_progress",
             payload={
@@ -81,7 +95,7 @@ class EventServiceBase:
                 "graph_execution_state_id": graph_execution_state_id,
                 "node_id": node_id,
                 "source_node_id": source_node_id,
-                "progress_image": progress_image.model_dump(mode="json") if progress_image is not None else None,
+                "progress_image": progress_image,
                 "step": step,
                 "order": order,
                 "total_steps": total_steps,
@@ -94,11 +108,12 @@ class EventServiceBase:
         queue_item_id: int,
         queue_batch_id: str,
         graph_execution_state_id: str,
-        result: dict,
-        node: dict,
+        result: BaseInvocationOutput,
+        node: BaseInvocation,
         source_node_id: str,
     ) -> None:
-        """Emitted when an invocation has completed"""
+        """Emitted when an invocation has completed. The node and result are serialized here, as they may change
+        once the session moves on."""
         self.__emit_queue_event(
             event_name="invocation_complete",
             payload={
@@ -106,9 +121,9 @@ class EventServiceBase:
                 "queue_item_id": queue_item_id,
                 "queue_batch_id": queue_batch_id,
                 "graph_execution_state_id": graph_execution_state_id,
-                "node": node,
+                "node": node.model_dump(mode="json"),
                 "source_node_id": source_node_id,
-                "result": result,
+                "result": result.model_dump(mode="json"),
             },
         )
 
@@ -118,12 +133,13 @@ class EventServiceBase:
         queue_item_id: int,
         queue_batch_id: str,
         graph_execution_state_id: str,
-        node: dict,
+        node: BaseInvocation,
         source_node_id: str,
         error_type: str,
         error: str,
     ) -> None:
-        """Emitted when an invocation has completed"""
+        """Emitted when an invocation has completed. The node is serialized here, as it may change once the session
+        moves on."""
         self.__emit_queue_event(
             event_name="invocation_error",
             payload={
@@ -131,7 +147,7 @@ class EventServiceBase:
                 "queue_item_id": queue_item_id,
                 "queue_batch_id": queue_batch_id,
                 "graph_execution_state_id": graph_execution_state_id,
-                "node": node,
+                "node": node.model_dump(mode="json"),
                 "source_node_id": source_node_id,
                 "error_type": error_type,
                 "error": error,
@@ -144,10 +160,10 @@ class EventServiceBase:
         queue_item_id: int,
         queue_batch_id: str,
         graph_execution_state_id: str,
-        node: dict,
+        node: BaseInvocation,
         source_node_id: str,
     ) -> None:
-        """Emitted when an invocation has started"""
+        """Emitted when an invocation has started. The node is serialized here, as it may change while it runs."""
         self.__emit_queue_event(
             event_name="invocation_started",
             payload={
@@ -155,7 +171,7 @@ class EventServiceBase:
                 "queue_item_id": queue_item_id,
                 "queue_batch_id": queue_batch_id,
                 "graph_execution_state_id": graph_execution_state_id,
-                "node": node,
+                "node": node.model_dump(mode="json"),
                 "source_node_id": source_node_id,
             },
         )
@@ -238,7 +254,7 @@ class EventServiceBase:
 
     def emit_queue_item_status_changed(
         self,
-        session_queue_item: SessionQueueItem,
+        session_queue_item: SessionQueueItemWithoutGraph,
         batch_status: BatchStatus,
         queue_status: SessionQueueStatus,
     ) -> None:
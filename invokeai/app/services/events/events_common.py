@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+
+
+class EventDispatchStatus(BaseModel):
+    queue_depth: int = Field(description="The number of events waiting to be dispatched")
+    dispatched: int = Field(description="The number of events dispatched")
+    batches: int = Field(description="The number of batches the events were dispatched in")
+    latency_seconds_total: float = Field(
+        description="The total time events waited between being emitted and dispatched, in seconds"
+    )
+    max_latency_seconds: float = Field(
+        description="The longest time an event waited between being emitted and dispatched, in seconds"
+    )
@@ -5,6 +5,7 @@ from typing import Optional
 from PIL.Image import Image as PILImageType
 
 from invokeai.app.invocations.fields import MetadataField
+from invokeai.app.services.image_files.image_files_common import ImageFileCacheStatus
 from invokeai.app.services.workflow_records.workflow_records_common import WorkflowWithoutID
 
 
@@ -36,8 +37,23 @@ class ImageFileStorageBase(ABC):
         metadata: Optional[MetadataField] = None,
         workflow: Optional[WorkflowWithoutID] = None,
         thumbnail_size: int = 256,
+        image_format: str = "png",
+        deferred: bool = False,
     ) -> None:
-        """Saves an image and a 256x256 WEBP thumbnail. Returns a tuple of the image name, thumbnail name, and created timestamp."""
+        """Saves an image and a 256x256 WEBP thumbnail. Returns a tuple of the image name, thumbnail name, and created timestamp.
+
+        Deferred images may be kept in memory, and only written once their path is requested."""
+        pass
+
+    @abstractmethod
+    def get_extension(self, image: PILImageType, image_format: str) -> str:
+        """Gets the file extension of an image saved in the given format, e.g. `.png`. Images the format does not
+        support are saved in a fallback format, with its extension."""
+        pass
+
+    @abstractmethod
+    def get_media_type(self, image_name: str) -> str:
+        """Gets the media type of an image file, e.g. `image/png`."""
         pass
 
     @abstractmethod
@@ -49,3 +65,18 @@ class ImageFileStorageBase(ABC):
     def get_workflow(self, image_name: str) -> Optional[WorkflowWithoutID]:
         """Gets the workflow of an image."""
         pass
+
+    @abstractmethod
+    def is_deferred(self, image_name: str) -> bool:
+        """Whether an image is deferred, i.e. kept in memory and not written until its path is requested."""
+        pass
+
+    @abstractmethod
+    def flush(self) -> None:
+        """Writes the deferred images, and waits until all saved images are written."""
+        pass
+
+    @abstractmethod
+    def get_cache_status(self) -> ImageFileCacheStatus:
+        """Gets the status of the in-memory cache of images."""
+        pass
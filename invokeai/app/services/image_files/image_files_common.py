@@ -1,20 +1,34 @@
+from pydantic import BaseModel, Field
+
+
 # TODO: Should these excpetions subclass existing python exceptions?
 class ImageFileNotFoundException(Exception):
     """Raised when an image file is not found in storage."""
 
-    def __init__(self, message="Image file not found"):
+    def __init__(self, message: str = "Image file not found") -> None:
         super().__init__(message)
 
 
 class ImageFileSaveException(Exception):
     """Raised when an image cannot be saved."""
 
-    def __init__(self, message="Image file not saved"):
+    def __init__(self, message: str = "Image file not saved") -> None:
         super().__init__(message)
 
 
 class ImageFileDeleteException(Exception):
     """Raised when an image cannot be deleted."""
 
-    def __init__(self, message="Image file not deleted"):
+    def __init__(self, message: str = "Image file not deleted") -> None:
         super().__init__(message)
+
+
+class ImageFileCacheStatus(BaseModel):
+    size: int = Field(description="The number of cached images")
+    size_bytes: int = Field(description="The approximate memory used by the cached images, in bytes")
+    max_size_bytes: int = Field(description="The maximum memory used by the cached images, in bytes")
+    hits: int = Field(description="The number of cache hits")
+    misses: int = Field(description="The number of cache misses")
+    evictions: int = Field(description="The number of images evicted from the cache")
+    deferred: int = Field(description="The number of deferred images, kept in memory until they are requested")
+    deferred_bytes: int = Field(description="The approximate memory used by the deferred images, in bytes")
@@ -1,9 +1,11 @@
 # Copyright (c) 2022 Kyle Schouviller (https://github.com/kyle0654) and the InvokeAI Team
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from queue import Queue
-from typing import Dict, Optional, Union
+from threading import Lock
+from typing import Optional, Union
 
-from PIL import Image, PngImagePlugin
+from PIL import Image, ImageMode
 from PIL.Image import Image as PILImageType
 from send2trash import send2trash
 
@@ -13,22 +15,94 @@ from invokeai.app.services.workflow_records.workflow_records_common import Workf
 from invokeai.app.util.thumbnails import get_thumbnail_name, make_thumbnail
 
 from .image_files_base import ImageFileStorageBase
-from .image_files_common import ImageFileDeleteException, ImageFileNotFoundException, ImageFileSaveException
+from .image_files_common import (
+    ImageFileCacheStatus,
+    ImageFileDeleteException,
+    ImageFileNotFoundException,
+    ImageFileSaveException,
+)
+from .image_files_encoders import ImageEncoder, get_default_image_encoders
 
 
 class DiskImageFileStorage(ImageFileStorageBase):
-    """Stores images on disk"""
+    """Stores images on disk.
+
+    Each image is encoded by the encoder of the format it is saved as. Recently used images are kept fully loaded in a thread-safe, least-recently-used cache, limited by the memory used
+    by their decoded pixels.
+
+    Images may be encoded and written in background threads, so saving an image returns before it is written. Until
+    then, `get` returns the image from memory, and `get_path` waits for the image or thumbnail to be written. Thumbnails
+    of images saved in quick succession are written in a single batch.
+
+    Deferred images, e.g. intermediate images passed between nodes, are kept in memory and only written when their path
+    is first requested, or when the memory they use exceeds its limit, starting with the least recently used image.
+    Deferred images that were never written are written when the storage is stopped.
+
+    :param output_folder: The folder where images and their thumbnails are stored
+    :param max_cache_bytes: The maximum memory used by cached images, in bytes. If 0, images are not cached.
+    :param write_workers: The number of threads writing images in the background. If 0, images are written before
+        `save` returns.
+    :param max_deferred_bytes: The maximum memory used by deferred images, in bytes. If 0, deferred images are written
+        like any other image.
+    :param encoders: The image encoders, by image format. If None, the built-in encoders are used, with the PNG
+        compression level set by the `pil_compress_level` setting.
+    """
 
     __output_folder: Path
-    __cache_ids: Queue  # TODO: this is an incredibly naive cache
-    __cache: Dict[Path, PILImageType]
-    __max_cache_size: int
+    __cache: OrderedDict[str, PILImageType]
+    __cache_sizes: dict[str, int]
+    __cache_bytes: int
+    __max_cache_bytes: int
+    __hits: int
+    __misses: int
+    __evictions: int
+    __lock: Lock
+    __executor: Optional[ThreadPoolExecutor]
+    __pending_images: dict[str, PILImageType]
+    __image_writes: dict[str, Future[None]]
+    __thumbnail_jobs: list[tuple[str, PILImageType, int]]
+    __thumbnail_batch: Optional[Future[None]]
+    __thumbnail_writes: dict[str, Future[None]]
+    __deferred_images: OrderedDict[str, tuple[PILImageType, ImageEncoder, int]]
+    __deferred_bytes: int
+    __max_deferred_bytes: int
+    __encoders: Optional[dict[str, ImageEncoder]]
     __invoker: Invoker
 
-    def __init__(self, output_folder: Union[str, Path]):
-        self.__cache = {}
-        self.__cache_ids = Queue()
-        self.__max_cache_size = 10  # TODO: get this from config
+    def __init__(
+        self,
+        output_folder: Union[str, Path],
+        max_cache_bytes: int = 256 * 2**20,
+        write_workers: int = 0,
+        max_deferred_bytes: int = 0,
+        encoders: Optional[dict[str, ImageEncoder]] = None,
+    ) -> None:
+        self.__encoders = encoders
+        self.__cache = OrderedDict()
+        self.__cache_sizes = {}
+        self.__cache_bytes = 0
+        self.__max_cache_bytes = max_cache_bytes
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__lock = Lock()
+
+        self.__executor = (
+            ThreadPoolExecutor(max_workers=write_workers, thread_name_prefix="image_files_write")
+            if write_workers > 0
+            else None
+        )
+        # The images not yet written and their writes, by image name
+        self.__pending_images = {}
+        self.__image_writes = {}
+        # The thumbnails not yet written, and the batch that will write them if it has not started yet
+        self.__thumbnail_jobs = []
+        self.__thumbnail_batch = None
+        self.__thumbnail_writes = {}
+        # The images not written until requested, with their encoder and thumbnail size, least recently used first
+        self.__deferred_images = OrderedDict()
+        self.__deferred_bytes = 0
+        self.__max_deferred_bytes = max_deferred_bytes
 
         self.__output_folder: Path = output_folder if isinstance(output_folder, Path) else Path(output_folder)
         self.__thumbnails_folder = self.__output_folder / "thumbnails"
@@ -37,17 +111,51 @@ class DiskImageFileStorage(ImageFileStorageBase):
 
     def start(self, invoker: Invoker) -> None:
         self.__invoker = invoker
+        if self.__encoders is None:
+            self.__encoders = get_default_image_encoders(invoker.services.configuration.pil_compress_level)
 
-    def get(self, image_name: str) -> PILImageType:
+    def stop(self, invoker: Invoker) -> None:
+        # The deferred images have records, so their files must exist
         try:
-            image_path = self.get_path(image_name)
+            self.flush()
+        except ImageFileSaveException as e:
+            # There is no caller to report the failure to, and the other services must still be stopped
+            self.__invoker.services.logger.error(str(e))
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+
+    def flush(self) -> None:
+        with self.__lock:
+            deferred_names = list(self.__deferred_images)
+        self.__write_deferred(deferred_names)
+        with self.__lock:
+            writes = [*self.__image_writes.values(), *self.__thumbnail_writes.values()]
+        wait(writes)
+
+    def is_deferred(self, image_name: str) -> bool:
+        with self.__lock:
+            return image_name in self.__deferred_images
 
-            cache_item = self.__get_cache(image_path)
+    def get(self, image_name: str) -> PILImageType:
+        try:
+            cache_item = self.__get_cache(image_name)
             if cache_item:
                 return cache_item
 
-            image = Image.open(image_path)
-            self.__set_cache(image_path, image)
+            with self.__lock:
+                # The image may have been evicted from the cache before it was written
+                pending_image = self.__pending_images.get(image_name)
+                if image_name in self.__deferred_images:
+                    self.__deferred_images.move_to_end(image_name)
+                    pending_image = self.__deferred_images[image_name][0]
+            if pending_image is not None:
+                # The pending image is written later, so it must not be affected by changes the caller makes
+                return pending_image.copy()
+
+            image = Image.open(self.get_path(image_name))
+            # Decode the image now, which also closes its file, rather than holding the file open until first use
+            image.load()
+            self.__set_cache(image_name, image)
             return image
         except FileNotFoundError as e:
             raise ImageFileNotFoundException from e
@@ -59,63 +167,96 @@ class DiskImageFileStorage(ImageFileStorageBase):
         metadata: Optional[MetadataField] = None,
         workflow: Optional[WorkflowWithoutID] = None,
         thumbnail_size: int = 256,
+        image_format: str = "png",
+        deferred: bool = False,
     ) -> None:
         try:
             self.__validate_storage_folders()
-            image_path = self.get_path(image_name)
+            encoder = self.__get_encoder(image_format).for_image(image)
 
-            pnginfo = PngImagePlugin.PngInfo()
-            info_dict = {}
+            info_dict: dict[str, str] = {}
 
             if metadata is not None:
-                metadata_json = metadata.model_dump_json()
-                info_dict["invokeai_metadata"] = metadata_json
-                pnginfo.add_text("invokeai_metadata", metadata_json)
+                info_dict["invokeai_metadata"] = metadata.model_dump_json()
             if workflow is not None:
-                workflow_json = workflow.model_dump_json()
-                info_dict["invokeai_workflow"] = workflow_json
-                pnginfo.add_text("invokeai_workflow", workflow_json)
-
-            # When saving the image, the image object's info field is not populated. We need to set it
-            image.info = info_dict
-            image.save(
-                image_path,
-                "PNG",
-                pnginfo=pnginfo,
-                compress_level=self.__invoker.services.configuration.pil_compress_level,
-            )
+                info_dict["invokeai_workflow"] = workflow.model_dump_json()
 
-            thumbnail_name = get_thumbnail_name(image_name)
-            thumbnail_path = self.get_path(thumbnail_name, thumbnail=True)
-            thumbnail_image = make_thumbnail(image, thumbnail_size)
-            thumbnail_image.save(thumbnail_path)
+            # Images larger than the memory limit of deferred images are written like any other image
+            if deferred and get_decoded_size(image) <= self.__max_deferred_bytes:
+                # The image is written later, so it must not be affected by changes the caller makes in the meantime
+                image = image.copy()
+                set_text_info(image, info_dict)
+                with self.__lock:
+                    self.__deferred_images[image_name] = (image, encoder, thumbnail_size)
+                    self.__deferred_bytes += get_decoded_size(image)
+                    # Deferred images are returned from memory, so they are not cached too
+                    self.__remove_cache(image_name)
+                    spilled_names: list[str] = []
+                    deferred_bytes = self.__deferred_bytes
+                    for name, (deferred_image, _, _) in self.__deferred_images.items():
+                        if deferred_bytes <= self.__max_deferred_bytes:
+                            break
+                        spilled_names.append(name)
+                        deferred_bytes -= get_decoded_size(deferred_image)
+                self.__write_deferred(spilled_names)
+                return
 
-            self.__set_cache(image_path, image)
-            self.__set_cache(thumbnail_path, thumbnail_image)
+            if self.__executor is None:
+                # When saving the image, the image object's info field is not populated. We need to set it
+                set_text_info(image, info_dict)
+                self.__write_image(image_name, image, encoder)
+                self.__write_thumbnail(image_name, image, thumbnail_size)
+            else:
+                # The image is written later, so it must not be affected by changes the caller makes in the meantime
+                image = image.copy()
+                set_text_info(image, info_dict)
+                with self.__lock:
+                    self.__queue_write(image_name, image, encoder, thumbnail_size)
+
+            self.__set_cache(image_name, image)
         except Exception as e:
             raise ImageFileSaveException from e
 
     def delete(self, image_name: str) -> None:
         try:
-            image_path = self.get_path(image_name)
+            with self.__lock:
+                self.__remove_cache(image_name)
+                # Pending writes that have not started are skipped, the others are waited for
+                self.__pending_images.pop(image_name, None)
+                deferred = self.__deferred_images.pop(image_name, None)
+                if deferred is not None:
+                    self.__deferred_bytes -= get_decoded_size(deferred[0])
+                self.__thumbnail_jobs = [job for job in self.__thumbnail_jobs if job[0] != image_name]
+                writes = [
+                    w
+                    for w in (self.__image_writes.pop(image_name, None), self.__thumbnail_writes.pop(image_name, None))
+                    if w is not None
+                ]
+            wait(writes)
+
+            image_path = self.__get_path(image_name)
 
             if image_path.exists():
                 send2trash(image_path)
-            if image_path in self.__cache:
-                del self.__cache[image_path]
 
-            thumbnail_name = get_thumbnail_name(image_name)
-            thumbnail_path = self.get_path(thumbnail_name, True)
+            thumbnail_path = self.__get_path(image_name, True)
 
             if thumbnail_path.exists():
                 send2trash(thumbnail_path)
-            if thumbnail_path in self.__cache:
-                del self.__cache[thumbnail_path]
         except Exception as e:
             raise ImageFileDeleteException from e
 
     # TODO: make this a bit more flexible for e.g. cloud storage
     def get_path(self, image_name: str, thumbnail: bool = False) -> Path:
+        # The image or thumbnail must be written before its path is used
+        self.__write_deferred([image_name])
+        with self.__lock:
+            write = (self.__thumbnail_writes if thumbnail else self.__image_writes).get(image_name)
+        if write is not None:
+            wait([write])
+        return self.__get_path(image_name, thumbnail)
+
+    def __get_path(self, image_name: str, thumbnail: bool = False) -> Path:
         path = self.__output_folder / image_name
 
         if thumbnail:
@@ -124,6 +265,113 @@ class DiskImageFileStorage(ImageFileStorageBase):
 
         return path
 
+    def get_extension(self, image: PILImageType, image_format: str) -> str:
+        return self.__get_encoder(image_format).for_image(image).extension
+
+    def get_media_type(self, image_name: str) -> str:
+        assert self.__encoders is not None, "The image file storage must be started before getting media types"
+        suffix = Path(image_name).suffix
+        for encoder in self.__encoders.values():
+            if encoder.extension == suffix:
+                return encoder.media_type
+        # Images saved before formats were configurable are PNG
+        return "image/png"
+
+    def __get_encoder(self, image_format: str) -> ImageEncoder:
+        assert self.__encoders is not None, "The image file storage must be started before encoding images"
+        if image_format not in self.__encoders:
+            raise ValueError(f"Unknown image format: {image_format}")
+        return self.__encoders[image_format]
+
+    def __write_image(self, image_name: str, image: PILImageType, encoder: ImageEncoder) -> None:
+        # The image's info holds its metadata and workflow
+        encoder.save(image, self.__get_path(image_name), get_text_info(image))
+
+    def __write_thumbnail(self, image_name: str, image: PILImageType, thumbnail_size: int) -> None:
+        thumbnail_image = make_thumbnail(image, thumbnail_size)
+        thumbnail_image.save(self.__get_path(image_name, thumbnail=True))
+
+    def __queue_write(self, image_name: str, image: PILImageType, encoder: ImageEncoder, thumbnail_size: int) -> None:
+        """Queues writing an image and its thumbnail in the background. The lock must be held, so the writes cannot
+        finish before they are recorded."""
+        assert self.__executor is not None
+        self.__pending_images[image_name] = image
+        self.__image_writes[image_name] = self.__executor.submit(self.__write_pending_image, image_name, encoder)
+        self.__thumbnail_jobs.append((image_name, image, thumbnail_size))
+        if self.__thumbnail_batch is None:
+            self.__thumbnail_batch = self.__executor.submit(self.__write_thumbnail_batch)
+        self.__thumbnail_writes[image_name] = self.__thumbnail_batch
+
+    def __write_deferred(self, image_names: list[str]) -> None:
+        """Writes deferred images, in the background if there are write threads. Without write threads, the images are
+        written before returning, and ImageFileSaveException is raised if any of them cannot be written."""
+        with self.__lock:
+            deferred = [
+                (image_name, *self.__deferred_images.pop(image_name))
+                for image_name in image_names
+                if image_name in self.__deferred_images
+            ]
+            for _, image, _, _ in deferred:
+                self.__deferred_bytes -= get_decoded_size(image)
+            if self.__executor is not None:
+                for image_name, image, encoder, thumbnail_size in deferred:
+                    self.__queue_write(image_name, image, encoder, thumbnail_size)
+                return
+            # The images are written below. Until then, readers of their paths wait for these writes.
+            writes: dict[str, Future[None]] = {}
+            for image_name, image, _, _ in deferred:
+                writes[image_name] = Future()
+                self.__pending_images[image_name] = image
+                self.__image_writes[image_name] = writes[image_name]
+                self.__thumbnail_writes[image_name] = writes[image_name]
+        failed_names: list[str] = []
+        for image_name, image, encoder, thumbnail_size in deferred:
+            try:
+                self.__write_image(image_name, image, encoder)
+            except Exception as e:
+                self.__invoker.services.logger.error(f"Failed to write image {image_name}: {e}")
+                failed_names.append(image_name)
+            try:
+                self.__write_thumbnail(image_name, image, thumbnail_size)
+            except Exception as e:
+                self.__invoker.services.logger.error(f"Failed to write thumbnail of image {image_name}: {e}")
+            finally:
+                with self.__lock:
+                    self.__pending_images.pop(image_name, None)
+                    self.__image_writes.pop(image_name, None)
+                    self.__thumbnail_writes.pop(image_name, None)
+                writes[image_name].set_result(None)
+        if failed_names:
+            raise ImageFileSaveException(f"Failed to write images: {', '.join(failed_names)}")
+
+    def __write_pending_image(self, image_name: str, encoder: ImageEncoder) -> None:
+        with self.__lock:
+            image = self.__pending_images.get(image_name)
+        try:
+            if image is not None:
+                self.__write_image(image_name, image, encoder)
+        except Exception as e:
+            self.__invoker.services.logger.error(f"Failed to write image {image_name}: {e}")
+        finally:
+            with self.__lock:
+                self.__pending_images.pop(image_name, None)
+                self.__image_writes.pop(image_name, None)
+
+    def __write_thumbnail_batch(self) -> None:
+        with self.__lock:
+            # Thumbnails queued from now on are written by the next batch
+            jobs = self.__thumbnail_jobs
+            self.__thumbnail_jobs = []
+            self.__thumbnail_batch = None
+        for image_name, image, thumbnail_size in jobs:
+            try:
+                self.__write_thumbnail(image_name, image, thumbnail_size)
+            except Exception as e:
+                self.__invoker.services.logger.error(f"Failed to write thumbnail of image {image_name}: {e}")
+        with self.__lock:
+            for image_name, _, _ in jobs:
+                self.__thumbnail_writes.pop(image_name, None)
+
     def validate_path(self, path: Union[str, Path]) -> bool:
         """Validates the path given for an image or thumbnail."""
         path = path if isinstance(path, Path) else Path(path)
@@ -142,14 +390,62 @@ class DiskImageFileStorage(ImageFileStorageBase):
         for folder in folders:
             folder.mkdir(parents=True, exist_ok=True)
 
-    def __get_cache(self, image_name: Path) -> Optional[PILImageType]:
-        return None if image_name not in self.__cache else self.__cache[image_name]
+    def get_cache_status(self) -> ImageFileCacheStatus:
+        with self.__lock:
+            return ImageFileCacheStatus(
+                size=len(self.__cache),
+                size_bytes=self.__cache_bytes,
+                max_size_bytes=self.__max_cache_bytes,
+                hits=self.__hits,
+                misses=self.__misses,
+                evictions=self.__evictions,
+                deferred=len(self.__deferred_images),
+                deferred_bytes=self.__deferred_bytes,
+            )
+
+    def __get_cache(self, image_name: str) -> Optional[PILImageType]:
+        with self.__lock:
+            image = self.__cache.get(image_name)
+            if image is None:
+                self.__misses += 1
+                return None
+            self.__hits += 1
+            self.__cache.move_to_end(image_name)
+            return image
 
-    def __set_cache(self, image_name: Path, image: PILImageType):
-        if image_name not in self.__cache:
+    def __set_cache(self, image_name: str, image: PILImageType) -> None:
+        size = get_decoded_size(image)
+        with self.__lock:
+            self.__remove_cache(image_name)
+            if size > self.__max_cache_bytes:
+                # The image would evict everything else and still not fit
+                return
             self.__cache[image_name] = image
-            self.__cache_ids.put(image_name)  # TODO: this should refresh position for LRU cache
-            if len(self.__cache) > self.__max_cache_size:
-                cache_id = self.__cache_ids.get()
-                if cache_id in self.__cache:
-                    del self.__cache[cache_id]
+            self.__cache_sizes[image_name] = size
+            self.__cache_bytes += size
+            while self.__cache_bytes > self.__max_cache_bytes:
+                self.__remove_cache(next(iter(self.__cache)))
+                self.__evictions += 1
+
+    def __remove_cache(self, image_name: str) -> None:
+        if self.__cache.pop(image_name, None) is not None:
+            self.__cache_bytes -= self.__cache_sizes.pop(image_name)
+
+
+def set_text_info(image: PILImageType, info: dict[str, str]) -> None:
+    """Replaces the info of an image with the given text chunks, which are written when the image is saved."""
+    image.info = {}
+    for key, value in info.items():
+        image.info[key] = value
+
+
+def get_text_info(image: PILImageType) -> dict[str, str]:
+    """Gets the text chunks in the info of an image."""
+    return {key: value for key, value in image.info.items() if isinstance(key, str) and isinstance(value, str)}
+
+
+def get_decoded_size(image: PILImageType) -> int:
+    """Gets the approximate memory used by an image's decoded pixels, in bytes."""
+    mode = ImageMode.getmode(image.mode)
+    # The type string ends with the size of each band's values, e.g. "|u1" or "<f4"
+    return image.width * image.height * len(mode.bands) * int(mode.typestr[-1])
@@ -0,0 +1,85 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+from PIL import PngImagePlugin
+from PIL.Image import Image as PILImageType
+
+
+class ImageEncoder(ABC):
+    """Encodes images to files of a given format."""
+
+    extension: str
+    """The extension of the encoded files, e.g. `.png`"""
+    media_type: str
+    """The media type of the encoded files, e.g. `image/png`"""
+
+    def for_image(self, image: PILImageType) -> "ImageEncoder":
+        """Gets the encoder to encode an image with: this one, or a fallback if the format does not support the image."""
+        return self
+
+    @abstractmethod
+    def save(self, image: PILImageType, path: Path, info: dict[str, str]) -> None:
+        """Encodes the image to a file. The image must be supported, as checked by `for_image`.
+
+        :param image: The image to encode
+        :param path: The path of the file
+        :param info: Text to embed in the file, e.g. the image's metadata and workflow, if the format supports it
+        """
+        pass
+
+
+class PngImageEncoder(ImageEncoder):
+    """Encodes images as PNG, embedding their text info as text chunks.
+
+    :param compress_level: The zlib compression level, from 0 (uncompressed, fastest) to 9 (smallest)
+    """
+
+    extension = ".png"
+    media_type = "image/png"
+
+    def __init__(self, compress_level: int = 1) -> None:
+        self._compress_level = compress_level
+
+    def save(self, image: PILImageType, path: Path, info: dict[str, str]) -> None:
+        pnginfo = PngImagePlugin.PngInfo()
+        for key, value in info.items():
+            pnginfo.add_text(key, value)
+        image.save(path, "PNG", pnginfo=pnginfo, compress_level=self._compress_level)
+
+
+class WebPLosslessImageEncoder(ImageEncoder):
+    """Encodes images as lossless WebP. Text info is not embedded, so it is only available from the image's record.
+
+    WebP only supports RGB and RGBA images. Images of other modes, e.g. masks, are encoded by the fallback encoder, so
+    that they are not converted.
+
+    :param method: The encoding effort, from 0 (fastest) to 6 (smallest)
+    :param fallback: The encoder of images WebP does not support. If None, they are encoded as PNG.
+    """
+
+    extension = ".webp"
+    media_type = "image/webp"
+
+    def __init__(self, method: int = 4, fallback: Optional[ImageEncoder] = None) -> None:
+        self._method = method
+        self._fallback = fallback or PngImageEncoder()
+
+    def for_image(self, image: PILImageType) -> ImageEncoder:
+        return self if image.mode in ("RGB", "RGBA") else self._fallback.for_image(image)
+
+    def save(self, image: PILImageType, path: Path, info: dict[str, str]) -> None:
+        image.save(path, "WEBP", lossless=True, method=self._method)
+
+
+def get_default_image_encoders(compress_level: int) -> dict[str, ImageEncoder]:
+    """Gets the built-in image encoders, by image format.
+
+    :param compress_level: The compression level of PNG images, except those of the `png_uncompressed` format
+    """
+    png_encoder = PngImageEncoder(compress_level=compress_level)
+    return {
+        "png": png_encoder,
+        "png_uncompressed": PngImageEncoder(compress_level=0),
+        "webp_lossless": WebPLosslessImageEncoder(fallback=png_encoder),
+    }
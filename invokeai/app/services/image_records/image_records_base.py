@@ -4,6 +4,7 @@ from typing import Optional
 
 from invokeai.app.invocations.fields import MetadataField
 from invokeai.app.services.shared.pagination import OffsetPaginatedResults
+from invokeai.app.services.workflow_records.workflow_records_common import WorkflowWithoutID
 
 from .image_records_common import ImageCategory, ImageRecord, ImageRecordChanges, ResourceOrigin
 
@@ -23,6 +24,11 @@ class ImageRecordStorageBase(ABC):
         """Gets an image's metadata'."""
         pass
 
+    @abstractmethod
+    def get_workflow(self, image_name: str) -> Optional[WorkflowWithoutID]:
+        """Gets an image's workflow, if it is stored in the image's record."""
+        pass
+
     @abstractmethod
     def update(
         self,
@@ -81,6 +87,7 @@ class ImageRecordStorageBase(ABC):
         session_id: Optional[str] = None,
         node_id: Optional[str] = None,
         metadata: Optional[MetadataField] = None,
+        workflow: Optional[WorkflowWithoutID] = None,
     ) -> datetime:
         """Saves an image record."""
         pass
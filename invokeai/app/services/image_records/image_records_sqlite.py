@@ -6,6 +6,7 @@ from typing import Optional, Union, cast
 from invokeai.app.invocations.fields import MetadataField, MetadataFieldValidator
 from invokeai.app.services.shared.pagination import OffsetPaginatedResults
 from invokeai.app.services.shared.sqlite.sqlite_database import SqliteDatabase
+from invokeai.app.services.workflow_records.workflow_records_common import WorkflowWithoutID
 
 from .image_records_base import ImageRecordStorageBase
 from .image_records_common import (
@@ -82,6 +83,31 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         finally:
             self._lock.release()
 
+    def get_workflow(self, image_name: str) -> Optional[WorkflowWithoutID]:
+        try:
+            self._lock.acquire()
+
+            self._cursor.execute(
+                """--sql
+                SELECT workflow FROM images
+                WHERE image_name = ?;
+                """,
+                (image_name,),
+            )
+
+            result = cast(Optional[sqlite3.Row], self._cursor.fetchone())
+
+            if not result:
+                raise ImageRecordNotFoundException
+
+            workflow_raw = cast(Optional[str], dict(result).get("workflow", None))
+            return WorkflowWithoutID.model_validate_json(workflow_raw) if workflow_raw is not None else None
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            raise ImageRecordNotFoundException from e
+        finally:
+            self._lock.release()
+
     def update(
         self,
         image_name: str,
@@ -329,9 +355,11 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         session_id: Optional[str] = None,
         node_id: Optional[str] = None,
         metadata: Optional[MetadataField] = None,
+        workflow: Optional[WorkflowWithoutID] = None,
     ) -> datetime:
         try:
             metadata_json = metadata.model_dump_json() if metadata is not None else None
+            workflow_json = workflow.model_dump_json() if workflow is not None else None
             self._lock.acquire()
             self._cursor.execute(
                 """--sql
@@ -346,9 +374,10 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
                     metadata,
                     is_intermediate,
                     starred,
-                    has_workflow
+                    has_workflow,
+                    workflow
                     )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
                 """,
                 (
                     image_name,
@@ -362,6 +391,7 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
                     is_intermediate,
                     starred,
                     has_workflow,
+                    workflow_json,
                 ),
             )
             self._conn.commit()
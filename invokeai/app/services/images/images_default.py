@@ -1,3 +1,4 @@
+from pathlib import Path
 from typing import Optional
 
 from PIL.Image import Image as PILImageType
@@ -51,7 +52,12 @@ class ImageService(ImageServiceABC):
         if image_category not in ImageCategory:
             raise InvalidImageCategoryException
 
+        image_format = self.__get_image_format(image_category, bool(is_intermediate))
         image_name = self.__invoker.services.names.create_image_name()
+        # The name's extension matches the image's format
+        image_name = str(
+            Path(image_name).with_suffix(self.__invoker.services.image_files.get_extension(image, image_format))
+        )
 
         (width, height) = image.size
 
@@ -70,12 +76,19 @@ class ImageService(ImageServiceABC):
                 # Nullable fields
                 node_id=node_id,
                 metadata=metadata,
+                workflow=workflow,
                 session_id=session_id,
             )
             if board_id is not None:
                 self.__invoker.services.board_image_records.add_image_to_board(board_id=board_id, image_name=image_name)
             self.__invoker.services.image_files.save(
-                image_name=image_name, image=image, metadata=metadata, workflow=workflow
+                image_name=image_name,
+                image=image,
+                metadata=metadata,
+                workflow=workflow,
+                image_format=image_format,
+                # Intermediate images are only written once viewed, so nodes passing them to each other skip the disk
+                deferred=bool(is_intermediate),
             )
             image_dto = self.get_dto(image_name)
 
@@ -159,7 +172,14 @@ class ImageService(ImageServiceABC):
 
     def get_workflow(self, image_name: str) -> Optional[WorkflowWithoutID]:
         try:
-            return self.__invoker.services.image_files.get_workflow(image_name)
+            workflow = self.__invoker.services.image_records.get_workflow(image_name)
+            if workflow is None and self.__invoker.services.image_records.get(image_name).has_workflow:
+                # Images saved before workflows were stored in image records only have it in their file
+                return self.__invoker.services.image_files.get_workflow(image_name)
+            return workflow
+        except ImageRecordNotFoundException:
+            self.__invoker.services.logger.error("Image record not found")
+            raise
         except ImageFileNotFoundException:
             self.__invoker.services.logger.error("Image file not found")
             raise
@@ -167,6 +187,13 @@ class ImageService(ImageServiceABC):
             self.__invoker.services.logger.error("Problem getting image workflow")
             raise
 
+    def __get_image_format(self, image_category: ImageCategory, is_intermediate: bool) -> str:
+        """Gets the format to save an image as, as configured for intermediate images or for its category."""
+        image_formats = self.__invoker.services.configuration.image_formats
+        if is_intermediate and "intermediate" in image_formats:
+            return image_formats["intermediate"]
+        return image_formats.get(image_category.value, "png")
+
     def get_path(self, image_name: str, thumbnail: bool = False) -> str:
         try:
             return str(self.__invoker.services.image_files.get_path(image_name, thumbnail))
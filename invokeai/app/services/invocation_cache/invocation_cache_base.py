@@ -17,8 +17,8 @@ class InvocationCacheBase(ABC):
 
     See the memory implementation for an example.
 
-    Implementations should respect the `node_cache_size` configuration value, and skip all
-    cache logic if the value is set to 0.
+    Implementations should respect the `node_cache_size` and `node_cache_memory` configuration
+    values, and skip all cache logic if `node_cache_size` is set to 0.
     """
 
     @abstractmethod
@@ -43,8 +43,8 @@ class InvocationCacheBase(ABC):
 
     @staticmethod
     @abstractmethod
-    def create_key(invocation: BaseInvocation) -> int:
-        """Gets the key for the invocation's cache item"""
+    def create_key(invocation: BaseInvocation) -> str:
+        """Gets the key for the invocation's cache item. The key must be stable across restarts."""
         pass
 
     @abstractmethod
@@ -57,6 +57,11 @@ class InvocationCacheBase(ABC):
         """Enables the cache, letting the the max cache size take effect"""
         pass
 
+    @abstractmethod
+    def is_referenced(self, name: str) -> bool:
+        """Whether any cached output references the image, tensor or conditioning with the given name"""
+        pass
+
     @abstractmethod
     def get_status(self) -> InvocationCacheStatus:
         """Returns the status of the cache"""
@@ -1,4 +1,18 @@
+import hashlib
+from functools import lru_cache
+from typing import Any
+
 from pydantic import BaseModel, Field
+from pydantic_core import to_json
+
+from invokeai.app.invocations.baseinvocation import BaseInvocation
+from invokeai.app.invocations.fields import (
+    ConditioningField,
+    DenoiseMaskField,
+    ImageField,
+    LatentsField,
+    TensorField,
+)
 
 
 class InvocationCacheStatus(BaseModel):
@@ -7,3 +21,73 @@ class InvocationCacheStatus(BaseModel):
     misses: int = Field(description="The number of cache misses")
     enabled: bool = Field(description="Whether the invocation cache is enabled")
     max_size: int = Field(description="The maximum size of the invocation cache")
+    size_bytes: int = Field(default=0, description="The approximate memory used by the invocation cache, in bytes")
+    max_size_bytes: int = Field(default=0, description="The maximum memory used by the invocation cache, in bytes")
+
+
+# Fields that do not affect an invocation's output. The metadata is only embedded in output images, so a cached output is
+# reused even if it differs.
+NON_SEMANTIC_FIELDS = frozenset({"id", "use_cache", "metadata"})
+
+
+@lru_cache(maxsize=None)
+def get_fingerprint_fields(invocation_class: type[BaseInvocation]) -> tuple[str, ...]:
+    """Gets the fields of an invocation class that make up its cache key, in a stable order."""
+    return tuple(sorted(name for name in invocation_class.model_fields if name not in NON_SEMANTIC_FIELDS))
+
+
+def create_cache_key(invocation: BaseInvocation) -> str:
+    """Creates the cache key of an invocation, a digest of its type, version and semantic fields.
+
+    Fields are hashed one at a time, without serializing the whole invocation.
+    """
+    hasher = hashlib.blake2b(f"{invocation.get_type()}:{invocation.UIConfig.version}".encode(), digest_size=16)
+    for name in get_fingerprint_fields(type(invocation)):
+        value = getattr(invocation, name)
+        # Primitives are encoded directly, everything else is serialized to JSON. Values are tagged by kind and
+        # length-prefixed, so that different values never produce the same input to the digest.
+        if isinstance(value, str):
+            kind, data = b"s", value.encode()
+        elif value is None or isinstance(value, (bool, int, float)):
+            kind, data = b"p", repr(value).encode()
+        else:
+            kind, data = b"j", to_json(value, serialize_unknown=True)
+        hasher.update(b"".join((name.encode(), b"\0", kind, len(data).to_bytes(8, "little"), data)))
+
+    return hasher.hexdigest()
+
+
+def get_object_references(obj: Any) -> dict[str, str]:
+    """Gets the images, tensors and conditioning referenced by an invocation output, or any value within one.
+
+    Returns a mapping of each referenced name to the service storing it: `images`, `tensors` or `conditioning`.
+    """
+    references: dict[str, str] = {}
+    _add_object_references(obj, references)
+    return references
+
+
+def _add_object_references(obj: Any, references: dict[str, str]) -> None:
+    if isinstance(obj, ImageField):
+        references[obj.image_name] = "images"
+    elif isinstance(obj, LatentsField):
+        references[obj.latents_name] = "tensors"
+    elif isinstance(obj, TensorField):
+        references[obj.tensor_name] = "tensors"
+    elif isinstance(obj, DenoiseMaskField):
+        references[obj.mask_name] = "tensors"
+        if obj.masked_latents_name is not None:
+            references[obj.masked_latents_name] = "tensors"
+    elif isinstance(obj, ConditioningField):
+        references[obj.conditioning_name] = "conditioning"
+        if obj.mask is not None:
+            _add_object_references(obj.mask, references)
+    elif isinstance(obj, BaseModel):
+        for value in obj.__dict__.values():
+            _add_object_references(value, references)
+    elif isinstance(obj, (list, tuple, set)):
+        for value in obj:
+            _add_object_references(value, references)
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _add_object_references(value, references)
@@ -5,7 +5,11 @@ from typing import Optional, Union
 
 from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
 from invokeai.app.services.invocation_cache.invocation_cache_base import InvocationCacheBase
-from invokeai.app.services.invocation_cache.invocation_cache_common import InvocationCacheStatus
+from invokeai.app.services.invocation_cache.invocation_cache_common import (
+    InvocationCacheStatus,
+    create_cache_key,
+    get_object_references,
+)
 from invokeai.app.services.invoker import Invoker
 
 
@@ -13,20 +17,44 @@ from invokeai.app.services.invoker import Invoker
 class CachedItem:
     invocation_output: BaseInvocationOutput = field(compare=False)
     invocation_output_json: str = field(compare=False)
+    # The images, tensors and conditioning referenced by the output, mapped to the service storing them
+    references: dict[str, str] = field(compare=False, default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        """The approximate size of the cached output, in bytes"""
+        return len(self.invocation_output_json)
 
 
 class MemoryInvocationCache(InvocationCacheBase):
+    """An in-memory, least-recently-used invocation cache.
+
+    The cache is limited both by its number of items and by the approximate memory used by the cached outputs. Cached
+    outputs are indexed by the images, tensors and conditioning they reference, so that the outputs referencing a
+    deleted object are found without scanning the whole cache.
+
+    :param max_cache_size: The maximum number of cached outputs. If 0, the cache is disabled.
+    :param max_cache_bytes: The maximum approximate size of the cached outputs, in bytes. If None, only the number of
+        cached outputs is limited.
+    """
+
     _cache: OrderedDict[Union[int, str], CachedItem]
+    _references: dict[str, set[Union[int, str]]]
     _max_cache_size: int
+    _max_cache_bytes: Optional[int]
+    _size_bytes: int
     _disabled: bool
     _hits: int
     _misses: int
     _invoker: Invoker
     _lock: Lock
 
-    def __init__(self, max_cache_size: int = 0) -> None:
+    def __init__(self, max_cache_size: int = 0, max_cache_bytes: Optional[int] = None) -> None:
         self._cache = OrderedDict()
+        self._references = {}
         self._max_cache_size = max_cache_size
+        self._max_cache_bytes = max_cache_bytes
+        self._size_bytes = 0
         self._disabled = False
         self._hits = 0
         self._misses = 0
@@ -56,24 +84,45 @@ class MemoryInvocationCache(InvocationCacheBase):
         with self._lock:
             if self._max_cache_size == 0 or self._disabled or key in self._cache:
                 return
-            # If the cache is full, we need to remove the least used
-            number_to_delete = len(self._cache) + 1 - self._max_cache_size
-            self._delete_oldest_access(number_to_delete)
-            self._cache[key] = CachedItem(
+            item = CachedItem(
                 invocation_output,
-                invocation_output.model_dump_json(warnings=False, exclude_defaults=True, exclude_unset=True),
+                invocation_output.model_dump_json(warnings=False),
+                get_object_references(invocation_output),
             )
+            if self._max_cache_bytes is not None and item.size > self._max_cache_bytes:
+                # The output would evict everything else and still not fit
+                return
+            self._add(key, item)
+            # If the cache is full, we need to remove the least used
+            self._delete_oldest_access()
+
+    def _add(self, key: Union[int, str], item: CachedItem) -> None:
+        self._cache[key] = item
+        self._size_bytes += item.size
+        for name in item.references:
+            self._references.setdefault(name, set()).add(key)
 
-    def _delete_oldest_access(self, number_to_delete: int) -> None:
-        number_to_delete = min(number_to_delete, len(self._cache))
-        for _ in range(number_to_delete):
-            self._cache.popitem(last=False)
+    def _delete_oldest_access(self) -> None:
+        while self._cache and (
+            len(self._cache) > self._max_cache_size
+            or (self._max_cache_bytes is not None and self._size_bytes > self._max_cache_bytes)
+        ):
+            self._delete(next(iter(self._cache)))
 
     def _delete(self, key: Union[int, str]) -> None:
         if self._max_cache_size == 0:
             return
-        if key in self._cache:
-            del self._cache[key]
+        item = self._cache.pop(key, None)
+        if item is None:
+            return
+        self._size_bytes -= item.size
+        for name in item.references:
+            keys = self._references.get(name)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._references[name]
 
     def delete(self, key: Union[int, str]) -> None:
         with self._lock:
@@ -83,13 +132,18 @@ class MemoryInvocationCache(InvocationCacheBase):
         with self._lock:
             if self._max_cache_size == 0:
                 return
-            self._cache.clear()
+            self._clear()
             self._misses = 0
             self._hits = 0
 
+    def _clear(self) -> None:
+        self._cache.clear()
+        self._references.clear()
+        self._size_bytes = 0
+
     @staticmethod
-    def create_key(invocation: BaseInvocation) -> int:
-        return hash(invocation.model_dump_json(exclude={"id"}, warnings=False))
+    def create_key(invocation: BaseInvocation) -> str:
+        return create_cache_key(invocation)
 
     def disable(self) -> None:
         with self._lock:
@@ -103,6 +157,10 @@ class MemoryInvocationCache(InvocationCacheBase):
                 return
             self._disabled = False
 
+    def is_referenced(self, name: str) -> bool:
+        with self._lock:
+            return name in self._references
+
     def get_status(self) -> InvocationCacheStatus:
         with self._lock:
             return InvocationCacheStatus(
@@ -111,18 +169,18 @@ class MemoryInvocationCache(InvocationCacheBase):
                 enabled=not self._disabled and self._max_cache_size > 0,
                 size=len(self._cache),
                 max_size=self._max_cache_size,
+                size_bytes=self._size_bytes,
+                max_size_bytes=self._max_cache_bytes or 0,
             )
 
     def _delete_by_match(self, to_match: str) -> None:
         with self._lock:
             if self._max_cache_size == 0:
                 return
-            keys_to_delete = set()
-            for key, cached_item in self._cache.items():
-                if to_match in cached_item.invocation_output_json:
-                    keys_to_delete.add(key)
+            keys_to_delete = self._references.get(to_match)
             if not keys_to_delete:
                 return
+            keys_to_delete = set(keys_to_delete)
             for key in keys_to_delete:
                 self._delete(key)
             self._invoker.services.logger.debug(
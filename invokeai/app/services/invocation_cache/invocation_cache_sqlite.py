@@ -0,0 +1,156 @@
+from typing import Optional, Union
+
+from pydantic import ValidationError
+
+from invokeai.app.invocations.baseinvocation import BaseInvocationOutput
+from invokeai.app.services.invocation_cache.invocation_cache_memory import CachedItem, MemoryInvocationCache
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.shared.sqlite.sqlite_database import SqliteDatabase
+from invokeai.version.invokeai_version import __version__
+
+
+class SqliteInvocationCache(MemoryInvocationCache):
+    """An invocation cache that keeps its outputs in memory, and also stores them in the database so they are reused
+    after a restart.
+
+    The database holds the same outputs as the memory cache, which is loaded from the database on startup. Outputs
+    cached by another version of the app are discarded. Outputs referencing deferred images are only kept in memory, as
+    those images may never be written.
+
+    :param db: The database
+    :param max_cache_size: The maximum number of cached outputs. If 0, the cache is disabled.
+    :param max_cache_bytes: The maximum approximate size of the cached outputs, in bytes. If None, only the number of
+        cached outputs is limited.
+    :param persist_tensors: Whether to store outputs that reference tensors or conditioning. These should only be
+        stored if the tensors and conditioning are not deleted on shutdown.
+    """
+
+    def __init__(
+        self,
+        db: SqliteDatabase,
+        max_cache_size: int = 0,
+        max_cache_bytes: Optional[int] = None,
+        persist_tensors: bool = False,
+    ) -> None:
+        super().__init__(max_cache_size=max_cache_size, max_cache_bytes=max_cache_bytes)
+        self._db_lock = db.lock
+        self._conn = db.conn
+        self._cursor = self._conn.cursor()
+        self._persist_tensors = persist_tensors
+
+    def start(self, invoker: Invoker) -> None:
+        super().start(invoker)
+        if self._max_cache_size == 0:
+            return
+        with self._lock:
+            self._load()
+
+    def _clear(self) -> None:
+        super()._clear()
+        self._execute("DELETE FROM invocation_cache;")
+
+    def _is_persisted(self, item: CachedItem) -> bool:
+        for name, service in item.references.items():
+            if service != "images":
+                if not self._persist_tensors:
+                    return False
+            # Deferred images may never be written, e.g. if the app crashes, so outputs referencing them are only
+            # cached in memory
+            elif self._invoker.services.image_files.is_deferred(name):
+                return False
+        return True
+
+    def _add(self, key: Union[int, str], item: CachedItem) -> None:
+        super()._add(key, item)
+        if not self._is_persisted(item):
+            return
+        try:
+            self._db_lock.acquire()
+            self._cursor.execute(
+                """--sql
+                INSERT INTO invocation_cache (key, invocation_output, app_version)
+                VALUES (?, ?, ?)
+                ON CONFLICT (key) DO NOTHING;
+                """,
+                (key, item.invocation_output_json, __version__),
+            )
+            self._cursor.executemany(
+                """--sql
+                INSERT INTO invocation_cache_references (name, service, key)
+                VALUES (?, ?, ?)
+                ON CONFLICT (name, key) DO NOTHING;
+                """,
+                [(name, service, key) for name, service in item.references.items()],
+            )
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._db_lock.release()
+
+    def _delete(self, key: Union[int, str]) -> None:
+        if self._max_cache_size == 0 or key not in self._cache:
+            return
+        super()._delete(key)
+        self._execute("DELETE FROM invocation_cache WHERE key = ?;", (key,))
+
+    def _execute(self, stmt: str, params: tuple[Union[int, str], ...] = ()) -> None:
+        try:
+            self._db_lock.acquire()
+            self._cursor.execute(stmt, params)
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._db_lock.release()
+
+    def _load(self) -> None:
+        """Discards stale outputs from the database, and loads the rest into memory in the order they were cached."""
+        try:
+            self._db_lock.acquire()
+            self._cursor.execute("DELETE FROM invocation_cache WHERE app_version != ?;", (__version__,))
+            if not self._persist_tensors:
+                self._cursor.execute(
+                    """--sql
+                    DELETE FROM invocation_cache
+                    WHERE key IN (
+                        SELECT key
+                        FROM invocation_cache_references
+                        WHERE service != 'images'
+                    );
+                    """
+                )
+            self._cursor.execute(
+                """--sql
+                SELECT key, invocation_output
+                FROM invocation_cache
+                ORDER BY rowid ASC;
+                """
+            )
+            rows = self._cursor.fetchall()
+            self._cursor.execute("SELECT key, name, service FROM invocation_cache_references;")
+            references: dict[str, dict[str, str]] = {}
+            for key, name, service in self._cursor.fetchall():
+                references.setdefault(key, {})[name] = service
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._db_lock.release()
+
+        typeadapter = BaseInvocationOutput.get_typeadapter()
+        invalid_keys: list[str] = []
+        for key, invocation_output_json in rows:
+            try:
+                invocation_output = typeadapter.validate_json(invocation_output_json)
+            except ValidationError:
+                # The output's type may have been removed, e.g. if it was provided by a custom node
+                invalid_keys.append(key)
+                continue
+            super()._add(key, CachedItem(invocation_output, invocation_output_json, references.get(key, {})))
+        for key in invalid_keys:
+            self._execute("DELETE FROM invocation_cache WHERE key = ?;", (key,))
+        self._delete_oldest_access()
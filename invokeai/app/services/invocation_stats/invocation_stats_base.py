@@ -30,10 +30,11 @@ writes to the system log is stored in InvocationServices.performance_statistics.
 
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import ContextManager
+from typing import ContextManager, Optional
 
 from invokeai.app.invocations.baseinvocation import BaseInvocation
 from invokeai.app.services.invocation_stats.invocation_stats_common import InvocationStatsSummary
+from invokeai.app.util.metrics import Histogram
 
 
 class InvocationStatsServiceBase(ABC):
@@ -60,8 +61,11 @@ class InvocationStatsServiceBase(ABC):
         pass
 
     @abstractmethod
-    def reset_stats(self):
-        """Reset all stored statistics."""
+    def reset_stats(self, graph_execution_state_id: Optional[str] = None):
+        """
+        Reset stored statistics.
+        :param graph_execution_state_id: The id of the session whose stats to reset. If None, all stats are reset.
+        """
         pass
 
     @abstractmethod
@@ -91,3 +95,11 @@ class InvocationStatsServiceBase(ABC):
         :raises GESStatsNotFoundError: if the graph isn't tracked in the stats.
         """
         pass
+
+    @abstractmethod
+    def get_node_durations(self) -> Histogram:
+        """
+        Gets the execution time of every node executed since startup, by node type. Unlike the per-session
+        statistics, these are never reset.
+        """
+        pass
@@ -2,7 +2,8 @@ import json
 import time
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Generator
+from threading import Lock
+from typing import Generator, Optional
 
 import psutil
 import torch
@@ -10,6 +11,7 @@ import torch
 import invokeai.backend.util.logging as logger
 from invokeai.app.invocations.baseinvocation import BaseInvocation
 from invokeai.app.services.invoker import Invoker
+from invokeai.app.util.metrics import Histogram
 from invokeai.backend.model_manager.load.model_cache import CacheStats
 
 from .invocation_stats_base import InvocationStatsServiceBase
@@ -36,6 +38,11 @@ class InvocationStatsService(InvocationStatsServiceBase):
         self._stats: dict[str, GraphExecutionStats] = {}
         # Maps graph_execution_state_id to model manager CacheStats.
         self._cache_stats: dict[str, CacheStats] = {}
+        # Execution time of all nodes since startup, by node type.
+        self._node_durations = Histogram()
+        # Number of nodes being executed concurrently, by the session processor's workers.
+        self._running_lock = Lock()
+        self._running = 0
 
     def start(self, invoker: Invoker) -> None:
         self._invoker = invoker
@@ -53,12 +60,18 @@ class InvocationStatsService(InvocationStatsServiceBase):
         # Record state before the invocation.
         start_time = time.time()
         start_ram = psutil.Process().memory_info().rss
-        if torch.cuda.is_available():
-            torch.cuda.reset_peak_memory_stats()
 
         assert services.model_manager.load is not None
+        # The model cache keeps the stats of each worker thread separately
         services.model_manager.load.ram_cache.stats = self._cache_stats[graph_execution_state_id]
 
+        # The peak VRAM is tracked per device, not per node. It is only reset when no other node is running, so that
+        # nodes executed concurrently by other workers keep their peak. Their peak then includes this node's usage.
+        with self._running_lock:
+            if self._running == 0 and torch.cuda.is_available():
+                torch.cuda.reset_peak_memory_stats()
+            self._running += 1
+
         try:
             # Let the invocation run.
             yield None
@@ -72,11 +85,21 @@ class InvocationStatsService(InvocationStatsServiceBase):
                 end_ram_gb=psutil.Process().memory_info().rss / GB,
                 peak_vram_gb=torch.cuda.max_memory_allocated() / GB if torch.cuda.is_available() else 0.0,
             )
+            with self._running_lock:
+                self._running -= 1
             self._stats[graph_execution_state_id].add_node_execution_stats(node_stats)
-
-    def reset_stats(self):
-        self._stats = {}
-        self._cache_stats = {}
+            self._node_durations.observe(node_stats.total_time(), node_stats.invocation_type)
+
+    def get_node_durations(self) -> Histogram:
+        return self._node_durations
+
+    def reset_stats(self, graph_execution_state_id: Optional[str] = None):
+        if graph_execution_state_id is None:
+            self._stats = {}
+            self._cache_stats = {}
+            return
+        self._stats.pop(graph_execution_state_id, None)
+        self._cache_stats.pop(graph_execution_state_id, None)
 
     def get_stats(self, graph_execution_state_id: str) -> InvocationStatsSummary:
         graph_stats_summary = self._get_graph_summary(graph_execution_state_id)
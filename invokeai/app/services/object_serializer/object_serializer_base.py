@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Callable, Generic, TypeVar
+from typing import Callable, Generic, Optional, TypeVar
+
+from invokeai.app.services.object_serializer.object_serializer_common import ObjectSerializerStorageStatus
 
 T = TypeVar("T")
 
@@ -35,6 +37,30 @@ class ObjectSerializerBase(ABC, Generic[T]):
         """
         pass
 
+    def pin(self, name: str, owner: str) -> None:
+        """
+        Keeps the object until its owner unpins it, if the serializer deletes objects that are no longer used. Caching
+        serializers also prefer to keep pinned objects in memory.
+        :param name: The name of the object to pin.
+        :param owner: The owner of the pin, e.g. the session using the object.
+        """
+        pass
+
+    def unpin(self, owner: str) -> None:
+        """
+        Releases all objects pinned by the owner.
+        :param owner: The owner of the pins.
+        """
+        pass
+
+    def flush(self) -> None:
+        """Waits until all saved objects are written to storage, if the serializer writes them in the background."""
+        pass
+
+    def get_storage_status(self) -> Optional[ObjectSerializerStorageStatus]:
+        """Gets the disk space used by the stored objects, if the serializer tracks which objects are still in use."""
+        return None
+
     def on_deleted(self, on_deleted: Callable[[str], None]) -> None:
         """Register a callback for when an object is deleted"""
         self._on_deleted_callbacks.append(on_deleted)
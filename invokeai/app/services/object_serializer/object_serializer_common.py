@@ -1,5 +1,30 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
 class ObjectNotFoundError(KeyError):
     """Raised when an object is not found while loading"""
 
     def __init__(self, name: str) -> None:
         super().__init__(f"Object with name {name} not found")
+
+
+class ObjectSerializerCacheStatus(BaseModel):
+    size: int = Field(description="The number of cached objects")
+    size_bytes: int = Field(description="The approximate memory used by the cached objects, in bytes")
+    max_size: Optional[int] = Field(description="The maximum number of cached objects, if limited")
+    max_size_bytes: Optional[int] = Field(description="The maximum memory used by the cached objects, if limited")
+    pinned: int = Field(description="The number of cached objects pinned by in-progress sessions")
+    hits: int = Field(description="The number of cache hits")
+    misses: int = Field(description="The number of cache misses")
+    evictions: int = Field(description="The number of objects evicted from the cache")
+
+
+class ObjectSerializerStorageStatus(BaseModel):
+    count: int = Field(description="The number of stored objects")
+    size_bytes: int = Field(description="The disk space used by the stored objects, in bytes")
+    live_count: int = Field(description="The number of stored objects still in use")
+    live_size_bytes: int = Field(description="The disk space used by the stored objects still in use, in bytes")
+    garbage_count: int = Field(description="The number of stored objects no longer in use")
+    garbage_size_bytes: int = Field(description="The disk space used by the stored objects no longer in use, in bytes")
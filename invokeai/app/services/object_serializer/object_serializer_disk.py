@@ -1,3 +1,4 @@
+import os
 import tempfile
 import typing
 from dataclasses import dataclass
@@ -50,15 +51,36 @@ class ObjectSerializerDisk(ObjectSerializerBase[T]):
             raise ObjectNotFoundError(name) from e
 
     def save(self, obj: T) -> str:
-        name = self._new_name()
+        name = self.new_name()
+        self.save_as(name, obj)
+        return name
+
+    def new_name(self) -> str:
+        """Generates a name for a new object, which can be saved later with `save_as`."""
+        return f"{self._obj_class_name}_{uuid_string()}"
+
+    def save_as(self, name: str, obj: T) -> None:
+        """Saves the object under the given name, which must have been generated by `new_name`."""
         file_path = self._get_path(name)
         torch.save(obj, file_path)  # pyright: ignore [reportUnknownMemberType]
-        return name
 
     def delete(self, name: str) -> None:
         file_path = self._get_path(name)
         file_path.unlink()
 
+    def list_stored(self) -> dict[str, int]:
+        """Lists the names of the stored objects, mapped to their size on disk in bytes."""
+        sizes: dict[str, int] = {}
+        with os.scandir(self._output_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        sizes[entry.name] = entry.stat().st_size
+                except FileNotFoundError:
+                    # The object was deleted while listing
+                    continue
+        return sizes
+
     @property
     def _obj_class_name(self) -> str:
         if not self.__obj_class_name:
@@ -69,9 +91,6 @@ class ObjectSerializerDisk(ObjectSerializerBase[T]):
     def _get_path(self, name: str) -> Path:
         return self._output_dir / name
 
-    def _new_name(self) -> str:
-        return f"{self._obj_class_name}_{uuid_string()}"
-
     def _tempdir_cleanup(self) -> None:
         """Calls `cleanup` on the temporary directory, if it exists."""
         if self._tempdir:
@@ -1,26 +1,86 @@
-from queue import Queue
-from typing import TYPE_CHECKING, Optional, TypeVar
+import sys
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import fields, is_dataclass
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Optional, TypeVar
+
+import torch
 
 from invokeai.app.services.object_serializer.object_serializer_base import ObjectSerializerBase
+from invokeai.app.services.object_serializer.object_serializer_common import (
+    ObjectNotFoundError,
+    ObjectSerializerCacheStatus,
+    ObjectSerializerStorageStatus,
+)
+from invokeai.app.services.object_serializer.object_serializer_disk import ObjectSerializerDisk
 
 T = TypeVar("T")
 
+# The number of threads writing objects to the underlying storage in write-behind mode
+WRITE_BEHIND_WORKERS = 2
+
 if TYPE_CHECKING:
     from invokeai.app.services.invoker import Invoker
 
 
 class ObjectSerializerForwardCache(ObjectSerializerBase[T]):
     """
-    Provides a LRU cache for an instance of `ObjectSerializerBase`.
-    Saving an object to the cache always writes through to the underlying storage.
+    Provides a thread-safe LRU cache for an instance of `ObjectSerializerBase`.
+    Saving an object to the cache always writes it to the underlying storage - immediately, or in write-behind mode, in
+    a background thread. Objects deleted before they are written are never written. `flush` waits for pending writes.
+
+    The cache is limited by its number of objects and by the memory used by their tensors, evicting the least recently
+    used objects first. Objects pinned by an owner are only evicted if the limits cannot be met otherwise. Evicted
+    objects are loaded again from the underlying storage when needed. With garbage collection, objects pinned by an owner, e.g. the session using them, are deleted from the underlying storage once
+    they are unpinned by all their owners, unless a cached invocation output references them.
+
+    :param underlying_storage: The storage to cache
+    :param max_cache_size: The maximum number of cached objects. If None, only the memory used is limited.
+    :param max_cache_bytes: The maximum memory used by the cached objects, in bytes. If None, only the number of cached
+        objects is limited.
+    :param write_behind: Whether to write saved objects in the background, rather than before `save` returns. Requires
+        the underlying storage to be an `ObjectSerializerDisk`, which can name objects before writing them.
+    :param collect_garbage: Whether to delete objects once they are no longer pinned or referenced by the invocation
+        cache. Objects that were never pinned are kept.
     """
 
-    def __init__(self, underlying_storage: ObjectSerializerBase[T], max_cache_size: int = 20):
+    def __init__(
+        self,
+        underlying_storage: ObjectSerializerBase[T],
+        max_cache_size: Optional[int] = 20,
+        max_cache_bytes: Optional[int] = None,
+        write_behind: bool = False,
+        collect_garbage: bool = False,
+    ):
         super().__init__()
+        if write_behind and not isinstance(underlying_storage, ObjectSerializerDisk):
+            raise ValueError("Write-behind requires the underlying storage to be an ObjectSerializerDisk")
         self._underlying_storage = underlying_storage
-        self._cache: dict[str, T] = {}
-        self._cache_ids = Queue[str]()
+        self._cache: OrderedDict[str, T] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._size_bytes = 0
         self._max_cache_size = max_cache_size
+        self._max_cache_bytes = max_cache_bytes
+        # Maps each owner to the names it pinned, and each pinned name to the number of owners pinning it
+        self._pins: dict[str, set[str]] = {}
+        self._pin_counts: dict[str, int] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = Lock()
+        self._collect_garbage = collect_garbage
+        # In write-behind mode, the objects not yet written and the writes scheduled for them, by name
+        self._pending: dict[str, T] = {}
+        self._writes: dict[str, Future[bool]] = {}
+        self._write_errors: list[Exception] = []
+        # The names of the objects that failed to be written, which are not in the underlying storage
+        self._failed_writes: set[str] = set()
+        self._executor = (
+            ThreadPoolExecutor(max_workers=WRITE_BEHIND_WORKERS, thread_name_prefix="object_serializer_write")
+            if write_behind
+            else None
+        )
 
     def start(self, invoker: "Invoker") -> None:
         self._invoker = invoker
@@ -30,6 +90,12 @@ class ObjectSerializerForwardCache(ObjectSerializerBase[T]):
 
     def stop(self, invoker: "Invoker") -> None:
         self._invoker = invoker
+        if self._executor is not None:
+            try:
+                self.flush()
+            except Exception as e:
+                invoker.services.logger.error(f"Failed to write cached objects on shutdown: {e}")
+            self._executor.shutdown()
         stop_op = getattr(self._underlying_storage, "stop", None)
         if callable(stop_op):
             stop_op(invoker)
@@ -39,27 +105,243 @@ class ObjectSerializerForwardCache(ObjectSerializerBase[T]):
         if cache_item is not None:
             return cache_item
 
+        # Load outside the lock, so other threads can use the cache while this one reads from the underlying storage
         obj = self._underlying_storage.load(name)
         self._set_cache(name, obj)
         return obj
 
     def save(self, obj: T) -> str:
-        name = self._underlying_storage.save(obj)
+        if self._executor is None:
+            name = self._underlying_storage.save(obj)
+        else:
+            assert isinstance(self._underlying_storage, ObjectSerializerDisk)
+            name = self._underlying_storage.new_name()
+            with self._lock:
+                # Scheduled under the lock, so the write cannot finish before it is recorded
+                self._pending[name] = obj
+                self._writes[name] = self._executor.submit(self._write, name)
         self._set_cache(name, obj)
         return name
 
     def delete(self, name: str) -> None:
-        self._underlying_storage.delete(name)
-        if name in self._cache:
-            del self._cache[name]
+        with self._lock:
+            was_pending, write = self._detach(name)
+        self._delete_detached(name, was_pending, write)
+
+    def _detach(self, name: str) -> tuple[bool, Optional[Future[bool]]]:
+        """Removes an object from memory, and from the objects pending a write. Call with the lock held.
+
+        Returns whether the object was pending or failed to be written, and its scheduled write, if any.
+        """
+        was_pending = self._pending.pop(name, None) is not None
+        if name in self._failed_writes:
+            self._failed_writes.remove(name)
+            was_pending = True
+        write = self._writes.pop(name, None)
+        self._remove(name)
+        return was_pending, write
+
+    def _delete_detached(self, name: str, was_pending: bool, write: Optional[Future[bool]]) -> None:
+        """Deletes a detached object from the underlying storage, if it was written. Call without the lock held, as
+        the object's write may have to finish first."""
+        if write is not None:
+            # A write that has not started is canceled, otherwise it is waited for
+            written = not write.cancel() and write.exception() is None and write.result()
+        else:
+            # An object still pending without a scheduled write was never written
+            written = not was_pending
+        if written:
+            self._underlying_storage.delete(name)
         self._on_deleted(name)
 
+    def flush(self) -> None:
+        """Waits until all saved objects are written to the underlying storage.
+
+        :raises Exception: the first error raised by a write since the last flush, if any failed. Objects that failed
+            to be written can only be loaded while they stay in the cache.
+        """
+        with self._lock:
+            writes = list(self._writes.values())
+        # Errors are collected by the writes, so each is reported once even if several flushes wait for its write
+        wait(writes)
+        with self._lock:
+            errors = self._write_errors
+            self._write_errors = []
+        if errors:
+            raise errors[0]
+
+    def _write(self, name: str) -> bool:
+        """Writes a pending object to the underlying storage. Returns False if it was deleted before being written."""
+        with self._lock:
+            obj = self._pending.get(name)
+        if obj is None:
+            return False
+        assert isinstance(self._underlying_storage, ObjectSerializerDisk)
+        try:
+            self._underlying_storage.save_as(name, obj)
+        except Exception as e:
+            invoker: Optional["Invoker"] = getattr(self, "_invoker", None)
+            if invoker is not None:
+                invoker.services.logger.error(f"Failed to write object {name}: {e}")
+            # The object is no longer held until it is written, so eviction can release its memory
+            with self._lock:
+                if self._pending.pop(name, None) is not None:
+                    self._failed_writes.add(name)
+                self._writes.pop(name, None)
+                self._write_errors.append(e)
+            raise
+        with self._lock:
+            self._pending.pop(name, None)
+            self._writes.pop(name, None)
+        return True
+
+    def pin(self, name: str, owner: str) -> None:
+        with self._lock:
+            names = self._pins.setdefault(owner, set())
+            if name not in names:
+                names.add(name)
+                self._pin_counts[name] = self._pin_counts.get(name, 0) + 1
+
+    def unpin(self, owner: str) -> None:
+        released: list[str] = []
+        with self._lock:
+            for name in self._pins.pop(owner, set()):
+                count = self._pin_counts[name] - 1
+                if count:
+                    self._pin_counts[name] = count
+                else:
+                    del self._pin_counts[name]
+                    released.append(name)
+        if self._collect_garbage:
+            for name in released:
+                self._delete_garbage(name)
+
+    def get_storage_status(self) -> Optional[ObjectSerializerStorageStatus]:
+        if not isinstance(self._underlying_storage, ObjectSerializerDisk):
+            return None
+        stored = self._underlying_storage.list_stored()
+        live_count = 0
+        live_size_bytes = 0
+        with self._lock:
+            for name, size in stored.items():
+                if self._is_live(name):
+                    live_count += 1
+                    live_size_bytes += size
+        size_bytes = sum(stored.values())
+        return ObjectSerializerStorageStatus(
+            count=len(stored),
+            size_bytes=size_bytes,
+            live_count=live_count,
+            live_size_bytes=live_size_bytes,
+            garbage_count=len(stored) - live_count,
+            garbage_size_bytes=size_bytes - live_size_bytes,
+        )
+
+    def _is_live(self, name: str) -> bool:
+        """Whether an object is pinned or referenced by a cached invocation output. Call with the lock held."""
+        if name in self._pin_counts:
+            return True
+        invoker: Optional["Invoker"] = getattr(self, "_invoker", None)
+        return invoker is not None and invoker.services.invocation_cache.is_referenced(name)
+
+    def _delete_garbage(self, name: str) -> None:
+        # The object may have been pinned again, e.g. by a session reusing a cached output, since it was released. It
+        # is checked and detached under the lock, so it cannot be pinned in between.
+        with self._lock:
+            if self._is_live(name):
+                return
+            was_pending, write = self._detach(name)
+        try:
+            self._delete_detached(name, was_pending, write)
+        except (ObjectNotFoundError, FileNotFoundError):
+            # Already deleted
+            pass
+
+    def get_status(self) -> ObjectSerializerCacheStatus:
+        with self._lock:
+            return ObjectSerializerCacheStatus(
+                size=len(self._cache),
+                size_bytes=self._size_bytes,
+                max_size=self._max_cache_size,
+                max_size_bytes=self._max_cache_bytes,
+                pinned=sum(1 for name in self._pin_counts if name in self._cache),
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+            )
+
     def _get_cache(self, name: str) -> Optional[T]:
-        return None if name not in self._cache else self._cache[name]
+        with self._lock:
+            obj = self._cache.get(name)
+            if obj is not None:
+                self._cache.move_to_end(name)
+            else:
+                # The object may have been evicted before it was written
+                obj = self._pending.get(name)
+            if obj is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return obj
 
-    def _set_cache(self, name: str, data: T):
-        if name not in self._cache:
+    def _set_cache(self, name: str, data: T) -> None:
+        size = get_object_size(data)
+        with self._lock:
+            if name in self._cache:
+                # Another thread cached the object while this one was loading it
+                self._cache.move_to_end(name)
+                return
             self._cache[name] = data
-            self._cache_ids.put(name)
-            if self._cache_ids.qsize() > self._max_cache_size:
-                self._cache.pop(self._cache_ids.get())
+            self._sizes[name] = size
+            self._size_bytes += size
+            self._evict()
+
+    def _remove(self, name: str) -> None:
+        if self._cache.pop(name, None) is not None:
+            self._size_bytes -= self._sizes.pop(name)
+
+    def _is_full(self) -> bool:
+        return (self._max_cache_size is not None and len(self._cache) > self._max_cache_size) or (
+            self._max_cache_bytes is not None and self._size_bytes > self._max_cache_bytes
+        )
+
+    def _evict(self) -> None:
+        """Evicts the least recently used objects until the cache fits its limits.
+
+        Unpinned objects are evicted first, so objects still used by a session, e.g. conditioning reused across a batch,
+        are not evicted by large objects used once. Pinned objects are only evicted if the limits cannot be met
+        otherwise - they are in the underlying storage, or pending a write in write-behind mode, so they are loaded
+        again if needed.
+        """
+        if not self._is_full():
+            return
+        unpinned = [name for name in self._cache if name not in self._pin_counts]
+        for name in (*unpinned, *self._cache):
+            if not self._is_full():
+                return
+            if name in self._cache:
+                self._remove(name)
+                self._evictions += 1
+
+
+def get_object_size(obj: Any, storages: Optional[set[int]] = None) -> int:
+    """Gets the approximate memory used by an object, in bytes.
+
+    Only tensors are measured accurately, by the size of their storage. Tensors sharing a storage are counted once.
+    Dataclasses, lists, tuples and dicts are measured by their contents, and any other object by `sys.getsizeof`.
+    """
+    if storages is None:
+        storages = set()
+    if isinstance(obj, torch.Tensor):
+        storage = obj.untyped_storage()
+        if storage.data_ptr() in storages:
+            return 0
+        storages.add(storage.data_ptr())
+        return storage.nbytes()
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return sum(get_object_size(getattr(obj, f.name), storages) for f in fields(obj))
+    if isinstance(obj, (list, tuple)):
+        return sum(get_object_size(item, storages) for item in obj)
+    if isinstance(obj, dict):
+        return sum(get_object_size(value, storages) for value in obj.values())
+    return sys.getsizeof(obj)
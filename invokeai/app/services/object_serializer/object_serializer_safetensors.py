@@ -0,0 +1,123 @@
+import json
+from pathlib import Path
+from typing import Optional, TypeVar, Union, cast
+
+import torch
+from safetensors.torch import load_file, save_file
+
+from invokeai.app.services.object_serializer.object_serializer_common import ObjectNotFoundError
+from invokeai.app.services.object_serializer.object_serializer_disk import ObjectSerializerDisk
+from invokeai.backend.stable_diffusion.diffusion.conditioning_data import (
+    BasicConditioningInfo,
+    ConditioningFieldData,
+    SDXLConditioningInfo,
+)
+
+T = TypeVar("T", bound=Union[torch.Tensor, ConditioningFieldData])
+
+# The tensor fields of each supported conditioning info class
+CONDITIONING_INFO_TENSORS: dict[str, tuple[type[BasicConditioningInfo], tuple[str, ...]]] = {
+    "BasicConditioningInfo": (BasicConditioningInfo, ("embeds",)),
+    "SDXLConditioningInfo": (SDXLConditioningInfo, ("embeds", "pooled_embeds", "add_time_ids")),
+}
+
+
+class ObjectSerializerSafetensors(ObjectSerializerDisk[T]):
+    """Disk-backed storage for tensors and conditioning, serialized as safetensors.
+
+    Loading a safetensors file memory-maps it and reads the tensors directly, without unpickling. `ConditioningFieldData`
+    is stored as a flat set of tensors, with its structure (the class of each conditioning info) in the file's metadata.
+
+    Files written by `ObjectSerializerDisk`, e.g. by a previous version of the app, are still loaded with `torch.load`.
+
+    :param output_dir: The folder where the serialized objects will be stored
+    :param ephemeral: If True, objects will be stored in a temporary directory inside the given output_dir and cleaned up on exit
+    """
+
+    def load(self, name: str) -> T:
+        path = self._get_path(name)
+        try:
+            metadata = _read_metadata(path)
+        except FileNotFoundError as e:
+            raise ObjectNotFoundError(name) from e
+        if metadata is None:
+            # Not a safetensors file, it must have been pickled by `ObjectSerializerDisk`
+            return super().load(name)
+        # The metadata records the type of the object that was saved
+        return cast(T, self._from_tensors(load_file(path), metadata))
+
+    def save_as(self, name: str, obj: T) -> None:
+        tensors, metadata = self._to_tensors(obj)
+        save_file(tensors, self._get_path(name), metadata=metadata)
+
+    @staticmethod
+    def _to_tensors(obj: T) -> tuple[dict[str, torch.Tensor], dict[str, str]]:
+        if isinstance(obj, torch.Tensor):
+            return {"tensor": _prepare_tensor(obj, set())}, {"type": "Tensor"}
+
+        if isinstance(obj, ConditioningFieldData):
+            # safetensors does not allow tensors to share memory, so shared tensors are copied
+            storage_ptrs: set[int] = set()
+            tensors: dict[str, torch.Tensor] = {}
+            info_types: list[str] = []
+            for i, info in enumerate(obj.conditionings):
+                info_type = type(info).__name__
+                if info_type not in CONDITIONING_INFO_TENSORS:
+                    raise ValueError(f"Unsupported conditioning info type: {info_type}")
+                info_types.append(info_type)
+                for field_name in CONDITIONING_INFO_TENSORS[info_type][1]:
+                    tensors[f"conditionings.{i}.{field_name}"] = _prepare_tensor(
+                        getattr(info, field_name), storage_ptrs
+                    )
+            return tensors, {"type": "ConditioningFieldData", "conditionings": json.dumps(info_types)}
+
+        raise ValueError(f"Unsupported object type: {type(obj).__name__}")
+
+    @staticmethod
+    def _from_tensors(
+        tensors: dict[str, torch.Tensor], metadata: dict[str, str]
+    ) -> Union[torch.Tensor, ConditioningFieldData]:
+        obj_type = metadata.get("type")
+        if obj_type == "Tensor":
+            return tensors["tensor"]
+
+        if obj_type == "ConditioningFieldData":
+            conditionings: list[BasicConditioningInfo] = []
+            for i, info_type in enumerate(json.loads(metadata["conditionings"])):
+                info_class, field_names = CONDITIONING_INFO_TENSORS[info_type]
+                conditionings.append(info_class(**{f: tensors[f"conditionings.{i}.{f}"] for f in field_names}))
+            return ConditioningFieldData(conditionings=conditionings)
+
+        raise ValueError(f"Unsupported object type: {obj_type}")
+
+
+def _read_metadata(path: Path) -> Optional[dict[str, str]]:
+    """Reads the metadata from the header of a safetensors file, or returns None if the file is not a safetensors file.
+
+    A safetensors file starts with the size of its JSON header, as a little-endian 64-bit integer. The metadata is in the
+    header's `__metadata__` entry.
+    """
+    with open(path, "rb") as file:
+        header_size = int.from_bytes(file.read(8), "little")
+        if header_size > path.stat().st_size - 8:
+            return None
+        try:
+            header = json.loads(file.read(header_size))
+        except ValueError:
+            return None
+    if not isinstance(header, dict):
+        return None
+    metadata = header.get("__metadata__") or {}
+    return {str(key): str(value) for key, value in metadata.items()}
+
+
+def _prepare_tensor(tensor: torch.Tensor, storage_ptrs: set[int]) -> torch.Tensor:
+    """Prepares a tensor to be saved as safetensors: detached, on the CPU, contiguous, and not sharing memory with any
+    tensor prepared before it (tracked by `storage_ptrs`)."""
+    tensor = tensor.detach().cpu().contiguous()
+    storage_ptr = tensor.untyped_storage().data_ptr()
+    if tensor.numel() > 0 and storage_ptr in storage_ptrs:
+        tensor = tensor.clone()
+        storage_ptr = tensor.untyped_storage().data_ptr()
+    storage_ptrs.add(storage_ptr)
+    return tensor
@@ -1,15 +1,18 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 
 from invokeai.app.services.session_processor.session_processor_common import SessionProcessorStatus
+from invokeai.app.services.session_queue.session_queue_common import SessionQueueItem
+from invokeai.app.util.metrics import Histogram
 
 
 class SessionProcessorBase(ABC):
     """
     Base class for session processor.
 
-    The session processor is responsible for executing sessions. It runs a simple polling loop,
-    checking the session queue for new sessions to execute. It must coordinate with the
-    invocation queue to ensure only one session is executing at a time.
+    The session processor is responsible for executing sessions. It runs a pool of workers, each
+    of which checks the session queue for new sessions to execute. It must coordinate with the
+    session queue to ensure each queue item is executed by exactly one worker.
     """
 
     @abstractmethod
@@ -26,3 +29,13 @@ class SessionProcessorBase(ABC):
     def get_status(self) -> SessionProcessorStatus:
         """Gets the status of the session processor"""
         pass
+
+    @abstractmethod
+    def get_running_queue_item(self, item_id: int) -> Optional[SessionQueueItem]:
+        """Gets a queue item being executed, with the progress of its session, or None if it is not being executed"""
+        pass
+
+    @abstractmethod
+    def get_wait_times(self) -> Histogram:
+        """Gets the time between queue items being enqueued and their execution starting, since startup"""
+        pass
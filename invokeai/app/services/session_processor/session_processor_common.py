@@ -1,9 +1,28 @@
+import io
+from dataclasses import dataclass
+from typing import Any, Literal, Optional
+
+from PIL import Image
 from pydantic import BaseModel, Field
 
+from invokeai.backend.util.util import image_to_dataURL
+
+
+class SessionProcessorLatency(BaseModel):
+    """The time between queue items being enqueued and their execution starting"""
+
+    count: int = Field(description="The number of queue items started")
+    last_seconds: Optional[float] = Field(default=None, description="The latency of the most recently started item")
+    mean_seconds: Optional[float] = Field(default=None, description="The mean latency of all started items")
+    max_seconds: Optional[float] = Field(default=None, description="The maximum latency of all started items")
+
 
 class SessionProcessorStatus(BaseModel):
     is_started: bool = Field(description="Whether the session processor is started")
     is_processing: bool = Field(description="Whether a session is being processed")
+    latency: Optional[SessionProcessorLatency] = Field(
+        default=None, description="The enqueue-to-start latency of queue items"
+    )
 
 
 class CanceledException(Exception):
@@ -18,3 +37,67 @@ class ProgressImage(BaseModel):
     width: int = Field(description="The effective width of the image in pixels")
     height: int = Field(description="The effective height of the image in pixels")
     dataURL: str = Field(description="The image data as a b64 data URL")
+
+
+PROGRESS_IMAGE_FORMAT = Literal["data_url", "webp", "rgb", "none"]
+
+
+class ProgressPreviewSettings(BaseModel):
+    """The progress images a subscriber of a queue's events wants, sent with its `subscribe_queue` message.
+
+    With the `data_url` format, `progress_image` is a `ProgressImage`. With the `webp` and `rgb` formats, it holds the
+    effective `width` and `height`, the `image_width` and `image_height` of the preview itself, its `format`, and its
+    `data` as a binary attachment.
+    """
+
+    format: PROGRESS_IMAGE_FORMAT = Field(
+        default="data_url",
+        description="The format of progress images: a JPEG data URL, WebP or raw RGB bytes, or none",
+    )
+    max_size: Optional[int] = Field(
+        default=None, gt=0, description="The maximum width and height of progress images, in pixels"
+    )
+    max_per_second: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="The maximum number of progress images per second. Progress events in between have no image.",
+    )
+
+
+@dataclass
+class ProgressPreview:
+    """A progress image, encoded by the socket layer as requested by each subscriber."""
+
+    image: Image.Image
+    """The preview, at latent resolution"""
+    width: int
+    """The effective width of the image in pixels"""
+    height: int
+    """The effective height of the image in pixels"""
+
+    def encode(self, settings: ProgressPreviewSettings) -> Optional[dict[str, Any]]:
+        """Encodes the preview in the format and size of the settings."""
+        if settings.format == "none":
+            return None
+        image = self.image
+        if settings.max_size is not None and max(image.size) > settings.max_size:
+            image = image.copy()
+            image.thumbnail((settings.max_size, settings.max_size))
+        if settings.format == "data_url":
+            return ProgressImage(
+                width=self.width, height=self.height, dataURL=image_to_dataURL(image, image_format="JPEG")
+            ).model_dump()
+        if settings.format == "webp":
+            buffer = io.BytesIO()
+            image.save(buffer, format="WEBP")
+            data = buffer.getvalue()
+        else:
+            data = image.convert("RGB").tobytes()
+        return {
+            "width": self.width,
+            "height": self.height,
+            "image_width": image.width,
+            "image_height": image.height,
+            "format": settings.format,
+            "data": data,
+        }
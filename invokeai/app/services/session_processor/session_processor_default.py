@@ -1,97 +1,181 @@
 import traceback
 from contextlib import suppress
-from threading import BoundedSemaphore, Thread
+from datetime import datetime, timezone
+from threading import Condition, Lock, Thread
 from threading import Event as ThreadEvent
-from typing import Optional
+from typing import Optional, Union
 
 from fastapi_events.handlers.local import local_handler
 from fastapi_events.typing import Event as FastAPIEvent
 
-from invokeai.app.invocations.baseinvocation import BaseInvocation
+from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
 from invokeai.app.services.events.events_base import EventServiceBase
+from invokeai.app.services.invocation_cache.invocation_cache_common import get_object_references
 from invokeai.app.services.invocation_stats.invocation_stats_common import GESStatsNotFoundError
 from invokeai.app.services.session_processor.session_processor_common import CanceledException
 from invokeai.app.services.session_queue.session_queue_common import SessionQueueItem
 from invokeai.app.services.shared.invocation_context import InvocationContextData, build_invocation_context
+from invokeai.app.util.metrics import Histogram
 from invokeai.app.util.profiler import Profiler
 
 from ..invoker import Invoker
 from .session_processor_base import SessionProcessorBase
-from .session_processor_common import SessionProcessorStatus
+from .session_processor_common import SessionProcessorLatency, SessionProcessorStatus
+
+
+class SessionProcessorWorker:
+    """
+    A single worker in the session processor's pool.
+
+    Each worker runs in its own thread and dequeues and executes queue items independently of the other workers.
+    All per-item state - the current queue item and invocation, the cancel event and the profiler - lives here.
+    """
+
+    def __init__(self, name: str, profiler: Optional[Profiler]) -> None:
+        self.name = name
+        self.profiler = profiler
+        self.cancel_event = ThreadEvent()
+        self.queue_item: Optional[SessionQueueItem] = None
+        self.invocation: Optional[BaseInvocation] = None
+        self.thread: Optional[Thread] = None
 
 
 class DefaultSessionProcessor(SessionProcessorBase):
-    def start(self, invoker: Invoker, thread_limit: int = 1, polling_interval: int = 1) -> None:
+    def start(self, invoker: Invoker, polling_interval: int = 1) -> None:
         self._invoker: Invoker = invoker
-        self._queue_item: Optional[SessionQueueItem] = None
-        self._invocation: Optional[BaseInvocation] = None
 
         self._resume_event = ThreadEvent()
         self._stop_event = ThreadEvent()
-        self._poll_now_event = ThreadEvent()
-        self._cancel_event = ThreadEvent()
+
+        # Workers sleep on this condition when the queue is empty. The session queue notifies it directly whenever
+        # items are enqueued or change status, so idle workers wake immediately instead of on the next poll. The
+        # generation counter guards against lost wakeups between a worker finding the queue empty and going to sleep.
+        self._queue_changed = Condition()
+        self._queue_generation = 0
+
+        # Enqueue-to-start latency of the queue items executed by this processor
+        self._latency_lock = Lock()
+        self._latency_count = 0
+        self._latency_total = 0.0
+        self._latency_last: Optional[float] = None
+        self._latency_max: Optional[float] = None
+        self._wait_times = Histogram()
 
         local_handler.register(event_name=EventServiceBase.queue_event, _func=self._on_queue_event)
+        self._invoker.services.session_queue.on_changed(self._poll_now)
 
-        self._thread_limit = thread_limit
-        self._thread_semaphore = BoundedSemaphore(thread_limit)
         self._polling_interval = polling_interval
 
-        # If profiling is enabled, create a profiler. The same profiler will be used for all sessions. Internally,
-        # the profiler will create a new profile for each session.
-        self._profiler = (
-            Profiler(
-                logger=self._invoker.services.logger,
-                output_dir=self._invoker.services.configuration.profiles_path,
-                prefix=self._invoker.services.configuration.profile_prefix,
+        self._workers: list[SessionProcessorWorker] = []
+        for i in range(self._invoker.services.configuration.session_processor_workers):
+            # If profiling is enabled, create a profiler for this worker. The same profiler will be used for all
+            # sessions the worker executes. Internally, the profiler will create a new profile for each session.
+            profiler = (
+                Profiler(
+                    logger=self._invoker.services.logger,
+                    output_dir=self._invoker.services.configuration.profiles_path,
+                    prefix=self._invoker.services.configuration.profile_prefix,
+                )
+                if self._invoker.services.configuration.profile_graphs
+                else None
             )
-            if self._invoker.services.configuration.profile_graphs
-            else None
-        )
+            self._workers.append(SessionProcessorWorker(name=f"session_processor_{i}", profiler=profiler))
+
+        self._stop_event.clear()
+        self._resume_event.set()
+
+        for worker in self._workers:
+            worker.thread = Thread(
+                name=worker.name,
+                target=self._process,
+                kwargs={
+                    "worker": worker,
+                    "stop_event": self._stop_event,
+                    "resume_event": self._resume_event,
+                },
+            )
+            worker.thread.start()
 
-        self._thread = Thread(
-            name="session_processor",
-            target=self._process,
-            kwargs={
-                "stop_event": self._stop_event,
-                "poll_now_event": self._poll_now_event,
-                "resume_event": self._resume_event,
-                "cancel_event": self._cancel_event,
-            },
-        )
-        self._thread.start()
+        self._invoker.services.logger.debug(f"Started {len(self._workers)} session processor worker(s)")
 
     def stop(self, *args, **kwargs) -> None:
         self._stop_event.set()
+        # Wake any idle workers so they notice the stop event
+        self._poll_now()
 
     def _poll_now(self) -> None:
-        self._poll_now_event.set()
+        with self._queue_changed:
+            self._queue_generation += 1
+            self._queue_changed.notify_all()
+
+    def _wait_for_queue_change(self, generation: int, stop_event: ThreadEvent) -> None:
+        """Waits until the queue changes after the given generation, the processor is stopped, or the polling
+        interval elapses. The polling interval is only a fallback - changes are normally signaled directly."""
+        with self._queue_changed:
+            self._queue_changed.wait_for(
+                lambda: self._queue_generation != generation or stop_event.is_set(), timeout=self._polling_interval
+            )
+
+    def _record_latency(self, queue_item: SessionQueueItem) -> None:
+        """Records the time between a queue item being enqueued and its execution starting."""
+        created_at = _parse_queue_timestamp(queue_item.created_at)
+        started_at = (
+            _parse_queue_timestamp(queue_item.started_at)
+            if queue_item.started_at is not None
+            else datetime.now(timezone.utc).replace(tzinfo=None)
+        )
+        latency = max((started_at - created_at).total_seconds(), 0.0)
+        with self._latency_lock:
+            self._latency_count += 1
+            self._latency_total += latency
+            self._latency_last = latency
+            self._latency_max = latency if self._latency_max is None else max(self._latency_max, latency)
+        self._wait_times.observe(latency)
+        self._invoker.services.logger.debug(f"Queue item {queue_item.item_id} started {latency:.3f}s after enqueue")
+
+    def _pin_output_objects(self, session_id: str, output: BaseInvocationOutput) -> None:
+        """Keeps the tensors and conditioning referenced by a session's output until the session finishes. Outputs
+        reused from the invocation cache may reference objects the session never loads."""
+        for name, service in get_object_references(output).items():
+            if service == "tensors":
+                self._invoker.services.tensors.pin(name, session_id)
+            elif service == "conditioning":
+                self._invoker.services.conditioning.pin(name, session_id)
+
+    def _unpin_session_objects(self, session_id: str) -> None:
+        """Releases the tensors and conditioning kept for a session, once it no longer needs them. Unless they are used
+        elsewhere, they are then deleted if garbage collection is enabled."""
+        self._invoker.services.tensors.unpin(session_id)
+        self._invoker.services.conditioning.unpin(session_id)
+
+    def get_latency(self) -> SessionProcessorLatency:
+        """Gets the enqueue-to-start latency of the queue items executed by the processor"""
+        with self._latency_lock:
+            return SessionProcessorLatency(
+                count=self._latency_count,
+                last_seconds=self._latency_last,
+                mean_seconds=self._latency_total / self._latency_count if self._latency_count else None,
+                max_seconds=self._latency_max,
+            )
+
+    def get_wait_times(self) -> Histogram:
+        return self._wait_times
 
     async def _on_queue_event(self, event: FastAPIEvent) -> None:
+        # Enqueues and status changes wake the workers directly via the session queue's `on_changed` callback. Only
+        # cancellation needs to be handled here.
         event_name = event[1]["event"]
 
-        if (
-            event_name == "session_canceled"
-            and self._queue_item
-            and self._queue_item.item_id == event[1]["data"]["queue_item_id"]
-        ):
-            self._cancel_event.set()
-            self._poll_now()
-        elif (
-            event_name == "queue_cleared"
-            and self._queue_item
-            and self._queue_item.queue_id == event[1]["data"]["queue_id"]
-        ):
-            self._cancel_event.set()
-            self._poll_now()
-        elif event_name == "batch_enqueued":
-            self._poll_now()
-        elif event_name == "queue_item_status_changed" and event[1]["data"]["queue_item"]["status"] in [
-            "completed",
-            "failed",
-            "canceled",
-        ]:
-            self._poll_now()
+        if event_name == "session_canceled":
+            for worker in self._workers:
+                queue_item = worker.queue_item
+                if queue_item is not None and queue_item.item_id == event[1]["data"]["queue_item_id"]:
+                    worker.cancel_event.set()
+        elif event_name == "queue_cleared":
+            for worker in self._workers:
+                queue_item = worker.queue_item
+                if queue_item is not None and queue_item.queue_id == event[1]["data"]["queue_id"]:
+                    worker.cancel_event.set()
 
     def resume(self) -> SessionProcessorStatus:
         if not self._resume_event.is_set():
@@ -103,101 +187,131 @@ class DefaultSessionProcessor(SessionProcessorBase):
             self._resume_event.clear()
         return self.get_status()
 
+    def get_running_queue_item(self, item_id: int) -> Optional[SessionQueueItem]:
+        for worker in self._workers:
+            queue_item = worker.queue_item
+            if queue_item is not None and queue_item.item_id == item_id:
+                return queue_item
+        return None
+
     def get_status(self) -> SessionProcessorStatus:
         return SessionProcessorStatus(
             is_started=self._resume_event.is_set(),
-            is_processing=self._queue_item is not None,
+            is_processing=any(worker.queue_item is not None for worker in self._workers),
+            latency=self.get_latency(),
         )
 
     def _process(
         self,
+        worker: SessionProcessorWorker,
         stop_event: ThreadEvent,
-        poll_now_event: ThreadEvent,
         resume_event: ThreadEvent,
-        cancel_event: ThreadEvent,
     ):
+        cancel_event = worker.cancel_event
         # Outermost processor try block; any unhandled exception is a fatal processor error
         try:
-            self._thread_semaphore.acquire()
-            stop_event.clear()
-            resume_event.set()
             cancel_event.clear()
 
             while not stop_event.is_set():
-                poll_now_event.clear()
                 # Middle processor try block; any unhandled exception is a non-fatal processor error
                 try:
+                    # Forget the previous queue item, so that an error before the next one is dequeued does not cancel it
+                    worker.queue_item = None
+
                     # If we are paused, wait for resume event
                     resume_event.wait()
 
-                    # Get the next session to process
-                    self._queue_item = self._invoker.services.session_queue.dequeue()
+                    # Note the queue generation before dequeuing, so a change made while we are dequeuing wakes us
+                    with self._queue_changed:
+                        generation = self._queue_generation
+
+                    # Get the next session to process. Dequeuing claims the queue item atomically, so workers never
+                    # claim the same item.
+                    worker.queue_item = self._invoker.services.session_queue.dequeue()
 
-                    if self._queue_item is None:
-                        # The queue was empty, wait for next polling interval or event to try again
-                        self._invoker.services.logger.debug("Waiting for next polling interval or event")
-                        poll_now_event.wait(self._polling_interval)
+                    if worker.queue_item is None:
+                        # The queue was empty, wait for the queue to change before trying again
+                        self._invoker.services.logger.debug("Waiting for next queue change")
+                        self._wait_for_queue_change(generation, stop_event)
                         continue
 
-                    self._invoker.services.logger.debug(f"Executing queue item {self._queue_item.item_id}")
+                    self._record_latency(worker.queue_item)
+                    # A session resumed from a checkpoint already has results
+                    for output in worker.queue_item.session.results.values():
+                        self._pin_output_objects(worker.queue_item.session_id, output)
+                    self._invoker.services.logger.debug(
+                        f"Executing queue item {worker.queue_item.item_id} on worker {worker.name}"
+                    )
                     cancel_event.clear()
 
                     # If profiling is enabled, start the profiler
-                    if self._profiler is not None:
-                        self._profiler.start(profile_id=self._queue_item.session_id)
+                    if worker.profiler is not None:
+                        worker.profiler.start(profile_id=worker.queue_item.session_id)
 
                     # Prepare invocations and take the first
-                    self._invocation = self._queue_item.session.next()
+                    worker.invocation = worker.queue_item.session.next()
 
                     # Loop over invocations until the session is complete or canceled
-                    while self._invocation is not None and not cancel_event.is_set():
+                    while worker.invocation is not None and not cancel_event.is_set():
                         # get the source node id to provide to clients (the prepared node id is not as useful)
-                        source_invocation_id = self._queue_item.session.prepared_source_mapping[self._invocation.id]
+                        source_invocation_id = worker.queue_item.session.prepared_source_mapping[worker.invocation.id]
 
                         # Send starting event
                         self._invoker.services.events.emit_invocation_started(
-                            queue_batch_id=self._queue_item.batch_id,
-                            queue_item_id=self._queue_item.item_id,
-                            queue_id=self._queue_item.queue_id,
-                            graph_execution_state_id=self._queue_item.session_id,
-                            node=self._invocation.model_dump(),
+                            queue_batch_id=worker.queue_item.batch_id,
+                            queue_item_id=worker.queue_item.item_id,
+                            queue_id=worker.queue_item.queue_id,
+                            graph_execution_state_id=worker.queue_item.session_id,
+                            node=worker.invocation,
                             source_node_id=source_invocation_id,
                         )
 
                         # Innermost processor try block; any unhandled exception is an invocation error & will fail the graph
                         try:
                             with self._invoker.services.performance_statistics.collect_stats(
-                                self._invocation, self._queue_item.session.id
+                                worker.invocation, worker.queue_item.session.id
                             ):
                                 # Build invocation context (the node-facing API)
                                 data = InvocationContextData(
-                                    invocation=self._invocation,
+                                    invocation=worker.invocation,
                                     source_invocation_id=source_invocation_id,
-                                    queue_item=self._queue_item,
+                                    queue_item=worker.queue_item,
                                 )
                                 context = build_invocation_context(
                                     data=data,
                                     services=self._invoker.services,
-                                    cancel_event=self._cancel_event,
+                                    cancel_event=worker.cancel_event,
                                 )
 
                                 # Invoke the node
-                                outputs = self._invocation.invoke_internal(
+                                outputs = worker.invocation.invoke_internal(
                                     context=context, services=self._invoker.services
                                 )
 
                                 # Save outputs and history
-                                self._queue_item.session.complete(self._invocation.id, outputs)
+                                worker.queue_item.session.complete(worker.invocation.id, outputs)
+                                self._pin_output_objects(worker.queue_item.session_id, outputs)
+
+                                # Checkpoint the session, so it resumes from this node after a restart
+                                if self._invoker.services.configuration.session_checkpoints:
+                                    # The checkpoint may only reference images, tensors and conditioning that are on
+                                    # disk, including intermediate images otherwise only written once they are viewed
+                                    self._invoker.services.image_files.flush()
+                                    self._invoker.services.tensors.flush()
+                                    self._invoker.services.conditioning.flush()
+                                    self._invoker.services.session_queue.set_queue_item_session(
+                                        worker.queue_item.item_id, worker.queue_item.session
+                                    )
 
                                 # Send complete event
                                 self._invoker.services.events.emit_invocation_complete(
-                                    queue_batch_id=self._queue_item.batch_id,
-                                    queue_item_id=self._queue_item.item_id,
-                                    queue_id=self._queue_item.queue_id,
-                                    graph_execution_state_id=self._queue_item.session.id,
-                                    node=self._invocation.model_dump(),
+                                    queue_batch_id=worker.queue_item.batch_id,
+                                    queue_item_id=worker.queue_item.item_id,
+                                    queue_id=worker.queue_item.queue_id,
+                                    graph_execution_state_id=worker.queue_item.session.id,
+                                    node=worker.invocation,
                                     source_node_id=source_invocation_id,
-                                    result=outputs.model_dump(),
+                                    result=outputs,
                                 )
 
                         except KeyboardInterrupt:
@@ -221,19 +335,19 @@ class DefaultSessionProcessor(SessionProcessorBase):
                             error = traceback.format_exc()
 
                             # Save error
-                            self._queue_item.session.set_node_error(self._invocation.id, error)
+                            worker.queue_item.session.set_node_error(worker.invocation.id, error)
                             self._invoker.services.logger.error(
-                                f"Error while invoking session {self._queue_item.session_id}, invocation {self._invocation.id} ({self._invocation.get_type()}):\n{e}"
+                                f"Error while invoking session {worker.queue_item.session_id}, invocation {worker.invocation.id} ({worker.invocation.get_type()}):\n{e}"
                             )
                             self._invoker.services.logger.error(error)
 
                             # Send error event
                             self._invoker.services.events.emit_invocation_error(
-                                queue_batch_id=self._queue_item.session_id,
-                                queue_item_id=self._queue_item.item_id,
-                                queue_id=self._queue_item.queue_id,
-                                graph_execution_state_id=self._queue_item.session.id,
-                                node=self._invocation.model_dump(),
+                                queue_batch_id=worker.queue_item.session_id,
+                                queue_item_id=worker.queue_item.item_id,
+                                queue_id=worker.queue_item.queue_id,
+                                graph_execution_state_id=worker.queue_item.session.id,
+                                node=worker.invocation,
                                 source_node_id=source_invocation_id,
                                 error_type=e.__class__.__name__,
                                 error=error,
@@ -241,58 +355,63 @@ class DefaultSessionProcessor(SessionProcessorBase):
                             pass
 
                         # The session is complete if the all invocations are complete or there was an error
-                        if self._queue_item.session.is_complete() or cancel_event.is_set():
+                        if worker.queue_item.session.is_complete() or cancel_event.is_set():
                             # Send complete event
                             self._invoker.services.events.emit_graph_execution_complete(
-                                queue_batch_id=self._queue_item.batch_id,
-                                queue_item_id=self._queue_item.item_id,
-                                queue_id=self._queue_item.queue_id,
-                                graph_execution_state_id=self._queue_item.session.id,
+                                queue_batch_id=worker.queue_item.batch_id,
+                                queue_item_id=worker.queue_item.item_id,
+                                queue_id=worker.queue_item.queue_id,
+                                graph_execution_state_id=worker.queue_item.session.id,
                             )
                             # If we are profiling, stop the profiler and dump the profile & stats
-                            if self._profiler:
-                                profile_path = self._profiler.stop()
+                            if worker.profiler:
+                                profile_path = worker.profiler.stop()
                                 stats_path = profile_path.with_suffix(".json")
                                 self._invoker.services.performance_statistics.dump_stats(
-                                    graph_execution_state_id=self._queue_item.session.id, output_path=stats_path
+                                    graph_execution_state_id=worker.queue_item.session.id, output_path=stats_path
                                 )
                             # We'll get a GESStatsNotFoundError if we try to log stats for an untracked graph, but in the processor
                             # we don't care about that - suppress the error.
                             with suppress(GESStatsNotFoundError):
-                                self._invoker.services.performance_statistics.log_stats(self._queue_item.session.id)
-                                self._invoker.services.performance_statistics.reset_stats()
+                                self._invoker.services.performance_statistics.log_stats(worker.queue_item.session.id)
+                                self._invoker.services.performance_statistics.reset_stats(worker.queue_item.session.id)
+
+                            self._unpin_session_objects(worker.queue_item.session_id)
 
                             # Set the invocation to None to prepare for the next session
-                            self._invocation = None
+                            worker.invocation = None
                         else:
                             # Prepare the next invocation
-                            self._invocation = self._queue_item.session.next()
-                    else:
-                        # The queue was empty, wait for next polling interval or event to try again
-                        self._invoker.services.logger.debug("Waiting for next polling interval or event")
-                        poll_now_event.wait(self._polling_interval)
-                        continue
+                            worker.invocation = worker.queue_item.session.next()
                 except Exception:
                     # Non-fatal error in processor
                     self._invoker.services.logger.error(
                         f"Non-fatal error in session processor:\n{traceback.format_exc()}"
                     )
                     # Cancel the queue item
-                    if self._queue_item is not None:
+                    if worker.queue_item is not None:
+                        self._unpin_session_objects(worker.queue_item.session_id)
                         self._invoker.services.session_queue.cancel_queue_item(
-                            self._queue_item.item_id, error=traceback.format_exc()
+                            worker.queue_item.item_id, error=traceback.format_exc()
                         )
                     # Reset the invocation to None to prepare for the next session
-                    self._invocation = None
-                    # Immediately poll for next queue item
-                    poll_now_event.wait(self._polling_interval)
+                    worker.invocation = None
+                    # Wait before polling for the next queue item, so a persistent error doesn't spin the worker
+                    stop_event.wait(self._polling_interval)
                     continue
         except Exception:
             # Fatal error in processor, log and pass - we're done here
-            self._invoker.services.logger.error(f"Fatal Error in session processor:\n{traceback.format_exc()}")
+            self._invoker.services.logger.error(
+                f"Fatal Error in session processor worker {worker.name}:\n{traceback.format_exc()}"
+            )
             pass
         finally:
-            stop_event.clear()
-            poll_now_event.clear()
-            self._queue_item = None
-            self._thread_semaphore.release()
+            worker.queue_item = None
+            worker.invocation = None
+
+
+def _parse_queue_timestamp(value: Union[datetime, str]) -> datetime:
+    """Parses a session queue timestamp. SQLite stores these as naive UTC strings."""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.fromisoformat(value)
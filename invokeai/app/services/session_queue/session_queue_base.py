@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Callable, Optional
 
 from invokeai.app.services.session_queue.session_queue_common import (
     QUEUE_ITEM_STATUS,
@@ -16,12 +16,30 @@ from invokeai.app.services.session_queue.session_queue_common import (
     SessionQueueItemDTO,
     SessionQueueStatus,
 )
+from invokeai.app.services.shared.graph import GraphExecutionState
 from invokeai.app.services.shared.pagination import CursorPaginatedResults
 
 
 class SessionQueueBase(ABC):
     """Base class for session queue"""
 
+    def __init__(self) -> None:
+        self._on_changed_callbacks: list[Callable[[], None]] = []
+
+    def on_changed(self, on_changed: Callable[[], None]) -> None:
+        """
+        Register a callback for when queue items are enqueued or change status.
+
+        Callbacks are called synchronously, on the thread that made the change, so they must be cheap and must not
+        call back into the queue. They are intended to wake the session processor without a round trip through the
+        event loop.
+        """
+        self._on_changed_callbacks.append(on_changed)
+
+    def _on_changed(self) -> None:
+        for callback in self._on_changed_callbacks:
+            callback()
+
     @abstractmethod
     def dequeue(self) -> Optional[SessionQueueItem]:
         """Dequeues the next session queue item."""
@@ -32,9 +50,15 @@ class SessionQueueBase(ABC):
         """Enqueues all permutations of a batch for execution."""
         pass
 
+    @abstractmethod
+    def set_queue_item_session(self, item_id: int, session: GraphExecutionState) -> None:
+        """Persists the progress of a queue item's session, so that it can be resumed after a restart"""
+        pass
+
     @abstractmethod
     def get_current(self, queue_id: str) -> Optional[SessionQueueItem]:
-        """Gets the currently-executing session queue item"""
+        """Gets the first session queue item in progress, in queue order. With several session processor workers,
+        other queue items may be in progress too."""
         pass
 
     @abstractmethod
@@ -67,6 +91,12 @@ class SessionQueueBase(ABC):
         """Gets the status of the queue"""
         pass
 
+    @abstractmethod
+    def get_queue_status_counts(self, queue_id: str) -> dict[str, int]:
+        """Gets the number of queue items by status. Statuses without queue items may be omitted. Cheaper than
+        get_queue_status, as the current queue item is not looked up."""
+        pass
+
     @abstractmethod
     def get_batch_status(self, queue_id: str, batch_id: str) -> BatchStatus:
         """Gets the status of a batch"""
@@ -1,7 +1,7 @@
 import datetime
 import json
 from itertools import chain, product
-from typing import Generator, Iterable, Literal, NamedTuple, Optional, TypeAlias, Union, cast
+from typing import Any, Generator, Iterable, Literal, NamedTuple, Optional, TypeAlias, Union, cast
 
 from pydantic import BaseModel, ConfigDict, Field, StrictStr, TypeAdapter, field_validator, model_validator
 from pydantic_core import to_jsonable_python
@@ -29,6 +29,10 @@ class BatchDuplicateNodeFieldError(ValueError):
     """Raise when a batch has duplicate node_path and field_name."""
 
 
+class BatchItemValueError(ValueError):
+    """Raise when a batch has an item that is not a valid value for its node's field."""
+
+
 class TooManySessionsError(ValueError):
     """Raise when too many sessions are requested."""
 
@@ -128,6 +132,16 @@ class Batch(BaseModel):
                     raise NodeNotFoundError(f"Node {batch_data.node_path} not found in graph")
                 if batch_data.field_name not in node.model_fields:
                     raise NodeNotFoundError(f"Field {batch_data.field_name} not found in node {batch_data.node_path}")
+                # Sessions are only built when their queue item is dequeued - apply each distinct item to a copy of the
+                # node now, so that an invalid item fails the enqueue rather than its queue item
+                node_copy = node.model_copy()
+                for item in dict.fromkeys(batch_data.items):
+                    try:
+                        setattr(node_copy, batch_data.field_name, item)
+                    except ValueError as e:
+                        raise BatchItemValueError(
+                            f"Invalid item {item!r} for field {batch_data.field_name} of node {batch_data.node_path}: {e}"
+                        )
         return values
 
     @field_validator("graph")
@@ -163,11 +177,17 @@ def get_field_values(queue_item_dict: dict) -> Optional[list[NodeFieldValue]]:
 
 
 GraphExecutionStateValidator = TypeAdapter(GraphExecutionState)
+GraphValidator = TypeAdapter(Graph)
 
 
 def get_session(queue_item_dict: dict) -> GraphExecutionState:
-    session_raw = queue_item_dict.get("session", "{}")
-    session = GraphExecutionStateValidator.validate_json(session_raw, strict=False)
+    session_raw = queue_item_dict.get("session", None)
+    if session_raw is None and queue_item_dict.get("batch_graph", None) is not None:
+        # the session is materialized from the batch's graph and this item's field values
+        graph = GraphValidator.validate_json(queue_item_dict["batch_graph"], strict=False)
+        apply_node_field_values(graph, queue_item_dict.get("field_values", None) or [])
+        return GraphExecutionState(id=queue_item_dict["session_id"], graph=graph)
+    session = GraphExecutionStateValidator.validate_json(session_raw or "{}", strict=False)
     return session
 
 
@@ -226,6 +246,13 @@ class SessionQueueItemDTO(SessionQueueItemWithoutGraph):
     pass
 
 
+class SessionQueueItemNode(BaseModel):
+    """A node of a queue item's session, and its output if it has completed"""
+
+    node: dict[str, Any] = Field(description="The node")
+    result: Optional[dict[str, Any]] = Field(default=None, description="The output of the node, if it has completed")
+
+
 class SessionQueueItem(SessionQueueItemWithoutGraph):
     session: GraphExecutionState = Field(description="The fully-populated session to be executed")
     workflow: Optional[WorkflowWithoutID] = Field(
@@ -265,9 +292,12 @@ class SessionQueueItem(SessionQueueItemWithoutGraph):
 
 class SessionQueueStatus(BaseModel):
     queue_id: str = Field(..., description="The ID of the queue")
-    item_id: Optional[int] = Field(description="The current queue item id")
-    batch_id: Optional[str] = Field(description="The current queue item's batch id")
-    session_id: Optional[str] = Field(description="The current queue item's session id")
+    item_id: Optional[int] = Field(
+        description="The id of the first queue item in progress, in queue order. With several session processor "
+        "workers, other queue items may be in progress too, see `in_progress`."
+    )
+    batch_id: Optional[str] = Field(description="The batch id of the first queue item in progress")
+    session_id: Optional[str] = Field(description="The session id of the first queue item in progress")
     pending: int = Field(..., description="Number of queue items with status 'pending'")
     in_progress: int = Field(..., description="Number of queue items with status 'in_progress'")
     completed: int = Field(..., description="Number of queue items with status 'complete'")
@@ -337,17 +367,24 @@ class IsFullResult(BaseModel):
 # region Util
 
 
-def populate_graph(graph: Graph, node_field_values: Iterable[NodeFieldValue]) -> Graph:
+def apply_node_field_values(graph: Graph, node_field_values: Iterable[NodeFieldValue]) -> None:
     """
-    Populates the given graph with the given batch data items.
+    Applies the given batch data items to the given graph, in place.
     """
-    graph_clone = graph.model_copy(deep=True)
     for item in node_field_values:
-        node = graph_clone.get_node(item.node_path)
+        node = graph.get_node(item.node_path)
         if node is None:
             continue
         setattr(node, item.field_name, item.value)
-        graph_clone.update_node(item.node_path, node)
+        graph.update_node(item.node_path, node)
+
+
+def populate_graph(graph: Graph, node_field_values: Iterable[NodeFieldValue]) -> Graph:
+    """
+    Populates the given graph with the given batch data items.
+    """
+    graph_clone = graph.model_copy(deep=True)
+    apply_node_field_values(graph_clone, node_field_values)
     return graph_clone
 
 
@@ -359,6 +396,15 @@ def create_session_nfv_tuples(
     of the form (graph, batch_data_items) where batch_data_items is the list of BatchDataItems
     that was applied to the graph.
     """
+    for flat_node_field_values in create_nfv_lists(batch, maximum):
+        graph = populate_graph(batch.graph, flat_node_field_values)
+        yield (GraphExecutionState(graph=graph), flat_node_field_values, batch.workflow)
+
+
+def create_nfv_lists(batch: Batch, maximum: int) -> Generator[list[NodeFieldValue], None, None]:
+    """
+    Create the batch data items for each graph permutation of the given batch, without creating the graphs.
+    """
 
     # TODO: Should this be a class method on Batch?
 
@@ -376,15 +422,13 @@ def create_session_nfv_tuples(
             node_field_values_to_zip.append(node_field_values)
         data.append(list(zip(*node_field_values_to_zip, strict=True)))  # type: ignore [arg-type]
 
-    # create generator to yield session,nfv tuples
+    # create generator to yield nfv lists
     count = 0
     for _ in range(batch.runs):
         for d in product(*data):
             if count >= maximum:
                 return
-            flat_node_field_values = list(chain.from_iterable(d))
-            graph = populate_graph(batch.graph, flat_node_field_values)
-            yield (GraphExecutionState(graph=graph), flat_node_field_values, batch.workflow)
+            yield list(chain.from_iterable(d))
             count += 1
 
 
@@ -396,15 +440,11 @@ def calc_session_count(batch: Batch) -> int:
     # TODO: Should this be a class method on Batch?
     if not batch.data:
         return batch.runs
-    data = []
+    count = batch.runs
     for batch_datum_list in batch.data:
-        to_zip = []
-        for batch_datum in batch_datum_list:
-            batch_data_items = range(len(batch_datum.items))
-            to_zip.append(batch_data_items)
-        data.append(list(zip(*to_zip, strict=True)))
-    data_product = list(product(*data))
-    return len(data_product) * batch.runs
+        # zipped batch data all have the same length, which the batch validates
+        count *= len(batch_datum_list[0].items) if batch_datum_list else 0
+    return count
 
 
 class SessionQueueValueToInsert(NamedTuple):
@@ -412,7 +452,7 @@ class SessionQueueValueToInsert(NamedTuple):
 
     # Careful with the ordering of this - it must match the insert statement
     queue_id: str  # queue_id
-    session: str  # session json
+    session: Optional[str]  # session json, None if materialized from the batch graph
     session_id: str  # session_id
     batch_id: str  # batch_id
     field_values: Optional[str]  # field_values json
@@ -423,24 +463,57 @@ class SessionQueueValueToInsert(NamedTuple):
 ValuesToInsert: TypeAlias = list[SessionQueueValueToInsert]
 
 
-def prepare_values_to_insert(queue_id: str, batch: Batch, priority: int, max_new_queue_items: int) -> ValuesToInsert:
-    values_to_insert: ValuesToInsert = []
-    for session, field_values, workflow in create_session_nfv_tuples(batch, max_new_queue_items):
+class SessionQueueBatchToInsert(NamedTuple):
+    """A tuple of values to insert into the session_queue_batches table"""
+
+    # Careful with the ordering of this - it must match the insert statement
+    batch_id: str  # batch_id
+    graph: str  # graph json
+    workflow: Optional[str]  # workflow json
+
+
+def prepare_batch_to_insert(batch: Batch) -> SessionQueueBatchToInsert:
+    return SessionQueueBatchToInsert(
+        batch.batch_id,  # batch_id
+        batch.graph.model_dump_json(warnings=False, exclude_none=True),  # graph (json)
+        json.dumps(batch.workflow, default=to_jsonable_python) if batch.workflow else None,  # workflow (json)
+    )
+
+
+def iter_values_to_insert(
+    queue_id: str, batch: Batch, priority: int, max_new_queue_items: int, with_sessions: bool = False
+) -> Generator[SessionQueueValueToInsert, None, None]:
+    """
+    Lazily creates the values to insert for each session of the batch, up to `max_new_queue_items`.
+
+    By default, only each session's field values are stored - the batch's graph and workflow are stored once (see
+    `prepare_batch_to_insert`) and sessions are materialized from them when read. With `with_sessions`, each session
+    and the workflow are serialized in full, one session at a time.
+    """
+    workflow_json = json.dumps(batch.workflow, default=to_jsonable_python) if batch.workflow and with_sessions else None
+    for field_values in create_nfv_lists(batch, max_new_queue_items):
         # sessions must have unique id
-        session.id = uuid_string()
-        values_to_insert.append(
-            SessionQueueValueToInsert(
-                queue_id,  # queue_id
-                session.model_dump_json(warnings=False, exclude_none=True),  # session (json)
-                session.id,  # session_id
-                batch.batch_id,  # batch_id
-                # must use pydantic_encoder bc field_values is a list of models
-                json.dumps(field_values, default=to_jsonable_python) if field_values else None,  # field_values (json)
-                priority,  # priority
-                json.dumps(workflow, default=to_jsonable_python) if workflow else None,  # workflow (json)
-            )
+        session_id = uuid_string()
+        session_json = None
+        if with_sessions:
+            session = GraphExecutionState(id=session_id, graph=populate_graph(batch.graph, field_values))
+            session_json = session.model_dump_json(warnings=False, exclude_none=True)
+        yield SessionQueueValueToInsert(
+            queue_id,  # queue_id
+            session_json,  # session (json)
+            session_id,  # session_id
+            batch.batch_id,  # batch_id
+            # must use pydantic_encoder bc field_values is a list of models
+            json.dumps(field_values, default=to_jsonable_python) if field_values else None,  # field_values (json)
+            priority,  # priority
+            workflow_json,  # workflow (json)
         )
-    return values_to_insert
+
+
+def prepare_values_to_insert(
+    queue_id: str, batch: Batch, priority: int, max_new_queue_items: int, with_sessions: bool = False
+) -> ValuesToInsert:
+    return list(iter_values_to_insert(queue_id, batch, priority, max_new_queue_items, with_sessions))
 
 
 # endregion Util
@@ -1,6 +1,8 @@
 import sqlite3
 import threading
-from typing import Optional, Union, cast
+import traceback
+from itertools import islice
+from typing import Any, Optional, Union, cast
 
 from fastapi_events.handlers.local import local_handler
 from fastapi_events.typing import Event as FastAPIEvent
@@ -20,16 +22,49 @@ from invokeai.app.services.session_queue.session_queue_common import (
     IsEmptyResult,
     IsFullResult,
     PruneResult,
+    SessionQueueBatchToInsert,
     SessionQueueItem,
     SessionQueueItemDTO,
     SessionQueueItemNotFoundError,
+    SessionQueueItemWithoutGraph,
     SessionQueueStatus,
     calc_session_count,
-    prepare_values_to_insert,
+    iter_values_to_insert,
+    prepare_batch_to_insert,
 )
+from invokeai.app.services.shared.graph import GraphExecutionState
 from invokeai.app.services.shared.pagination import CursorPaginatedResults
 from invokeai.app.services.shared.sqlite.sqlite_database import SqliteDatabase
 
+ENQUEUE_CHUNK_SIZE = 100
+"""The number of queue items to create and insert at a time when enqueuing a batch"""
+
+SELECT_QUEUE_ITEMS = """--sql
+    SELECT
+      session_queue.item_id,
+      session_queue.status,
+      session_queue.priority,
+      session_queue.batch_id,
+      session_queue.session_id,
+      session_queue.error,
+      session_queue.created_at,
+      session_queue.updated_at,
+      session_queue.started_at,
+      session_queue.completed_at,
+      session_queue.queue_id,
+      session_queue.field_values,
+      session_queue.session,
+      COALESCE(session_queue.workflow, session_queue_batches.workflow) AS workflow,
+      session_queue_batches.graph AS batch_graph
+    FROM session_queue
+    LEFT JOIN session_queue_batches ON session_queue_batches.batch_id = session_queue.batch_id
+    """
+"""Selects full queue items, along with their batch's graph and workflow. Append a WHERE clause as needed."""
+
+SQLITE_SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+"""Whether SQLite supports `RETURNING`, which claims queue items in a single statement. Older versions claim them with a
+SELECT followed by a conditional UPDATE."""
+
 
 class SqliteSessionQueue(SessionQueueBase):
     __invoker: Invoker
@@ -39,7 +74,10 @@ class SqliteSessionQueue(SessionQueueBase):
 
     def start(self, invoker: Invoker) -> None:
         self.__invoker = invoker
-        self._set_in_progress_to_canceled()
+        if self.__invoker.services.configuration.session_checkpoints:
+            self._set_in_progress_to_pending(self.__invoker.services.configuration.session_max_resumes)
+        else:
+            self._set_in_progress_to_canceled()
         prune_result = self.prune(DEFAULT_QUEUE_ID)
         local_handler.register(event_name=EventServiceBase.queue_event, _func=self._on_session_event)
         if prune_result.deleted > 0:
@@ -117,6 +155,37 @@ class SqliteSessionQueue(SessionQueueBase):
         finally:
             self.__lock.release()
 
+    def _set_in_progress_to_pending(self, max_resumes: int) -> None:
+        """
+        Sets all in_progress queue items back to pending, so they are dequeued again and resume from their last
+        checkpoint. Run on app startup instead of `_set_in_progress_to_canceled` when session checkpoints are enabled.
+
+        Items that were already resumed `max_resumes` times are set to failed instead.
+        """
+        try:
+            self.__lock.acquire()
+            self.__cursor.execute(
+                """--sql
+                UPDATE session_queue
+                SET status = 'failed', error = ?
+                WHERE status = 'in_progress' AND resume_count >= ?;
+                """,
+                (f"Interrupted after being resumed {max_resumes} times", max_resumes),
+            )
+            self.__cursor.execute(
+                """--sql
+                UPDATE session_queue
+                SET status = 'pending', resume_count = resume_count + 1
+                WHERE status = 'in_progress';
+                """
+            )
+            self.__conn.commit()
+        except Exception:
+            self.__conn.rollback()
+            raise
+        finally:
+            self.__lock.release()
+
     def _get_current_queue_size(self, queue_id: str) -> int:
         """Gets the current number of pending queue items"""
         self.__cursor.execute(
@@ -145,6 +214,23 @@ class SqliteSessionQueue(SessionQueueBase):
         )
         return cast(Union[int, None], self.__cursor.fetchone()[0]) or 0
 
+    def _is_batch_stored(self, batch_to_insert: SessionQueueBatchToInsert) -> bool:
+        """Checks if the batch is stored with the given graph and workflow"""
+        self.__cursor.execute(
+            """--sql
+            SELECT graph, workflow
+            FROM session_queue_batches
+            WHERE batch_id = ?
+            """,
+            (batch_to_insert.batch_id,),
+        )
+        result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
+        return (
+            result is not None
+            and result["graph"] == batch_to_insert.graph
+            and result["workflow"] == batch_to_insert.workflow
+        )
+
     def enqueue_batch(self, queue_id: str, batch: Batch, prepend: bool) -> EnqueueBatchResult:
         try:
             self.__lock.acquire()
@@ -159,30 +245,57 @@ class SqliteSessionQueue(SessionQueueBase):
                 priority = self._get_highest_priority(queue_id) + 1
 
             requested_count = calc_session_count(batch)
-            values_to_insert = prepare_values_to_insert(
+            enqueued_count = 0
+
+            # The batch's graph and workflow are stored once, and each queue item stores only its field values
+            batch_to_insert = prepare_batch_to_insert(batch)
+            self.__cursor.execute(
+                """--sql
+                INSERT INTO session_queue_batches (batch_id, graph, workflow)
+                VALUES (?, ?, ?)
+                ON CONFLICT (batch_id) DO NOTHING
+                """,
+                batch_to_insert,
+            )
+            # A batch ID that is already in the queue with a different graph or workflow must not change the sessions
+            # of the existing items, so the sessions of this batch are stored in full instead
+            with_sessions = self.__cursor.rowcount == 0 and not self._is_batch_stored(batch_to_insert)
+
+            # Queue items are created lazily and inserted in chunks, so only a chunk is ever held in memory
+            values_to_insert = iter_values_to_insert(
                 queue_id=queue_id,
                 batch=batch,
                 priority=priority,
                 max_new_queue_items=max_new_queue_items,
+                with_sessions=with_sessions,
             )
-            enqueued_count = len(values_to_insert)
-
-            if requested_count > enqueued_count:
-                values_to_insert = values_to_insert[:max_new_queue_items]
-
-            self.__cursor.executemany(
-                """--sql
-                INSERT INTO session_queue (queue_id, session, session_id, batch_id, field_values, priority, workflow)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                values_to_insert,
-            )
+            while chunk := list(islice(values_to_insert, ENQUEUE_CHUNK_SIZE)):
+                self.__cursor.executemany(
+                    """--sql
+                    INSERT INTO session_queue (queue_id, session, session_id, batch_id, field_values, priority, workflow)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    chunk,
+                )
+                enqueued_count += len(chunk)
+            if enqueued_count == 0:
+                # The queue is full - don't leave the batch behind without any queue items
+                self.__cursor.execute(
+                    """--sql
+                    DELETE FROM session_queue_batches
+                    WHERE
+                      batch_id = ?
+                      AND NOT EXISTS (SELECT 1 FROM session_queue WHERE batch_id = ?)
+                    """,
+                    (batch.batch_id, batch.batch_id),
+                )
             self.__conn.commit()
         except Exception:
             self.__conn.rollback()
             raise
         finally:
             self.__lock.release()
+        self._on_changed()
         enqueue_result = EnqueueBatchResult(
             queue_id=queue_id,
             requested=requested_count,
@@ -193,12 +306,52 @@ class SqliteSessionQueue(SessionQueueBase):
         self.__invoker.services.events.emit_batch_enqueued(enqueue_result)
         return enqueue_result
 
-    def dequeue(self) -> Optional[SessionQueueItem]:
-        try:
-            self.__lock.acquire()
+    def _claim_next_queue_item(self) -> Optional[dict[str, Any]]:
+        """Sets the next pending queue item in progress, so that concurrent workers can never claim the same item.
+        Returns the claimed item's row. Must be called with the lock held."""
+        if SQLITE_SUPPORTS_RETURNING:
+            # `started_at` and `updated_at` are set explicitly because RETURNING does not reflect changes made by
+            # triggers
+            self.__cursor.execute(
+                """--sql
+                UPDATE session_queue
+                SET
+                  status = 'in_progress',
+                  started_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'),
+                  updated_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')
+                WHERE item_id = (
+                  SELECT item_id
+                  FROM session_queue
+                  WHERE status = 'pending'
+                  ORDER BY
+                    priority DESC,
+                    item_id ASC
+                  LIMIT 1
+                )
+                RETURNING
+                  item_id,
+                  status,
+                  priority,
+                  batch_id,
+                  session_id,
+                  error,
+                  created_at,
+                  updated_at,
+                  started_at,
+                  completed_at,
+                  queue_id,
+                  field_values,
+                  session,
+                  workflow
+                """
+            )
+            result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
+            return dict(result) if result is not None else None
+
+        while True:
             self.__cursor.execute(
                 """--sql
-                SELECT *
+                SELECT item_id
                 FROM session_queue
                 WHERE status = 'pending'
                 ORDER BY
@@ -208,30 +361,108 @@ class SqliteSessionQueue(SessionQueueBase):
                 """
             )
             result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
+            if result is None:
+                return None
+            item_id = cast(int, result["item_id"])
+            self.__cursor.execute(
+                """--sql
+                UPDATE session_queue
+                SET status = 'in_progress'
+                WHERE
+                  item_id = ?
+                  AND status = 'pending'
+                """,
+                (item_id,),
+            )
+            # Unless another connection claimed the item in the meantime
+            if self.__cursor.rowcount == 1:
+                break
+        self.__cursor.execute(f"{SELECT_QUEUE_ITEMS} WHERE session_queue.item_id = ?", (item_id,))
+        return dict(cast(sqlite3.Row, self.__cursor.fetchone()))
+
+    def dequeue(self) -> Optional[SessionQueueItem]:
+        while True:
+            queue_item_dict = self._claim_next_queue_item_with_graph()
+            if queue_item_dict is None:
+                return None
+            self._on_changed()
+            try:
+                queue_item = SessionQueueItem.queue_item_from_dict(queue_item_dict)
+            except Exception:
+                # The item's session cannot be built. Fail it rather than leaving it in progress, and move on.
+                error = traceback.format_exc()
+                self.__invoker.services.logger.error(
+                    f"Failed to build the session of queue item {queue_item_dict['item_id']}:\n{error}"
+                )
+                self._fail_unbuildable_queue_item(queue_item_dict["item_id"], error)
+                continue
+            self._emit_queue_item_status_changed(queue_item)
+            return queue_item
+
+    def _claim_next_queue_item_with_graph(self) -> Optional[dict[str, Any]]:
+        """Claims the next queue item, along with its batch's graph and workflow."""
+        try:
+            self.__lock.acquire()
+            queue_item_dict = self._claim_next_queue_item()
+            self.__conn.commit()
+            if (
+                queue_item_dict is not None
+                and queue_item_dict["session"] is None
+                and "batch_graph" not in queue_item_dict
+            ):
+                # RETURNING cannot join, so get the batch's graph and workflow to materialize the session separately
+                self.__cursor.execute(
+                    """--sql
+                    SELECT graph, workflow
+                    FROM session_queue_batches
+                    WHERE batch_id = ?
+                    """,
+                    (queue_item_dict["batch_id"],),
+                )
+                batch_result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
+                if batch_result is not None:
+                    queue_item_dict["batch_graph"] = batch_result["graph"]
+                    queue_item_dict["workflow"] = queue_item_dict["workflow"] or batch_result["workflow"]
         except Exception:
             self.__conn.rollback()
             raise
         finally:
             self.__lock.release()
-        if result is None:
-            return None
-        queue_item = SessionQueueItem.queue_item_from_dict(dict(result))
-        queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="in_progress")
-        return queue_item
+        return queue_item_dict
 
-    def get_next(self, queue_id: str) -> Optional[SessionQueueItem]:
+    def _fail_unbuildable_queue_item(self, item_id: int, error: str) -> None:
+        """Fails a queue item whose session cannot be built. Unlike `_set_queue_item_status`, this does not build it."""
         try:
             self.__lock.acquire()
             self.__cursor.execute(
                 """--sql
-                SELECT *
-                FROM session_queue
+                UPDATE session_queue
+                SET status = 'failed', error = ?
+                WHERE item_id = ?
+                """,
+                (error, item_id),
+            )
+            self.__conn.commit()
+            queue_item = self._select_queue_item_dtos([item_id])[0]
+        except Exception:
+            self.__conn.rollback()
+            raise
+        finally:
+            self.__lock.release()
+        self._on_changed()
+        self._emit_queue_item_status_changed(queue_item)
+
+    def get_next(self, queue_id: str) -> Optional[SessionQueueItem]:
+        try:
+            self.__lock.acquire()
+            self.__cursor.execute(
+                f"""{SELECT_QUEUE_ITEMS}
                 WHERE
-                  queue_id = ?
-                  AND status = 'pending'
+                  session_queue.queue_id = ?
+                  AND session_queue.status = 'pending'
                 ORDER BY
                   priority DESC,
-                  created_at ASC
+                  item_id ASC
                 LIMIT 1
                 """,
                 (queue_id,),
@@ -250,12 +481,11 @@ class SqliteSessionQueue(SessionQueueBase):
         try:
             self.__lock.acquire()
             self.__cursor.execute(
-                """--sql
-                SELECT *
-                FROM session_queue
+                f"""{SELECT_QUEUE_ITEMS}
                 WHERE
-                  queue_id = ?
-                  AND status = 'in_progress'
+                  session_queue.queue_id = ?
+                  AND session_queue.status = 'in_progress'
+                ORDER BY session_queue.priority DESC, session_queue.item_id ASC
                 LIMIT 1
                 """,
                 (queue_id,),
@@ -270,6 +500,26 @@ class SqliteSessionQueue(SessionQueueBase):
             return None
         return SessionQueueItem.queue_item_from_dict(dict(result))
 
+    def set_queue_item_session(self, item_id: int, session: GraphExecutionState) -> None:
+        # Only the session is written - the status is unchanged, so there is nothing to emit
+        session_json = session.model_dump_json(warnings=False, exclude_none=True)
+        try:
+            self.__lock.acquire()
+            self.__cursor.execute(
+                """--sql
+                UPDATE session_queue
+                SET session = ?
+                WHERE item_id = ?
+                """,
+                (session_json, item_id),
+            )
+            self.__conn.commit()
+        except Exception:
+            self.__conn.rollback()
+            raise
+        finally:
+            self.__lock.release()
+
     def _set_queue_item_status(
         self, item_id: int, status: QUEUE_ITEM_STATUS, error: Optional[str] = None
     ) -> SessionQueueItem:
@@ -289,7 +539,12 @@ class SqliteSessionQueue(SessionQueueBase):
             raise
         finally:
             self.__lock.release()
+        self._on_changed()
         queue_item = self.get_queue_item(item_id)
+        self._emit_queue_item_status_changed(queue_item)
+        return queue_item
+
+    def _emit_queue_item_status_changed(self, queue_item: SessionQueueItemWithoutGraph) -> None:
         batch_status = self.get_batch_status(queue_id=queue_item.queue_id, batch_id=queue_item.batch_id)
         queue_status = self.get_queue_status(queue_id=queue_item.queue_id)
         self.__invoker.services.events.emit_queue_item_status_changed(
@@ -297,7 +552,6 @@ class SqliteSessionQueue(SessionQueueBase):
             batch_status=batch_status,
             queue_status=queue_status,
         )
-        return queue_item
 
     def is_empty(self, queue_id: str) -> IsEmptyResult:
         try:
@@ -438,117 +692,112 @@ class SqliteSessionQueue(SessionQueueBase):
         return queue_item
 
     def cancel_by_batch_ids(self, queue_id: str, batch_ids: list[str]) -> CancelByBatchIDsResult:
+        placeholders = ", ".join(["?" for _ in batch_ids])
+        where = f"""--sql
+            WHERE
+              queue_id == ?
+              AND batch_id IN ({placeholders})
+              AND status != 'canceled'
+              AND status != 'completed'
+              AND status != 'failed'
+            """
+        count = self._cancel_queue_items(where, (queue_id, *batch_ids))
+        return CancelByBatchIDsResult(canceled=count)
+
+    def cancel_by_queue_id(self, queue_id: str) -> CancelByQueueIDResult:
+        where = """--sql
+            WHERE
+              queue_id is ?
+              AND status != 'canceled'
+              AND status != 'completed'
+              AND status != 'failed'
+            """
+        count = self._cancel_queue_items(where, (queue_id,))
+        return CancelByQueueIDResult(canceled=count)
+
+    def _cancel_queue_items(self, where: str, params: tuple[str, ...]) -> int:
+        """Cancels the queue items matching the given WHERE clause, and gets the number of canceled items. Each worker
+        executing one of them is told to cancel it."""
         try:
-            current_queue_item = self.get_current(queue_id)
             self.__lock.acquire()
-            placeholders = ", ".join(["?" for _ in batch_ids])
-            where = f"""--sql
-                WHERE
-                  queue_id == ?
-                  AND batch_id IN ({placeholders})
-                  AND status != 'canceled'
-                  AND status != 'completed'
-                  AND status != 'failed'
-                """
-            params = [queue_id] + batch_ids
             self.__cursor.execute(
                 f"""--sql
                 SELECT COUNT(*)
                 FROM session_queue
                 {where};
                 """,
-                tuple(params),
+                params,
             )
-            count = self.__cursor.fetchone()[0]
+            count = cast(int, self.__cursor.fetchone()[0])
+            # Several workers may be executing matching queue items
             self.__cursor.execute(
                 f"""--sql
-                UPDATE session_queue
-                SET status = 'canceled'
-                {where};
-                """,
-                tuple(params),
-            )
-            self.__conn.commit()
-            if current_queue_item is not None and current_queue_item.batch_id in batch_ids:
-                self.__invoker.services.events.emit_session_canceled(
-                    queue_item_id=current_queue_item.item_id,
-                    queue_id=current_queue_item.queue_id,
-                    queue_batch_id=current_queue_item.batch_id,
-                    graph_execution_state_id=current_queue_item.session_id,
-                )
-                batch_status = self.get_batch_status(queue_id=queue_id, batch_id=current_queue_item.batch_id)
-                queue_status = self.get_queue_status(queue_id=queue_id)
-                self.__invoker.services.events.emit_queue_item_status_changed(
-                    session_queue_item=current_queue_item,
-                    batch_status=batch_status,
-                    queue_status=queue_status,
-                )
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
-        return CancelByBatchIDsResult(canceled=count)
-
-    def cancel_by_queue_id(self, queue_id: str) -> CancelByQueueIDResult:
-        try:
-            current_queue_item = self.get_current(queue_id)
-            self.__lock.acquire()
-            where = """--sql
-                WHERE
-                  queue_id is ?
-                  AND status != 'canceled'
-                  AND status != 'completed'
-                  AND status != 'failed'
-                """
-            params = [queue_id]
-            self.__cursor.execute(
-                f"""--sql
-                SELECT COUNT(*)
+                SELECT item_id
                 FROM session_queue
-                {where};
+                {where}
+                  AND status = 'in_progress';
                 """,
-                tuple(params),
+                params,
             )
-            count = self.__cursor.fetchone()[0]
+            in_progress_item_ids = [cast(int, row[0]) for row in self.__cursor.fetchall()]
             self.__cursor.execute(
                 f"""--sql
                 UPDATE session_queue
                 SET status = 'canceled'
                 {where};
                 """,
-                tuple(params),
+                params,
             )
             self.__conn.commit()
-            if current_queue_item is not None and current_queue_item.queue_id == queue_id:
-                self.__invoker.services.events.emit_session_canceled(
-                    queue_item_id=current_queue_item.item_id,
-                    queue_id=current_queue_item.queue_id,
-                    queue_batch_id=current_queue_item.batch_id,
-                    graph_execution_state_id=current_queue_item.session_id,
-                )
-                batch_status = self.get_batch_status(queue_id=queue_id, batch_id=current_queue_item.batch_id)
-                queue_status = self.get_queue_status(queue_id=queue_id)
-                self.__invoker.services.events.emit_queue_item_status_changed(
-                    session_queue_item=current_queue_item,
-                    batch_status=batch_status,
-                    queue_status=queue_status,
-                )
+            canceled_queue_items = self._select_queue_item_dtos(in_progress_item_ids)
         except Exception:
             self.__conn.rollback()
             raise
         finally:
             self.__lock.release()
-        return CancelByQueueIDResult(canceled=count)
+        for queue_item in canceled_queue_items:
+            self.__invoker.services.events.emit_session_canceled(
+                queue_item_id=queue_item.item_id,
+                queue_id=queue_item.queue_id,
+                queue_batch_id=queue_item.batch_id,
+                graph_execution_state_id=queue_item.session_id,
+            )
+            self._emit_queue_item_status_changed(queue_item)
+        return count
+
+    def _select_queue_item_dtos(self, item_ids: list[int]) -> list[SessionQueueItemDTO]:
+        """Gets queue items without building their sessions. The lock must be held."""
+        placeholders = ", ".join(["?" for _ in item_ids])
+        self.__cursor.execute(
+            f"""--sql
+            SELECT item_id,
+                status,
+                priority,
+                field_values,
+                error,
+                created_at,
+                updated_at,
+                completed_at,
+                started_at,
+                session_id,
+                batch_id,
+                queue_id
+            FROM session_queue
+            WHERE item_id IN ({placeholders})
+            ORDER BY item_id
+            """,
+            tuple(item_ids),
+        )
+        results = cast(list[sqlite3.Row], self.__cursor.fetchall())
+        return [SessionQueueItemDTO.queue_item_dto_from_dict(dict(result)) for result in results]
 
     def get_queue_item(self, item_id: int) -> SessionQueueItem:
         try:
             self.__lock.acquire()
             self.__cursor.execute(
-                """--sql
-                SELECT * FROM session_queue
+                f"""{SELECT_QUEUE_ITEMS}
                 WHERE
-                  item_id = ?
+                  session_queue.item_id = ?
                 """,
                 (item_id,),
             )
@@ -628,49 +877,71 @@ class SqliteSessionQueue(SessionQueueBase):
     def get_queue_status(self, queue_id: str) -> SessionQueueStatus:
         try:
             self.__lock.acquire()
+            counts = self._select_queue_status_counts(queue_id)
+            # Several queue items may be in progress, one for each worker. Only the ids of the first one in queue order
+            # are reported, and its session is not built.
             self.__cursor.execute(
                 """--sql
-                SELECT status, count(*)
+                SELECT item_id, session_id, batch_id
                 FROM session_queue
-                WHERE queue_id = ?
-                GROUP BY status
+                WHERE queue_id = ? AND status = 'in_progress'
+                ORDER BY priority DESC, item_id ASC
+                LIMIT 1
                 """,
                 (queue_id,),
             )
-            counts_result = cast(list[sqlite3.Row], self.__cursor.fetchall())
+            first_item = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
         except Exception:
             self.__conn.rollback()
             raise
         finally:
             self.__lock.release()
 
-        current_item = self.get_current(queue_id=queue_id)
-        total = sum(row[1] for row in counts_result)
-        counts: dict[str, int] = {row[0]: row[1] for row in counts_result}
         return SessionQueueStatus(
             queue_id=queue_id,
-            item_id=current_item.item_id if current_item else None,
-            session_id=current_item.session_id if current_item else None,
-            batch_id=current_item.batch_id if current_item else None,
+            item_id=first_item["item_id"] if first_item else None,
+            session_id=first_item["session_id"] if first_item else None,
+            batch_id=first_item["batch_id"] if first_item else None,
             pending=counts.get("pending", 0),
             in_progress=counts.get("in_progress", 0),
             completed=counts.get("completed", 0),
             failed=counts.get("failed", 0),
             canceled=counts.get("canceled", 0),
-            total=total,
+            total=sum(counts.values()),
         )
 
+    def get_queue_status_counts(self, queue_id: str) -> dict[str, int]:
+        try:
+            self.__lock.acquire()
+            return self._select_queue_status_counts(queue_id)
+        except Exception:
+            self.__conn.rollback()
+            raise
+        finally:
+            self.__lock.release()
+
+    def _select_queue_status_counts(self, queue_id: str) -> dict[str, int]:
+        """Gets the number of queue items by status. The lock must be held."""
+        self.__cursor.execute(
+            """--sql
+            SELECT status, count
+            FROM session_queue_status_counts
+            WHERE queue_id = ?
+            """,
+            (queue_id,),
+        )
+        return {row[0]: row[1] for row in cast(list[sqlite3.Row], self.__cursor.fetchall())}
+
     def get_batch_status(self, queue_id: str, batch_id: str) -> BatchStatus:
         try:
             self.__lock.acquire()
             self.__cursor.execute(
                 """--sql
-                SELECT status, count(*)
-                FROM session_queue
+                SELECT status, count
+                FROM session_queue_batch_status_counts
                 WHERE
                   queue_id = ?
                   AND batch_id = ?
-                GROUP BY status
                 """,
                 (queue_id, batch_id),
             )
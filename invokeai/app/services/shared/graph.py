@@ -1,13 +1,16 @@
 # Copyright (c) 2022 Kyle Schouviller (https://github.com/kyle0654)
 
 import copy
+import heapq
 import itertools
+from enum import Enum
 from typing import Annotated, Any, Optional, TypeVar, Union, get_args, get_origin, get_type_hints
 
 import networkx as nx
 from pydantic import (
     BaseModel,
     GetJsonSchemaHandler,
+    PrivateAttr,
     field_validator,
 )
 from pydantic.fields import Field
@@ -22,7 +25,15 @@ from invokeai.app.invocations.baseinvocation import (
     invocation,
     invocation_output,
 )
-from invokeai.app.invocations.fields import Input, InputField, OutputField, UIType
+from invokeai.app.invocations.fields import (
+    ImageField,
+    Input,
+    InputField,
+    LatentsField,
+    OutputField,
+    TensorField,
+    UIType,
+)
 from invokeai.app.services.shared.invocation_context import InvocationContext
 from invokeai.app.util.misc import uuid_string
 
@@ -154,6 +165,29 @@ def copydeep(obj: T) -> T:
     return copy.deepcopy(obj)
 
 
+# Values of these types are immutable, so they are shared between nodes instead of copied
+IMMUTABLE_INPUT_TYPES = (str, int, float, bool, bytes, NoneType, Enum)
+
+# Fields that only reference images and tensors stored elsewhere. Their own values are all immutable, so a shallow copy
+# is enough, and much cheaper than a deep copy.
+FLAT_INPUT_TYPES = (ImageField, LatentsField, TensorField)
+
+
+def copy_input(obj: T) -> T:
+    """Copies an input value, so that a node mutating it does not affect other nodes that get the same value.
+
+    Immutable values are shared, flat fields are copied shallowly, and so are lists of either. Anything else is
+    deep-copied.
+    """
+    if isinstance(obj, IMMUTABLE_INPUT_TYPES):
+        return obj
+    if isinstance(obj, FLAT_INPUT_TYPES):
+        return obj.model_copy()  # type: ignore
+    if isinstance(obj, list) and all(isinstance(v, IMMUTABLE_INPUT_TYPES + FLAT_INPUT_TYPES) for v in obj):
+        return [copy_input(v) for v in obj]  # type: ignore
+    return copydeep(obj)
+
+
 class NodeAlreadyInGraphError(ValueError):
     pass
 
@@ -251,6 +285,8 @@ class Graph(BaseModel):
         description="The connections between nodes and their fields in this graph",
         default_factory=list,
     )
+    # Incremented by each mutation, so that views derived from the graph know when they are stale
+    _version: int = PrivateAttr(default=0)
 
     @field_validator("nodes", mode="plain")
     @classmethod
@@ -320,6 +356,7 @@ class Graph(BaseModel):
             raise NodeAlreadyInGraphError()
 
         self.nodes[node.id] = node
+        self._version += 1
 
     def delete_node(self, node_id: str) -> None:
         """Deletes a node from a graph"""
@@ -336,6 +373,7 @@ class Graph(BaseModel):
                 self.delete_edge(edge)
 
             del self.nodes[node_id]
+            self._version += 1
 
         except NodeNotFoundError:
             pass  # Ignore, not doesn't exist (should this throw?)
@@ -349,6 +387,7 @@ class Graph(BaseModel):
         self._validate_edge(edge)
         if edge not in self.edges:
             self.edges.append(edge)
+            self._version += 1
         else:
             raise InvalidEdgeError()
 
@@ -357,6 +396,7 @@ class Graph(BaseModel):
 
         try:
             self.edges.remove(edge)
+            self._version += 1
         except KeyError:
             pass
 
@@ -562,6 +602,7 @@ class Graph(BaseModel):
 
         # Set the new node in the graph
         self.nodes[new_node.id] = new_node
+        self._version += 1
         if new_node.id != node.id:
             input_edges = self._get_input_edges(node_id)
             output_edges = self._get_output_edges(node_id)
@@ -719,6 +760,113 @@ class Graph(BaseModel):
         return g
 
 
+class _SourceGraphIndex:
+    """Derived views of a `GraphExecutionState`'s source graph, built once and reused by every `_prepare` call.
+
+    The `GraphExecutionState` mutators discard the index. It is also rebuilt if the source graph was replaced, or mutated
+    directly.
+    """
+
+    def __init__(self, graph: Graph) -> None:
+        self.graph = graph
+        self.graph_version = graph._version
+        self.nx_graph = graph.nx_graph_flat()
+        self.node_ids = set(self.nx_graph.nodes)
+        self.sorted_nodes: list[str] = list(nx.topological_sort(self.nx_graph))
+        self.parents: dict[str, list[str]] = {n: [e[0] for e in self.nx_graph.in_edges(n)] for n in self.node_ids}
+
+        iterate_nodes = {n for n in self.node_ids if isinstance(graph.get_node(n), IterateInvocation)}
+        collectors = {n for n in self.node_ids if isinstance(graph.get_node(n), CollectInvocation)}
+
+        # Iterate ancestors of each node, and the iterators active for each node (iterators are not active past
+        # collectors), propagated in topological order
+        self.iterate_ancestors: dict[str, set[str]] = {}
+        self.iterators: dict[str, set[str]] = {}
+        for n in self.sorted_nodes:
+            ancestors: set[str] = set()
+            iterators: set[str] = set()
+            for p in self.parents[n]:
+                ancestors |= self.iterate_ancestors[p]
+                if p in iterate_nodes:
+                    ancestors.add(p)
+                if n not in collectors:
+                    iterators |= self.iterators[p]
+                    if p in iterate_nodes:
+                        iterators.add(p)
+            self.iterate_ancestors[n] = ancestors
+            self.iterators[n] = iterators
+
+    def is_current(self, graph: Graph) -> bool:
+        return self.graph is graph and self.graph_version == graph._version
+
+
+class _ExecutionScheduler:
+    """Tracks which nodes of an execution graph are ready to be executed.
+
+    Each prepared node counts its unexecuted parents. When a node completes, the counts of its children are decremented
+    and children left with no unexecuted parents are pushed to a ready queue. The queue executes iterations depth-first
+    and in order of their iteration index, then all other nodes in the order they were prepared.
+
+    It also indexes the input edges of each node, so a node's inputs are found without scanning the execution graph.
+    """
+
+    def __init__(self) -> None:
+        self.nx_graph = nx.DiGraph()
+        self.input_edges: dict[str, list[Edge]] = {}
+        self._unexecuted_parents: dict[str, int] = {}
+        # The iteration indices of each node's iterate ancestors, or None if the node is not part of an iteration
+        self._iterations: dict[str, Optional[tuple[int, ...]]] = {}
+        self._ready: list[tuple[bool, tuple[int, ...], int, str]] = []
+        self._pushed = 0
+
+    @classmethod
+    def from_execution_state(cls, state: "GraphExecutionState") -> "_ExecutionScheduler":
+        """Builds the scheduler for an execution state, e.g. one that was deserialized."""
+        scheduler = cls()
+        input_edges: dict[str, list[Edge]] = {n: [] for n in state.execution_graph.nodes}
+        for edge in state.execution_graph.edges:
+            input_edges[edge.destination.node_id].append(edge)
+        # Nodes are added to the execution graph after their parents, so insertion order is a topological order
+        for node_id, node in state.execution_graph.nodes.items():
+            scheduler.add_node(node, input_edges[node_id], state.executed)
+        return scheduler
+
+    def add_node(self, node: BaseInvocation, input_edges: list[Edge], executed: set[str]) -> None:
+        """Adds a prepared node and its input edges. The node's parents must already have been added."""
+        parents = {e.source.node_id for e in input_edges}
+        self.input_edges[node.id] = input_edges
+        self.nx_graph.add_node(node.id)
+        self.nx_graph.add_edges_from((p, node.id) for p in parents)
+
+        iterations = min((i for i in (self._iterations[p] for p in parents) if i is not None), default=None)
+        if isinstance(node, IterateInvocation):
+            iterations = (iterations or ()) + (node.index,)
+        self._iterations[node.id] = iterations
+
+        unexecuted_parents = sum(1 for p in parents if p not in executed)
+        self._unexecuted_parents[node.id] = unexecuted_parents
+        if unexecuted_parents == 0 and node.id not in executed:
+            self._push(node.id)
+
+    def complete(self, node_id: str) -> None:
+        """Marks a node as executed, readying any children that have no other unexecuted parents."""
+        for child in self.nx_graph.successors(node_id):
+            self._unexecuted_parents[child] -= 1
+            if self._unexecuted_parents[child] == 0:
+                self._push(child)
+
+    def next_ready(self, executed: set[str]) -> Optional[str]:
+        """Gets the next node that is ready to be executed, without removing it from the ready queue."""
+        while self._ready and self._ready[0][3] in executed:
+            heapq.heappop(self._ready)
+        return self._ready[0][3] if self._ready else None
+
+    def _push(self, node_id: str) -> None:
+        iterations = self._iterations[node_id]
+        heapq.heappush(self._ready, (iterations is None, iterations or (), self._pushed, node_id))
+        self._pushed += 1
+
+
 class GraphExecutionState(BaseModel):
     """Tracks the state of a graph execution"""
 
@@ -757,6 +905,10 @@ class GraphExecutionState(BaseModel):
         default_factory=dict,
     )
 
+    # Scheduling state derived from the fields above. It is not serialized, and is rebuilt when first needed.
+    _source_index: Optional[_SourceGraphIndex] = PrivateAttr(default=None)
+    _scheduler: Optional[_ExecutionScheduler] = PrivateAttr(default=None)
+
     @field_validator("results", mode="plain")
     @classmethod
     def validate_results(cls, v: dict[str, BaseInvocationOutput]):
@@ -833,6 +985,8 @@ class GraphExecutionState(BaseModel):
             return  # TODO: log error?
 
         # Mark node as executed
+        if node_id not in self.executed:
+            self._get_scheduler().complete(node_id)
         self.executed.add(node_id)
         self.results[node_id] = output
 
@@ -850,13 +1004,23 @@ class GraphExecutionState(BaseModel):
 
     def is_complete(self) -> bool:
         """Returns true if the graph is complete"""
-        node_ids = set(self.graph.nx_graph_flat().nodes)
+        node_ids = self._get_source_index().node_ids
         return self.has_error() or all((k in self.executed for k in node_ids))
 
     def has_error(self) -> bool:
         """Returns true if the graph has any errors"""
         return len(self.errors) > 0
 
+    def _get_source_index(self) -> _SourceGraphIndex:
+        if self._source_index is None or not self._source_index.is_current(self.graph):
+            self._source_index = _SourceGraphIndex(self.graph)
+        return self._source_index
+
+    def _get_scheduler(self) -> _ExecutionScheduler:
+        if self._scheduler is None:
+            self._scheduler = _ExecutionScheduler.from_execution_state(self)
+        return self._scheduler
+
     def _create_execution_node(self, node_id: str, iteration_node_map: list[tuple[str, str]]) -> list[str]:
         """Prepares an iteration node and connects all edges, returning the new node id"""
 
@@ -895,6 +1059,7 @@ class GraphExecutionState(BaseModel):
                 new_edges.append(new_edge)
 
         # Create a new node (or one for each iteration of this iterator)
+        scheduler = self._get_scheduler()
         for i in range(self_iteration_count) if self_iteration_count > 0 else [-1]:
             # Create a new node
             new_node = copy.deepcopy(node)
@@ -913,60 +1078,48 @@ class GraphExecutionState(BaseModel):
                 self.source_prepared_mapping[node_id] = set()
             self.source_prepared_mapping[node_id].add(new_node.id)
 
-            # Add new edges to execution graph
-            for edge in new_edges:
-                new_edge = Edge(
+            # Add new edges to execution graph. They mirror edges of the source graph, which has already been validated,
+            # so they are added without validating them again.
+            new_node_edges = [
+                Edge(
                     source=edge.source,
                     destination=EdgeConnection(node_id=new_node.id, field=edge.destination.field),
                 )
-                self.execution_graph.add_edge(new_edge)
+                for edge in new_edges
+            ]
+            self.execution_graph.edges.extend(new_node_edges)
 
+            scheduler.add_node(new_node, new_node_edges, self.executed)
             new_nodes.append(new_node.id)
 
         return new_nodes
 
-    def _iterator_graph(self) -> nx.DiGraph:
-        """Gets a DiGraph with edges to collectors removed so an ancestor search produces all active iterators for any node"""
-        g = self.graph.nx_graph_flat()
-        collectors = (n for n in self.graph.nodes if isinstance(self.graph.get_node(n), CollectInvocation))
-        for c in collectors:
-            g.remove_edges_from(list(g.in_edges(c)))
-        return g
-
     def _get_node_iterators(self, node_id: str) -> list[str]:
         """Gets iterators for a node"""
-        g = self._iterator_graph()
-        iterators = [n for n in nx.ancestors(g, node_id) if isinstance(self.graph.get_node(n), IterateInvocation)]
-        return iterators
+        return list(self._get_source_index().iterators[node_id])
 
     def _prepare(self) -> Optional[str]:
         # Get flattened source graph
-        g = self.graph.nx_graph_flat()
+        source_index = self._get_source_index()
+        g = source_index.nx_graph
 
         # Find next node that:
         # - was not already prepared
         # - is not an iterate node whose inputs have not been executed
         # - does not have an unexecuted iterate ancestor
-        sorted_nodes = nx.topological_sort(g)
         next_node_id = next(
             (
                 n
-                for n in sorted_nodes
+                for n in source_index.sorted_nodes
                 # exclude nodes that have already been prepared
                 if n not in self.source_prepared_mapping
                 # exclude iterate nodes whose inputs have not been executed
                 and not (
                     isinstance(self.graph.get_node(n), IterateInvocation)  # `n` is an iterate node...
-                    and not all((e[0] in self.executed for e in g.in_edges(n)))  # ...that has unexecuted inputs
+                    and not all((p in self.executed for p in source_index.parents[n]))  # ...that has unexecuted inputs
                 )
                 # exclude nodes who have unexecuted iterate ancestors
-                and not any(
-                    (
-                        isinstance(self.graph.get_node(a), IterateInvocation)  # `a` is an iterate ancestor of `n`...
-                        and a not in self.executed  # ...that is not executed
-                        for a in nx.ancestors(g, n)  # for all ancestors `a` of node `n`
-                    )
-                )
+                and not any((a not in self.executed for a in source_index.iterate_ancestors[n]))
             ),
             None,
         )
@@ -975,7 +1128,7 @@ class GraphExecutionState(BaseModel):
             return None
 
         # Get all parents of the next node
-        next_node_parents = [e[0] for e in g.in_edges(next_node_id)]
+        next_node_parents = source_index.parents[next_node_id]
 
         # Create execution nodes
         next_node = self.graph.get_node(next_node_id)
@@ -999,7 +1152,7 @@ class GraphExecutionState(BaseModel):
             # Select the correct prepared parents for each iteration
             # For every iterator, the parent must either not be a child of that iterator, or must match the prepared iteration for that iterator
             # TODO: Handle a node mapping to none
-            eg = self.execution_graph.nx_graph_flat()
+            eg = self._get_scheduler().nx_graph
             prepared_parent_mappings = [
                 [(n, self._get_iteration_node(n, g, eg, it)) for n in next_node_parents]
                 for it in iterator_node_prepared_combinations
@@ -1033,50 +1186,33 @@ class GraphExecutionState(BaseModel):
         # Filter to only iterator nodes that are a parent of the specified node, in tuple format (prepared, source)
         iterator_source_node_mapping = [(n, self.prepared_source_mapping[n]) for n in prepared_iterator_nodes]
         parent_iterators = [itn for itn in iterator_source_node_mapping if nx.has_path(graph, itn[1], source_node_id)]
+        if not parent_iterators:
+            return next(iter(prepared_nodes), None)
 
+        # The prepared node must descend from every parent iterator. Iterations are usually small, so search the
+        # descendants of the iterators rather than checking for a path to each prepared node.
+        descendants = sorted((nx.descendants(execution_graph, pit[0]) for pit in parent_iterators), key=len)
         return next(
-            (n for n in prepared_nodes if all(nx.has_path(execution_graph, pit[0], n) for pit in parent_iterators)),
+            (n for n in descendants[0] if n in prepared_nodes and all(n in d for d in descendants[1:])),
             None,
         )
 
     def _get_next_node(self) -> Optional[BaseInvocation]:
-        """Gets the deepest node that is ready to be executed"""
-        g = self.execution_graph.nx_graph()
+        """Gets the next node that is ready to be executed.
 
-        # Perform a topological sort using depth-first search
-        topo_order = list(nx.dfs_postorder_nodes(g))
-
-        # Get all IterateInvocation nodes
-        iterate_nodes = [n for n in topo_order if isinstance(self.execution_graph.nodes[n], IterateInvocation)]
-
-        # Sort the IterateInvocation nodes based on their index attribute
-        iterate_nodes.sort(key=lambda x: self.execution_graph.nodes[x].index)
-
-        # Prioritize IterateInvocation nodes and their children
-        for iterate_node in iterate_nodes:
-            if iterate_node not in self.executed and all((e[0] in self.executed for e in g.in_edges(iterate_node))):
-                return self.execution_graph.nodes[iterate_node]
-
-            # Check the children of the IterateInvocation node
-            for child_node in nx.dfs_postorder_nodes(g, iterate_node):
-                if child_node not in self.executed and all((e[0] in self.executed for e in g.in_edges(child_node))):
-                    return self.execution_graph.nodes[child_node]
-
-        # If no IterateInvocation node or its children are ready, return the first ready node in the topological order
-        for node in topo_order:
-            if node not in self.executed and all((e[0] in self.executed for e in g.in_edges(node))):
-                return self.execution_graph.nodes[node]
-
-        # If no node is found, return None
-        return None
+        Iterate nodes and their descendants are executed depth-first, in order of their iteration index. Other nodes
+        are executed in the order they were prepared.
+        """
+        node_id = self._get_scheduler().next_ready(self.executed)
+        return self.execution_graph.nodes[node_id] if node_id is not None else None
 
     def _prepare_inputs(self, node: BaseInvocation):
-        input_edges = [e for e in self.execution_graph.edges if e.destination.node_id == node.id]
-        # Inputs must be deep-copied, else if a node mutates the object, other nodes that get the same input
-        # will see the mutation.
+        input_edges = self._get_scheduler().input_edges[node.id]
+        # Inputs must be copied, else if a node mutates the object, other nodes that get the same input will see the
+        # mutation. Immutable values are shared rather than copied.
         if isinstance(node, CollectInvocation):
             output_collection = [
-                copydeep(getattr(self.results[edge.source.node_id], edge.source.field))
+                copy_input(getattr(self.results[edge.source.node_id], edge.source.field))
                 for edge in input_edges
                 if edge.destination.field == "item"
             ]
@@ -1086,7 +1222,7 @@ class GraphExecutionState(BaseModel):
                 setattr(
                     node,
                     edge.destination.field,
-                    copydeep(getattr(self.results[edge.source.node_id], edge.source.field)),
+                    copy_input(getattr(self.results[edge.source.node_id], edge.source.field)),
                 )
 
     # TODO: Add API for modifying underlying graph that checks if the change will be valid given the current execution state
@@ -1109,6 +1245,7 @@ class GraphExecutionState(BaseModel):
 
     def add_node(self, node: BaseInvocation) -> None:
         self.graph.add_node(node)
+        self._source_index = None
 
     def update_node(self, node_id: str, new_node: BaseInvocation) -> None:
         if not self._is_node_updatable(node_id):
@@ -1116,6 +1253,7 @@ class GraphExecutionState(BaseModel):
                 f"Node {node_id} has already been prepared or executed and cannot be updated"
             )
         self.graph.update_node(node_id, new_node)
+        self._source_index = None
 
     def delete_node(self, node_id: str) -> None:
         if not self._is_node_updatable(node_id):
@@ -1123,6 +1261,7 @@ class GraphExecutionState(BaseModel):
                 f"Node {node_id} has already been prepared or executed and cannot be deleted"
             )
         self.graph.delete_node(node_id)
+        self._source_index = None
 
     def add_edge(self, edge: Edge) -> None:
         if not self._is_node_updatable(edge.destination.node_id):
@@ -1130,6 +1269,7 @@ class GraphExecutionState(BaseModel):
                 f"Destination node {edge.destination.node_id} has already been prepared or executed and cannot be linked to"
             )
         self.graph.add_edge(edge)
+        self._source_index = None
 
     def delete_edge(self, edge: Edge) -> None:
         if not self._is_node_updatable(edge.destination.node_id):
@@ -1137,3 +1277,4 @@ class GraphExecutionState(BaseModel):
                 f"Destination node {edge.destination.node_id} has already been prepared or executed and cannot have a source edge deleted"
             )
         self.graph.delete_edge(edge)
+        self._source_index = None
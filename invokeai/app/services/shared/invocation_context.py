@@ -270,6 +270,8 @@ class TensorsInterface(InvocationContextInterface):
         """
 
         name = self._services.tensors.save(obj=tensor)
+        # Keep the tensor while the session may still use it
+        self._services.tensors.pin(name, self._data.queue_item.session_id)
         return name
 
     def load(self, name: str) -> Tensor:
@@ -281,7 +283,9 @@ class TensorsInterface(InvocationContextInterface):
         Returns:
             The loaded tensor.
         """
-        return self._services.tensors.load(name)
+        tensor = self._services.tensors.load(name)
+        self._services.tensors.pin(name, self._data.queue_item.session_id)
+        return tensor
 
 
 class ConditioningInterface(InvocationContextInterface):
@@ -296,6 +300,8 @@ class ConditioningInterface(InvocationContextInterface):
         """
 
         name = self._services.conditioning.save(obj=conditioning_data)
+        # Keep the conditioning while the session may still use it
+        self._services.conditioning.pin(name, self._data.queue_item.session_id)
         return name
 
     def load(self, name: str) -> ConditioningFieldData:
@@ -308,7 +314,9 @@ class ConditioningInterface(InvocationContextInterface):
             The loaded conditioning data.
         """
 
-        return self._services.conditioning.load(name)
+        conditioning_data = self._services.conditioning.load(name)
+        self._services.conditioning.pin(name, self._data.queue_item.session_id)
+        return conditioning_data
 
 
 class ModelsInterface(InvocationContextInterface):
@@ -0,0 +1,60 @@
+import sqlite3
+
+from invokeai.app.services.shared.sqlite_migrator.sqlite_migrator_common import Migration
+
+
+class Migration10Callback:
+    def __call__(self, cursor: sqlite3.Cursor) -> None:
+        self._add_session_queue_indices(cursor)
+        self._drop_session_queue_single_column_indices(cursor)
+
+    def _add_session_queue_indices(self, cursor: sqlite3.Cursor) -> None:
+        """Adds composite indices to `session_queue` that match how the session queue reads it.
+
+        - `(status, priority DESC, item_id)` lets `dequeue` read the next pending item directly from the index,
+          without sorting all pending items.
+        - `(queue_id, status, priority DESC, item_id)` covers the per-queue status counts and lookups of pending and
+          in-progress items, and serves filtered queue item listings in order.
+        - `(queue_id, batch_id, status)` covers the per-batch status counts.
+        """
+
+        indices = [
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_session_queue_status_priority_item_id
+            ON session_queue(status, priority DESC, item_id ASC);
+            """,
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_session_queue_queue_id_status_priority_item_id
+            ON session_queue(queue_id, status, priority DESC, item_id ASC);
+            """,
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_session_queue_queue_id_batch_id_status
+            ON session_queue(queue_id, batch_id, status);
+            """,
+        ]
+
+        for stmt in indices:
+            cursor.execute(stmt)
+
+    def _drop_session_queue_single_column_indices(self, cursor: sqlite3.Cursor) -> None:
+        """Drops the single-column `status` and `priority` indices, which are superseded by the composite indices."""
+
+        cursor.execute("DROP INDEX IF EXISTS idx_session_queue_created_priority;")
+        cursor.execute("DROP INDEX IF EXISTS idx_session_queue_created_status;")
+
+
+def build_migration_10() -> Migration:
+    """
+    Build the migration from database version 9 to 10.
+
+    This migration does the following:
+    - Adds composite indices to the `session_queue` table for dequeuing, status counts and queue item lookups.
+    - Drops the single-column `status` and `priority` indices on the `session_queue` table, which are superseded.
+    """
+    migration_10 = Migration(
+        from_version=9,
+        to_version=10,
+        callback=Migration10Callback(),
+    )
+
+    return migration_10
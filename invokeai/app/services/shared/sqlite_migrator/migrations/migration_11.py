@@ -0,0 +1,140 @@
+import sqlite3
+
+from invokeai.app.services.shared.sqlite_migrator.sqlite_migrator_common import Migration
+
+
+class Migration11Callback:
+    def __call__(self, cursor: sqlite3.Cursor) -> None:
+        self._create_session_queue_status_counts(cursor)
+        self._populate_session_queue_status_counts(cursor)
+
+    def _create_session_queue_status_counts(self, cursor: sqlite3.Cursor) -> None:
+        """Creates the `session_queue_status_counts` and `session_queue_batch_status_counts` tables and the triggers
+        that maintain them.
+
+        These hold the number of queue items in each status, per queue and per batch. They are kept up to date by
+        triggers on `session_queue`, so reading the queue or batch status does not need to aggregate the queue.
+        """
+
+        tables = [
+            """--sql
+            CREATE TABLE IF NOT EXISTS session_queue_status_counts (
+                queue_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (queue_id, status)
+            ) WITHOUT ROWID;
+            """,
+            """--sql
+            CREATE TABLE IF NOT EXISTS session_queue_batch_status_counts (
+                queue_id TEXT NOT NULL,
+                batch_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (queue_id, batch_id, status)
+            ) WITHOUT ROWID;
+            """,
+        ]
+
+        triggers = [
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_status_counts_insert
+            AFTER INSERT ON session_queue
+            FOR EACH ROW
+            BEGIN
+                INSERT INTO session_queue_status_counts (queue_id, status, count)
+                VALUES (NEW.queue_id, NEW.status, 1)
+                ON CONFLICT (queue_id, status) DO UPDATE SET count = count + 1;
+                INSERT INTO session_queue_batch_status_counts (queue_id, batch_id, status, count)
+                VALUES (NEW.queue_id, NEW.batch_id, NEW.status, 1)
+                ON CONFLICT (queue_id, batch_id, status) DO UPDATE SET count = count + 1;
+            END;
+            """,
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_status_counts_update
+            AFTER UPDATE OF status ON session_queue
+            FOR EACH ROW
+            WHEN OLD.status != NEW.status
+            BEGIN
+                UPDATE session_queue_status_counts
+                SET count = count - 1
+                WHERE queue_id = OLD.queue_id AND status = OLD.status;
+                INSERT INTO session_queue_status_counts (queue_id, status, count)
+                VALUES (NEW.queue_id, NEW.status, 1)
+                ON CONFLICT (queue_id, status) DO UPDATE SET count = count + 1;
+                UPDATE session_queue_batch_status_counts
+                SET count = count - 1
+                WHERE queue_id = OLD.queue_id AND batch_id = OLD.batch_id AND status = OLD.status;
+                INSERT INTO session_queue_batch_status_counts (queue_id, batch_id, status, count)
+                VALUES (NEW.queue_id, NEW.batch_id, NEW.status, 1)
+                ON CONFLICT (queue_id, batch_id, status) DO UPDATE SET count = count + 1;
+            END;
+            """,
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_status_counts_delete
+            AFTER DELETE ON session_queue
+            FOR EACH ROW
+            BEGIN
+                UPDATE session_queue_status_counts
+                SET count = count - 1
+                WHERE queue_id = OLD.queue_id AND status = OLD.status;
+                UPDATE session_queue_batch_status_counts
+                SET count = count - 1
+                WHERE queue_id = OLD.queue_id AND batch_id = OLD.batch_id AND status = OLD.status;
+            END;
+            """,
+            # Batches are short-lived, so drop their counts once they have no items in a status. Queue counts are few
+            # and are kept.
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_batch_status_counts_empty
+            AFTER UPDATE OF count ON session_queue_batch_status_counts
+            FOR EACH ROW
+            WHEN NEW.count <= 0
+            BEGIN
+                DELETE FROM session_queue_batch_status_counts
+                WHERE queue_id = NEW.queue_id AND batch_id = NEW.batch_id AND status = NEW.status;
+            END;
+            """,
+        ]
+
+        for stmt in tables + triggers:
+            cursor.execute(stmt)
+
+    def _populate_session_queue_status_counts(self, cursor: sqlite3.Cursor) -> None:
+        """Populates the status counts tables from any existing queue items."""
+
+        cursor.execute(
+            """--sql
+            INSERT INTO session_queue_status_counts (queue_id, status, count)
+            SELECT queue_id, status, count(*)
+            FROM session_queue
+            GROUP BY queue_id, status;
+            """
+        )
+        cursor.execute(
+            """--sql
+            INSERT INTO session_queue_batch_status_counts (queue_id, batch_id, status, count)
+            SELECT queue_id, batch_id, status, count(*)
+            FROM session_queue
+            GROUP BY queue_id, batch_id, status;
+            """
+        )
+
+
+def build_migration_11() -> Migration:
+    """
+    Build the migration from database version 10 to 11.
+
+    This migration does the following:
+    - Creates the `session_queue_status_counts` and `session_queue_batch_status_counts` tables, which hold the number
+      of queue items in each status per queue and per batch.
+    - Creates triggers on `session_queue` that keep those counts up to date.
+    - Populates the counts from any existing queue items.
+    """
+    migration_11 = Migration(
+        from_version=10,
+        to_version=11,
+        callback=Migration11Callback(),
+    )
+
+    return migration_11
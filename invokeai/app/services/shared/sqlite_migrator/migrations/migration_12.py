@@ -0,0 +1,233 @@
+import sqlite3
+
+from invokeai.app.services.shared.sqlite_migrator.sqlite_migrator_common import Migration
+
+
+class Migration12Callback:
+    def __call__(self, cursor: sqlite3.Cursor) -> None:
+        self._create_session_queue_batches(cursor)
+        self._make_session_queue_session_nullable(cursor)
+
+    def _create_session_queue_batches(self, cursor: sqlite3.Cursor) -> None:
+        """Creates the `session_queue_batches` table.
+
+        A batch's graph and workflow are the same for every queue item of the batch, so they are stored once here.
+        Queue items store only the field values applied to the graph, and their sessions are materialized on read.
+        """
+
+        cursor.execute(
+            """--sql
+            CREATE TABLE IF NOT EXISTS session_queue_batches (
+                batch_id TEXT NOT NULL PRIMARY KEY, -- identifier of the batch
+                graph TEXT NOT NULL, -- the batch's graph, before any field values are applied
+                workflow TEXT -- the batch's workflow, NULL if there is none
+            );
+            """
+        )
+
+    def _make_session_queue_session_nullable(self, cursor: sqlite3.Cursor) -> None:
+        """Rebuilds the `session_queue` table so that the `session` column is nullable.
+
+        SQLite cannot drop a NOT NULL constraint in place, so the table is recreated and its rows copied over. Dropping
+        the old table drops its indices and triggers, so those are recreated too, along with a trigger that deletes a
+        batch once it has no queue items left.
+        """
+
+        tables = [
+            """--sql
+            CREATE TABLE session_queue_new (
+                item_id INTEGER PRIMARY KEY AUTOINCREMENT, -- used for ordering, cursor pagination
+                batch_id TEXT NOT NULL, -- identifier of the batch this queue item belongs to
+                queue_id TEXT NOT NULL, -- identifier of the queue this queue item belongs to
+                session_id TEXT NOT NULL UNIQUE, -- duplicated data from the session column, for ease of access
+                field_values TEXT, -- NULL if no values are associated with this queue item
+                session TEXT, -- the session to be executed, NULL if it is materialized from the batch's graph
+                status TEXT NOT NULL DEFAULT 'pending', -- the status of the queue item, one of 'pending', 'in_progress', 'completed', 'failed', 'canceled'
+                priority INTEGER NOT NULL DEFAULT 0, -- the priority, higher is more important
+                error TEXT, -- any errors associated with this queue item
+                created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
+                updated_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')), -- updated via trigger
+                started_at DATETIME, -- updated via trigger
+                completed_at DATETIME, -- updated via trigger, completed items are cleaned up on application startup
+                workflow TEXT -- NULL if there is no workflow, or if it is stored with the batch
+            );
+            """,
+            """--sql
+            INSERT INTO session_queue_new (
+                item_id,
+                batch_id,
+                queue_id,
+                session_id,
+                field_values,
+                session,
+                status,
+                priority,
+                error,
+                created_at,
+                updated_at,
+                started_at,
+                completed_at,
+                workflow
+            )
+            SELECT
+                item_id,
+                batch_id,
+                queue_id,
+                session_id,
+                field_values,
+                session,
+                status,
+                priority,
+                error,
+                created_at,
+                updated_at,
+                started_at,
+                completed_at,
+                workflow
+            FROM session_queue;
+            """,
+            # Carry over the AUTOINCREMENT sequence, so item IDs of deleted items are not reused
+            """--sql
+            UPDATE sqlite_sequence
+            SET seq = (SELECT seq FROM sqlite_sequence WHERE name = 'session_queue')
+            WHERE name = 'session_queue_new'
+            AND EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'session_queue');
+            """,
+            "DROP TABLE session_queue;",
+            "ALTER TABLE session_queue_new RENAME TO session_queue;",
+        ]
+
+        indices = [
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_session_queue_item_id ON session_queue(item_id);",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_session_queue_session_id ON session_queue(session_id);",
+            "CREATE INDEX IF NOT EXISTS idx_session_queue_batch_id ON session_queue(batch_id);",
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_session_queue_status_priority_item_id
+            ON session_queue(status, priority DESC, item_id ASC);
+            """,
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_session_queue_queue_id_status_priority_item_id
+            ON session_queue(queue_id, status, priority DESC, item_id ASC);
+            """,
+            """--sql
+            CREATE INDEX IF NOT EXISTS idx_session_queue_queue_id_batch_id_status
+            ON session_queue(queue_id, batch_id, status);
+            """,
+        ]
+
+        triggers = [
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_completed_at
+            AFTER UPDATE OF status ON session_queue
+            FOR EACH ROW
+            WHEN
+            NEW.status = 'completed'
+            OR NEW.status = 'failed'
+            OR NEW.status = 'canceled'
+            BEGIN
+            UPDATE session_queue
+            SET completed_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')
+            WHERE item_id = NEW.item_id;
+            END;
+            """,
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_started_at
+            AFTER UPDATE OF status ON session_queue
+            FOR EACH ROW
+            WHEN
+            NEW.status = 'in_progress'
+            BEGIN
+            UPDATE session_queue
+            SET started_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')
+            WHERE item_id = NEW.item_id;
+            END;
+            """,
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_updated_at
+            AFTER UPDATE
+            ON session_queue FOR EACH ROW
+            BEGIN
+                UPDATE session_queue
+                SET updated_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')
+                WHERE item_id = old.item_id;
+            END;
+            """,
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_status_counts_insert
+            AFTER INSERT ON session_queue
+            FOR EACH ROW
+            BEGIN
+                INSERT INTO session_queue_status_counts (queue_id, status, count)
+                VALUES (NEW.queue_id, NEW.status, 1)
+                ON CONFLICT (queue_id, status) DO UPDATE SET count = count + 1;
+                INSERT INTO session_queue_batch_status_counts (queue_id, batch_id, status, count)
+                VALUES (NEW.queue_id, NEW.batch_id, NEW.status, 1)
+                ON CONFLICT (queue_id, batch_id, status) DO UPDATE SET count = count + 1;
+            END;
+            """,
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_status_counts_update
+            AFTER UPDATE OF status ON session_queue
+            FOR EACH ROW
+            WHEN OLD.status != NEW.status
+            BEGIN
+                UPDATE session_queue_status_counts
+                SET count = count - 1
+                WHERE queue_id = OLD.queue_id AND status = OLD.status;
+                INSERT INTO session_queue_status_counts (queue_id, status, count)
+                VALUES (NEW.queue_id, NEW.status, 1)
+                ON CONFLICT (queue_id, status) DO UPDATE SET count = count + 1;
+                UPDATE session_queue_batch_status_counts
+                SET count = count - 1
+                WHERE queue_id = OLD.queue_id AND batch_id = OLD.batch_id AND status = OLD.status;
+                INSERT INTO session_queue_batch_status_counts (queue_id, batch_id, status, count)
+                VALUES (NEW.queue_id, NEW.batch_id, NEW.status, 1)
+                ON CONFLICT (queue_id, batch_id, status) DO UPDATE SET count = count + 1;
+            END;
+            """,
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_status_counts_delete
+            AFTER DELETE ON session_queue
+            FOR EACH ROW
+            BEGIN
+                UPDATE session_queue_status_counts
+                SET count = count - 1
+                WHERE queue_id = OLD.queue_id AND status = OLD.status;
+                UPDATE session_queue_batch_status_counts
+                SET count = count - 1
+                WHERE queue_id = OLD.queue_id AND batch_id = OLD.batch_id AND status = OLD.status;
+            END;
+            """,
+            """--sql
+            CREATE TRIGGER IF NOT EXISTS tg_session_queue_batches_delete
+            AFTER DELETE ON session_queue
+            FOR EACH ROW
+            WHEN NOT EXISTS (SELECT 1 FROM session_queue WHERE batch_id = OLD.batch_id)
+            BEGIN
+                DELETE FROM session_queue_batches
+                WHERE batch_id = OLD.batch_id;
+            END;
+            """,
+        ]
+
+        for stmt in tables + indices + triggers:
+            cursor.execute(stmt)
+
+
+def build_migration_12() -> Migration:
+    """
+    Build the migration from database version 11 to 12.
+
+    This migration does the following:
+    - Creates the `session_queue_batches` table, which stores each batch's graph and workflow once.
+    - Rebuilds the `session_queue` table so that its `session` column is nullable. Queue items of batches store only
+      their field values, and their sessions are materialized from the batch's graph.
+    - Recreates the `session_queue` indices and triggers, and adds a trigger that deletes batches with no queue items.
+    """
+    migration_12 = Migration(
+        from_version=11,
+        to_version=12,
+        callback=Migration12Callback(),
+    )
+
+    return migration_12
@@ -0,0 +1,61 @@
+import sqlite3
+
+from invokeai.app.services.shared.sqlite_migrator.sqlite_migrator_common import Migration
+
+
+class Migration13Callback:
+    def __call__(self, cursor: sqlite3.Cursor) -> None:
+        self._create_invocation_cache(cursor)
+
+    def _create_invocation_cache(self, cursor: sqlite3.Cursor) -> None:
+        """Creates the `invocation_cache` and `invocation_cache_references` tables.
+
+        These persist the invocation cache, so cached outputs are reused after a restart. Each cached output's
+        references to images, tensors and conditioning are indexed, so the outputs referencing a deleted object can be
+        deleted without scanning the cache.
+        """
+
+        tables = [
+            """--sql
+            CREATE TABLE IF NOT EXISTS invocation_cache (
+                key TEXT NOT NULL PRIMARY KEY, -- the cache key of the invocation
+                invocation_output TEXT NOT NULL, -- the cached invocation output
+                app_version TEXT NOT NULL, -- the app version that cached the output
+                created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))
+            );
+            """,
+            """--sql
+            CREATE TABLE IF NOT EXISTS invocation_cache_references (
+                name TEXT NOT NULL, -- the name of the referenced image, tensor or conditioning
+                service TEXT NOT NULL, -- the service storing the referenced object, one of 'images', 'tensors', 'conditioning'
+                key TEXT NOT NULL,
+                PRIMARY KEY (name, key),
+                FOREIGN KEY (key) REFERENCES invocation_cache (key) ON DELETE CASCADE
+            ) WITHOUT ROWID;
+            """,
+        ]
+
+        indices = [
+            "CREATE INDEX IF NOT EXISTS idx_invocation_cache_references_key ON invocation_cache_references(key);",
+        ]
+
+        for stmt in tables + indices:
+            cursor.execute(stmt)
+
+
+def build_migration_13() -> Migration:
+    """
+    Build the migration from database version 12 to 13.
+
+    This migration does the following:
+    - Creates the `invocation_cache` table, which persists cached invocation outputs.
+    - Creates the `invocation_cache_references` table, which indexes the images, tensors and conditioning referenced by
+      each cached output.
+    """
+    migration_13 = Migration(
+        from_version=12,
+        to_version=13,
+        callback=Migration13Callback(),
+    )
+
+    return migration_13
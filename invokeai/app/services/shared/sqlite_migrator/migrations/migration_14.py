@@ -0,0 +1,33 @@
+import sqlite3
+
+from invokeai.app.services.shared.sqlite_migrator.sqlite_migrator_common import Migration
+
+
+class Migration14Callback:
+    def __call__(self, cursor: sqlite3.Cursor) -> None:
+        self._add_images_workflow_column(cursor)
+
+    def _add_images_workflow_column(self, cursor: sqlite3.Cursor) -> None:
+        """Adds the `workflow` column to the `images` table.
+
+        Workflows were only embedded in image files, so reading one meant opening and parsing the image. Images saved
+        before this migration keep their workflow in their file only.
+        """
+
+        cursor.execute("ALTER TABLE images ADD COLUMN workflow TEXT;")
+
+
+def build_migration_14() -> Migration:
+    """
+    Build the migration from database version 13 to 14.
+
+    This migration does the following:
+    - Adds the `workflow` column to the `images` table, which stores the workflow of images saved from now on.
+    """
+    migration_14 = Migration(
+        from_version=13,
+        to_version=14,
+        callback=Migration14Callback(),
+    )
+
+    return migration_14
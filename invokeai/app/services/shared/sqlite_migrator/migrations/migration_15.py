@@ -0,0 +1,33 @@
+import sqlite3
+
+from invokeai.app.services.shared.sqlite_migrator.sqlite_migrator_common import Migration
+
+
+class Migration15Callback:
+    def __call__(self, cursor: sqlite3.Cursor) -> None:
+        self._add_session_queue_resume_count_column(cursor)
+
+    def _add_session_queue_resume_count_column(self, cursor: sqlite3.Cursor) -> None:
+        """Adds the `resume_count` column to the `session_queue` table.
+
+        It counts the times an in-progress queue item was set back to pending on startup, so that an item which keeps
+        crashing the app is eventually failed rather than resumed forever.
+        """
+
+        cursor.execute("ALTER TABLE session_queue ADD COLUMN resume_count INTEGER NOT NULL DEFAULT 0;")
+
+
+def build_migration_15() -> Migration:
+    """
+    Build the migration from database version 14 to 15.
+
+    This migration does the following:
+    - Adds the `resume_count` column to the `session_queue` table, which counts the times a queue item was resumed.
+    """
+    migration_15 = Migration(
+        from_version=14,
+        to_version=15,
+        callback=Migration15Callback(),
+    )
+
+    return migration_15
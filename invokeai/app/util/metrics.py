@@ -0,0 +1,135 @@
+"""Lightweight metrics in the Prometheus text exposition format.
+
+Histograms are cheap enough to be updated from hot paths: an observation is a bisection and a few additions under a
+lock. The values are only formatted when the metrics are scraped.
+"""
+
+import math
+from bisect import bisect_left
+from dataclasses import dataclass
+from threading import Lock
+from typing import Literal, Mapping, Optional, Sequence
+
+# Bucket upper bounds, in seconds, suitable for anything from a fast node to a long denoising run
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# The media type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+MetricType = Literal["counter", "gauge", "histogram", "summary"]
+
+
+@dataclass
+class HistogramSample:
+    """The observations of a histogram for one label value."""
+
+    bucket_counts: list[int]  # Non-cumulative counts, with one more entry than there are buckets for +Inf
+    sum: float = 0.0
+    count: int = 0
+
+
+class Histogram:
+    """Counts observations in buckets, optionally by label value. Thread-safe."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._buckets = tuple(sorted(buckets))
+        self._lock = Lock()
+        self._samples: dict[str, HistogramSample] = {}
+
+    @property
+    def buckets(self) -> tuple[float, ...]:
+        """The upper bounds of the buckets, excluding +Inf."""
+        return self._buckets
+
+    def observe(self, value: float, label: str = "") -> None:
+        """Records an observation for the given label value."""
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            sample = self._samples.get(label)
+            if sample is None:
+                sample = self._samples[label] = HistogramSample(bucket_counts=[0] * (len(self._buckets) + 1))
+            sample.bucket_counts[index] += 1
+            sample.sum += value
+            sample.count += 1
+
+    def collect(self) -> dict[str, HistogramSample]:
+        """Gets a copy of the observations, by label value."""
+        with self._lock:
+            return {
+                label: HistogramSample(bucket_counts=list(sample.bucket_counts), sum=sample.sum, count=sample.count)
+                for label, sample in self._samples.items()
+            }
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Mapping[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+
+class MetricsWriter:
+    """Writes metrics in the Prometheus text exposition format."""
+
+    def __init__(self) -> None:
+        self._lines: list[str] = []
+
+    def _write_header(self, name: str, metric_type: MetricType, help: str) -> None:
+        self._lines.append(f"# HELP {name} {help}")
+        self._lines.append(f"# TYPE {name} {metric_type}")
+
+    def _write_sample(self, name: str, value: float, labels: Optional[Mapping[str, str]] = None) -> None:
+        self._lines.append(f"{name}{_format_labels(labels or {})} {_format_value(value)}")
+
+    def gauge(self, name: str, help: str, value: float | Mapping[str, float], label_name: str = "") -> None:
+        """Writes a gauge, either with a single value, or with a value by label value."""
+        self._write_header(name, "gauge", help)
+        self._write_samples(name, value, label_name)
+
+    def counter(self, name: str, help: str, value: float | Mapping[str, float], label_name: str = "") -> None:
+        """Writes a counter, either with a single value, or with a value by label value. The name ends with `_total`."""
+        assert name.endswith("_total"), "Counter names end with _total"
+        self._write_header(name, "counter", help)
+        self._write_samples(name, value, label_name)
+
+    def summary(self, name: str, help: str, sum: float, count: int) -> None:
+        """Writes a summary without quantiles, i.e. the sum and count of the observations."""
+        self._write_header(name, "summary", help)
+        self._write_sample(f"{name}_sum", sum)
+        self._write_sample(f"{name}_count", count)
+
+    def histogram(self, name: str, help: str, histogram: Histogram, label_name: str = "") -> None:
+        """Writes a histogram, with cumulative buckets. Its label values are written with the given label name."""
+        self._write_header(name, "histogram", help)
+        bounds = [*histogram.buckets, math.inf]
+        for label, sample in sorted(histogram.collect().items()):
+            labels = {label_name: label} if label_name else {}
+            cumulative = 0
+            for bound, count in zip(bounds, sample.bucket_counts, strict=True):
+                cumulative += count
+                self._write_sample(f"{name}_bucket", cumulative, {**labels, "le": _format_value(bound)})
+            self._write_sample(f"{name}_sum", sample.sum, labels)
+            self._write_sample(f"{name}_count", sample.count, labels)
+
+    def _write_samples(self, name: str, value: float | Mapping[str, float], label_name: str) -> None:
+        if isinstance(value, Mapping):
+            assert label_name, "A label name is required for values by label"
+            for label, label_value in value.items():
+                self._write_sample(name, label_value, {label_name: label})
+        else:
+            self._write_sample(name, value)
+
+    def render(self) -> str:
+        """Gets the metrics written so far."""
+        return "\n".join(self._lines) + "\n"
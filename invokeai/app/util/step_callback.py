@@ -3,11 +3,10 @@ from typing import TYPE_CHECKING, Callable
 import torch
 from PIL import Image
 
-from invokeai.app.services.session_processor.session_processor_common import CanceledException, ProgressImage
+from invokeai.app.services.session_processor.session_processor_common import CanceledException, ProgressPreview
 from invokeai.backend.model_manager.config import BaseModelType
 
 from ...backend.stable_diffusion import PipelineIntermediateState
-from ...backend.util.util import image_to_dataURL
 
 if TYPE_CHECKING:
     from invokeai.app.services.events.events_base import EventServiceBase
@@ -29,39 +28,8 @@ def sample_to_lowres_estimated_image(samples, latent_rgb_factors, smooth_matrix=
     return Image.fromarray(latents_ubyte.numpy())
 
 
-def stable_diffusion_step_callback(
-    context_data: "InvocationContextData",
-    intermediate_state: PipelineIntermediateState,
-    base_model: BaseModelType,
-    events: "EventServiceBase",
-    is_canceled: Callable[[], bool],
-) -> None:
-    if is_canceled():
-        raise CanceledException
-
-    # Some schedulers report not only the noisy latents at the current timestep,
-    # but also their estimate so far of what the de-noised latents will be. Use
-    # that estimate if it is available.
-    if intermediate_state.predicted_original is not None:
-        sample = intermediate_state.predicted_original
-    else:
-        sample = intermediate_state.latents
-
-    # TODO: This does not seem to be needed any more?
-    # # txt2img provides a Tensor in the step_callback
-    # # img2img provides a PipelineIntermediateState
-    # if isinstance(sample, PipelineIntermediateState):
-    #     # this was an img2img
-    #     print('img2img')
-    #     latents = sample.latents
-    #     step = sample.step
-    # else:
-    #     print('txt2img')
-    #     latents = sample
-    #     step = intermediate_state.step
-
-    # TODO: only output a preview image when requested
-
+def get_progress_preview(sample: torch.Tensor, base_model: BaseModelType) -> ProgressPreview:
+    """Estimates an RGB preview of the latents being denoised, at latent resolution."""
     if base_model in [BaseModelType.StableDiffusionXL, BaseModelType.StableDiffusionXLRefiner]:
         # fast latents preview matrix for sdxl
         # generated by @StAlKeR7779
@@ -108,10 +76,46 @@ def stable_diffusion_step_callback(
         image = sample_to_lowres_estimated_image(sample, v1_5_latent_rgb_factors)
 
     (width, height) = image.size
-    width *= 8
-    height *= 8
+    # The image is encoded later, off the session processor's thread, as requested by each subscriber
+    return ProgressPreview(image=image, width=width * 8, height=height * 8)
+
 
-    dataURL = image_to_dataURL(image, image_format="JPEG")
+def stable_diffusion_step_callback(
+    context_data: "InvocationContextData",
+    intermediate_state: PipelineIntermediateState,
+    base_model: BaseModelType,
+    events: "EventServiceBase",
+    is_canceled: Callable[[], bool],
+) -> None:
+    if is_canceled():
+        raise CanceledException
+
+    # Some schedulers report not only the noisy latents at the current timestep,
+    # but also their estimate so far of what the de-noised latents will be. Use
+    # that estimate if it is available.
+    if intermediate_state.predicted_original is not None:
+        sample = intermediate_state.predicted_original
+    else:
+        sample = intermediate_state.latents
+
+    # TODO: This does not seem to be needed any more?
+    # # txt2img provides a Tensor in the step_callback
+    # # img2img provides a PipelineIntermediateState
+    # if isinstance(sample, PipelineIntermediateState):
+    #     # this was an img2img
+    #     print('img2img')
+    #     latents = sample.latents
+    #     step = sample.step
+    # else:
+    #     print('txt2img')
+    #     latents = sample
+    #     step = intermediate_state.step
+
+    progress_image = (
+        get_progress_preview(sample, base_model)
+        if events.wants_progress_images(context_data.queue_item.queue_id)
+        else None
+    )
 
     events.emit_generator_progress(
         queue_id=context_data.queue_item.queue_id,
@@ -120,7 +124,7 @@ def stable_diffusion_step_callback(
         graph_execution_state_id=context_data.queue_item.session_id,
         node_id=context_data.invocation.id,
         source_node_id=context_data.source_invocation_id,
-        progress_image=ProgressImage(width=width, height=height, dataURL=dataURL),
+        progress_image=progress_image,
         step=intermediate_state.step,
         order=intermediate_state.order,
         total_steps=intermediate_state.total_steps,
@@ -21,7 +21,6 @@ from invokeai.backend.model_manager.load.optimizations import skip_torch_weight_
 from invokeai.backend.util.devices import choose_torch_device, torch_dtype
 
 
-# TO DO: The loader is not thread safe!
 class ModelLoader(ModelLoaderBase):
     """Default implementation of ModelLoaderBase."""
 
@@ -79,30 +78,33 @@ class ModelLoader(ModelLoaderBase):
     def _convert_and_load(
         self, config: AnyModelConfig, model_path: Path, submodel_type: Optional[SubModelType] = None
     ) -> ModelLockerBase:
-        try:
-            return self._ram_cache.get(config.key, submodel_type)
-        except IndexError:
-            pass
-
-        cache_path: Path = self._convert_cache.cache_path(config.key)
-        if self._needs_conversion(config, model_path, cache_path):
-            loaded_model = self._do_convert(config, model_path, cache_path, submodel_type)
-        else:
-            config.path = str(cache_path) if cache_path.exists() else str(self._get_model_path(config))
-            loaded_model = self._load_model(config, submodel_type)
-
-        self._ram_cache.put(
-            config.key,
-            submodel_type=submodel_type,
-            model=loaded_model,
-            size=calc_model_size_by_data(loaded_model),
-        )
-
-        return self._ram_cache.get(
-            key=config.key,
-            submodel_type=submodel_type,
-            stats_name=":".join([config.base, config.type, config.name, (submodel_type or "")]),
-        )
+        # Session processor workers load models concurrently. Holding the cache lock while loading ensures a model
+        # requested by several workers at once is only loaded once.
+        with self._ram_cache.lock:
+            try:
+                return self._ram_cache.get(config.key, submodel_type)
+            except IndexError:
+                pass
+
+            cache_path: Path = self._convert_cache.cache_path(config.key)
+            if self._needs_conversion(config, model_path, cache_path):
+                loaded_model = self._do_convert(config, model_path, cache_path, submodel_type)
+            else:
+                config.path = str(cache_path) if cache_path.exists() else str(self._get_model_path(config))
+                loaded_model = self._load_model(config, submodel_type)
+
+            self._ram_cache.put(
+                config.key,
+                submodel_type=submodel_type,
+                model=loaded_model,
+                size=calc_model_size_by_data(loaded_model),
+            )
+
+            return self._ram_cache.get(
+                key=config.key,
+                submodel_type=submodel_type,
+                stats_name=":".join([config.base, config.type, config.name, (submodel_type or "")]),
+            )
 
     def get_size_fs(
         self, config: AnyModelConfig, model_path: Path, submodel_type: Optional[SubModelType] = None
@@ -10,6 +10,7 @@ model will be cleared and (re)loaded from disk when next needed.
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from logging import Logger
+from threading import RLock
 from typing import Dict, Generic, Optional, TypeVar
 
 import torch
@@ -78,6 +79,16 @@ class CacheStats(object):
     loaded_model_sizes: Dict[str, int] = field(default_factory=dict)
 
 
+@dataclass
+class CacheCounters(object):
+    """Count cache operations since startup. Unlike CacheStats, these are never reset."""
+
+    hits: int = 0  # cache hits
+    misses: int = 0  # cache misses
+    evictions: int = 0  # number of models cleared to make space
+    evicted_bytes: int = 0  # total size of the models cleared to make space
+
+
 class ModelCacheBase(ABC, Generic[T]):
     """Virtual base class for RAM model cache."""
 
@@ -118,13 +129,25 @@ class ModelCacheBase(ABC, Generic[T]):
     @property
     @abstractmethod
     def stats(self) -> Optional[CacheStats]:
-        """Return collected CacheStats object."""
+        """Return the CacheStats object collecting statistics for the calling thread."""
         pass
 
     @stats.setter
     @abstractmethod
     def stats(self, stats: CacheStats) -> None:
-        """Set the CacheStats object for collectin cache statistics."""
+        """Set the CacheStats object for collecting cache statistics in the calling thread."""
+        pass
+
+    @property
+    @abstractmethod
+    def counters(self) -> CacheCounters:
+        """Return the CacheCounters object counting cache operations since startup."""
+        pass
+
+    @property
+    @abstractmethod
+    def lock(self) -> RLock:
+        """Return the lock serializing access to the cache. Hold it to perform several operations atomically."""
         pass
 
     @property
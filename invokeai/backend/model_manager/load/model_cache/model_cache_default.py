@@ -21,6 +21,7 @@ context. Use like this:
 import gc
 import math
 import sys
+import threading
 import time
 from contextlib import suppress
 from logging import Logger
@@ -33,7 +34,7 @@ from invokeai.backend.model_manager.load.memory_snapshot import MemorySnapshot,
 from invokeai.backend.util.devices import choose_torch_device
 from invokeai.backend.util.logging import InvokeAILogger
 
-from .model_cache_base import CacheRecord, CacheStats, ModelCacheBase, ModelLockerBase
+from .model_cache_base import CacheCounters, CacheRecord, CacheStats, ModelCacheBase, ModelLockerBase
 from .model_locker import ModelLocker
 
 if choose_torch_device() == torch.device("mps"):
@@ -92,7 +93,11 @@ class ModelCache(ModelCacheBase[AnyModel]):
         self._storage_device: torch.device = storage_device
         self._logger = logger or InvokeAILogger.get_logger(self.__class__.__name__)
         self._log_memory_usage = log_memory_usage
-        self._stats: Optional[CacheStats] = None
+        # Each session processor worker collects the stats of its own session, so they are kept per thread
+        self._thread_stats = threading.local()
+        self._counters = CacheCounters()
+        # Session processor workers share the cache, so all access to it is serialized
+        self._lock = threading.RLock()
 
         self._cached_models: Dict[str, CacheRecord[AnyModel]] = {}
         self._cache_stack: List[str] = []
@@ -129,20 +134,32 @@ class ModelCache(ModelCacheBase[AnyModel]):
 
     @property
     def stats(self) -> Optional[CacheStats]:
-        """Return collected CacheStats object."""
-        return self._stats
+        """Return the CacheStats object collecting statistics for the calling thread."""
+        stats: Optional[CacheStats] = getattr(self._thread_stats, "stats", None)
+        return stats
 
     @stats.setter
     def stats(self, stats: CacheStats) -> None:
-        """Set the CacheStats object for collectin cache statistics."""
-        self._stats = stats
+        """Set the CacheStats object for collecting cache statistics in the calling thread."""
+        self._thread_stats.stats = stats
+
+    @property
+    def counters(self) -> CacheCounters:
+        """Return the CacheCounters object counting cache operations since startup."""
+        return self._counters
+
+    @property
+    def lock(self) -> threading.RLock:
+        """Return the lock serializing access to the cache. Hold it to perform several operations atomically."""
+        return self._lock
 
     def cache_size(self) -> int:
         """Get the total size of the models currently cached."""
-        total = 0
-        for cache_record in self._cached_models.values():
-            total += cache_record.size
-        return total
+        with self._lock:
+            total = 0
+            for cache_record in self._cached_models.values():
+                total += cache_record.size
+            return total
 
     def exists(
         self,
@@ -150,8 +167,9 @@ class ModelCache(ModelCacheBase[AnyModel]):
         submodel_type: Optional[SubModelType] = None,
     ) -> bool:
         """Return true if the model identified by key and submodel_type is in the cache."""
-        key = self._make_cache_key(key, submodel_type)
-        return key in self._cached_models
+        with self._lock:
+            key = self._make_cache_key(key, submodel_type)
+            return key in self._cached_models
 
     def put(
         self,
@@ -161,13 +179,14 @@ class ModelCache(ModelCacheBase[AnyModel]):
         submodel_type: Optional[SubModelType] = None,
     ) -> None:
         """Store model under key and optional submodel_type."""
-        key = self._make_cache_key(key, submodel_type)
-        if key in self._cached_models:
-            return
-        self.make_room(size)
-        cache_record = CacheRecord(key, model, size)
-        self._cached_models[key] = cache_record
-        self._cache_stack.append(key)
+        with self._lock:
+            key = self._make_cache_key(key, submodel_type)
+            if key in self._cached_models:
+                return
+            self.make_room(size)
+            cache_record = CacheRecord(key, model, size)
+            self._cached_models[key] = cache_record
+            self._cache_stack.append(key)
 
     def get(
         self,
@@ -185,35 +204,38 @@ class ModelCache(ModelCacheBase[AnyModel]):
 
         This may raise an IndexError if the model is not in the cache.
         """
-        key = self._make_cache_key(key, submodel_type)
-        if key in self._cached_models:
-            if self.stats:
-                self.stats.hits += 1
-        else:
+        with self._lock:
+            key = self._make_cache_key(key, submodel_type)
+            if key in self._cached_models:
+                self._counters.hits += 1
+                if self.stats:
+                    self.stats.hits += 1
+            else:
+                self._counters.misses += 1
+                if self.stats:
+                    self.stats.misses += 1
+                raise IndexError(f"The model with key {key} is not in the cache.")
+
+            cache_entry = self._cached_models[key]
+
+            # more stats
             if self.stats:
-                self.stats.misses += 1
-            raise IndexError(f"The model with key {key} is not in the cache.")
-
-        cache_entry = self._cached_models[key]
-
-        # more stats
-        if self.stats:
-            stats_name = stats_name or key
-            self.stats.cache_size = int(self._max_cache_size * GIG)
-            self.stats.high_watermark = max(self.stats.high_watermark, self.cache_size())
-            self.stats.in_cache = len(self._cached_models)
-            self.stats.loaded_model_sizes[stats_name] = max(
-                self.stats.loaded_model_sizes.get(stats_name, 0), cache_entry.size
-            )
+                stats_name = stats_name or key
+                self.stats.cache_size = int(self._max_cache_size * GIG)
+                self.stats.high_watermark = max(self.stats.high_watermark, self.cache_size())
+                self.stats.in_cache = len(self._cached_models)
+                self.stats.loaded_model_sizes[stats_name] = max(
+                    self.stats.loaded_model_sizes.get(stats_name, 0), cache_entry.size
+                )
 
-        # this moves the entry to the top (right end) of the stack
-        with suppress(Exception):
-            self._cache_stack.remove(key)
-        self._cache_stack.append(key)
-        return ModelLocker(
-            cache=self,
-            cache_entry=cache_entry,
-        )
+            # this moves the entry to the top (right end) of the stack
+            with suppress(Exception):
+                self._cache_stack.remove(key)
+            self._cache_stack.append(key)
+            return ModelLocker(
+                cache=self,
+                cache_entry=cache_entry,
+            )
 
     def _capture_memory_snapshot(self) -> Optional[MemorySnapshot]:
         if self._log_memory_usage:
@@ -228,25 +250,26 @@ class ModelCache(ModelCacheBase[AnyModel]):
 
     def offload_unlocked_models(self, size_required: int) -> None:
         """Move any unused models from VRAM."""
-        reserved = self._max_vram_cache_size * GIG
-        vram_in_use = torch.cuda.memory_allocated() + size_required
-        self.logger.debug(f"{(vram_in_use/GIG):.2f}GB VRAM needed for models; max allowed={(reserved/GIG):.2f}GB")
-        for _, cache_entry in sorted(self._cached_models.items(), key=lambda x: x[1].size):
-            if vram_in_use <= reserved:
-                break
-            if not cache_entry.loaded:
-                continue
-            if not cache_entry.locked:
-                self.move_model_to_device(cache_entry, self.storage_device)
-                cache_entry.loaded = False
-                vram_in_use = torch.cuda.memory_allocated() + size_required
-                self.logger.debug(
-                    f"Removing {cache_entry.key} from VRAM to free {(cache_entry.size/GIG):.2f}GB; vram free = {(torch.cuda.memory_allocated()/GIG):.2f}GB"
-                )
-
-        torch.cuda.empty_cache()
-        if choose_torch_device() == torch.device("mps"):
-            mps.empty_cache()
+        with self._lock:
+            reserved = self._max_vram_cache_size * GIG
+            vram_in_use = torch.cuda.memory_allocated() + size_required
+            self.logger.debug(f"{(vram_in_use/GIG):.2f}GB VRAM needed for models; max allowed={(reserved/GIG):.2f}GB")
+            for _, cache_entry in sorted(self._cached_models.items(), key=lambda x: x[1].size):
+                if vram_in_use <= reserved:
+                    break
+                if not cache_entry.loaded:
+                    continue
+                if not cache_entry.locked:
+                    self.move_model_to_device(cache_entry, self.storage_device)
+                    cache_entry.loaded = False
+                    vram_in_use = torch.cuda.memory_allocated() + size_required
+                    self.logger.debug(
+                        f"Removing {cache_entry.key} from VRAM to free {(cache_entry.size/GIG):.2f}GB; vram free = {(torch.cuda.memory_allocated()/GIG):.2f}GB"
+                    )
+
+            torch.cuda.empty_cache()
+            if choose_torch_device() == torch.device("mps"):
+                mps.empty_cache()
 
     def move_model_to_device(self, cache_entry: CacheRecord[AnyModel], target_device: torch.device) -> None:
         """Move model into the indicated device.
@@ -256,171 +279,176 @@ class ModelCache(ModelCacheBase[AnyModel]):
 
         May raise a torch.cuda.OutOfMemoryError
         """
-        # These attributes are not in the base ModelMixin class but in various derived classes.
-        # Some models don't have these attributes, in which case they run in RAM/CPU.
-        self.logger.debug(f"Called to move {cache_entry.key} to {target_device}")
-        if not (hasattr(cache_entry.model, "device") and hasattr(cache_entry.model, "to")):
-            return
-
-        source_device = cache_entry.model.device
-
-        # Note: We compare device types only so that 'cuda' == 'cuda:0'.
-        # This would need to be revised to support multi-GPU.
-        if torch.device(source_device).type == torch.device(target_device).type:
-            return
-
-        start_model_to_time = time.time()
-        snapshot_before = self._capture_memory_snapshot()
-        try:
-            cache_entry.model.to(target_device)
-        except Exception as e:  # blow away cache entry
-            self._delete_cache_entry(cache_entry)
-            raise e
-
-        snapshot_after = self._capture_memory_snapshot()
-        end_model_to_time = time.time()
-        self.logger.debug(
-            f"Moved model '{cache_entry.key}' from {source_device} to"
-            f" {target_device} in {(end_model_to_time-start_model_to_time):.2f}s."
-            f"Estimated model size: {(cache_entry.size/GIG):.3f} GB."
-            f"{get_pretty_snapshot_diff(snapshot_before, snapshot_after)}"
-        )
-
-        if (
-            snapshot_before is not None
-            and snapshot_after is not None
-            and snapshot_before.vram is not None
-            and snapshot_after.vram is not None
-        ):
-            vram_change = abs(snapshot_before.vram - snapshot_after.vram)
-
-            # If the estimated model size does not match the change in VRAM, log a warning.
-            if not math.isclose(
-                vram_change,
-                cache_entry.size,
-                rel_tol=0.1,
-                abs_tol=10 * MB,
+        with self._lock:
+            # These attributes are not in the base ModelMixin class but in various derived classes.
+            # Some models don't have these attributes, in which case they run in RAM/CPU.
+            self.logger.debug(f"Called to move {cache_entry.key} to {target_device}")
+            if not (hasattr(cache_entry.model, "device") and hasattr(cache_entry.model, "to")):
+                return
+
+            source_device = cache_entry.model.device
+
+            # Note: We compare device types only so that 'cuda' == 'cuda:0'.
+            # This would need to be revised to support multi-GPU.
+            if torch.device(source_device).type == torch.device(target_device).type:
+                return
+
+            start_model_to_time = time.time()
+            snapshot_before = self._capture_memory_snapshot()
+            try:
+                cache_entry.model.to(target_device)
+            except Exception as e:  # blow away cache entry
+                self._delete_cache_entry(cache_entry)
+                raise e
+
+            snapshot_after = self._capture_memory_snapshot()
+            end_model_to_time = time.time()
+            self.logger.debug(
+                f"Moved model '{cache_entry.key}' from {source_device} to"
+                f" {target_device} in {(end_model_to_time-start_model_to_time):.2f}s."
+                f"Estimated model size: {(cache_entry.size/GIG):.3f} GB."
+                f"{get_pretty_snapshot_diff(snapshot_before, snapshot_after)}"
+            )
+
+            if (
+                snapshot_before is not None
+                and snapshot_after is not None
+                and snapshot_before.vram is not None
+                and snapshot_after.vram is not None
             ):
-                self.logger.debug(
-                    f"Moving model '{cache_entry.key}' from {source_device} to"
-                    f" {target_device} caused an unexpected change in VRAM usage. The model's"
-                    " estimated size may be incorrect. Estimated model size:"
-                    f" {(cache_entry.size/GIG):.3f} GB.\n"
-                    f"{get_pretty_snapshot_diff(snapshot_before, snapshot_after)}"
-                )
+                vram_change = abs(snapshot_before.vram - snapshot_after.vram)
+
+                # If the estimated model size does not match the change in VRAM, log a warning.
+                if not math.isclose(
+                    vram_change,
+                    cache_entry.size,
+                    rel_tol=0.1,
+                    abs_tol=10 * MB,
+                ):
+                    self.logger.debug(
+                        f"Moving model '{cache_entry.key}' from {source_device} to"
+                        f" {target_device} caused an unexpected change in VRAM usage. The model's"
+                        " estimated size may be incorrect. Estimated model size:"
+                        f" {(cache_entry.size/GIG):.3f} GB.\n"
+                        f"{get_pretty_snapshot_diff(snapshot_before, snapshot_after)}"
+                    )
 
     def print_cuda_stats(self) -> None:
         """Log CUDA diagnostics."""
-        vram = "%4.2fG" % (torch.cuda.memory_allocated() / GIG)
-        ram = "%4.2fG" % (self.cache_size() / GIG)
-
-        in_ram_models = 0
-        in_vram_models = 0
-        locked_in_vram_models = 0
-        for cache_record in self._cached_models.values():
-            if hasattr(cache_record.model, "device"):
-                if cache_record.model.device == self.storage_device:
-                    in_ram_models += 1
-                else:
-                    in_vram_models += 1
-                if cache_record.locked:
-                    locked_in_vram_models += 1
+        with self._lock:
+            vram = "%4.2fG" % (torch.cuda.memory_allocated() / GIG)
+            ram = "%4.2fG" % (self.cache_size() / GIG)
+
+            in_ram_models = 0
+            in_vram_models = 0
+            locked_in_vram_models = 0
+            for cache_record in self._cached_models.values():
+                if hasattr(cache_record.model, "device"):
+                    if cache_record.model.device == self.storage_device:
+                        in_ram_models += 1
+                    else:
+                        in_vram_models += 1
+                    if cache_record.locked:
+                        locked_in_vram_models += 1
 
-                self.logger.debug(
-                    f"Current VRAM/RAM usage: {vram}/{ram}; models_in_ram/models_in_vram(locked) ="
-                    f" {in_ram_models}/{in_vram_models}({locked_in_vram_models})"
-                )
+                    self.logger.debug(
+                        f"Current VRAM/RAM usage: {vram}/{ram}; models_in_ram/models_in_vram(locked) ="
+                        f" {in_ram_models}/{in_vram_models}({locked_in_vram_models})"
+                    )
 
     def make_room(self, size: int) -> None:
         """Make enough room in the cache to accommodate a new model of indicated size."""
-        # calculate how much memory this model will require
-        # multiplier = 2 if self.precision==torch.float32 else 1
-        bytes_needed = size
-        maximum_size = self.max_cache_size * GIG  # stored in GB, convert to bytes
-        current_size = self.cache_size()
-
-        if current_size + bytes_needed > maximum_size:
-            self.logger.debug(
-                f"Max cache size exceeded: {(current_size/GIG):.2f}/{self.max_cache_size:.2f} GB, need an additional"
-                f" {(bytes_needed/GIG):.2f} GB"
-            )
-
-        self.logger.debug(f"Before making_room: cached_models={len(self._cached_models)}")
-
-        pos = 0
-        models_cleared = 0
-        while current_size + bytes_needed > maximum_size and pos < len(self._cache_stack):
-            model_key = self._cache_stack[pos]
-            cache_entry = self._cached_models[model_key]
-
-            refs = sys.getrefcount(cache_entry.model)
-
-            # HACK: This is a workaround for a memory-management issue that we haven't tracked down yet. We are directly
-            # going against the advice in the Python docs by using `gc.get_referrers(...)` in this way:
-            # https://docs.python.org/3/library/gc.html#gc.get_referrers
-
-            # manualy clear local variable references of just finished function calls
-            # for some reason python don't want to collect it even by gc.collect() immidiately
-            if refs > 2:
-                while True:
-                    cleared = False
-                    for referrer in gc.get_referrers(cache_entry.model):
-                        if type(referrer).__name__ == "frame":
-                            # RuntimeError: cannot clear an executing frame
-                            with suppress(RuntimeError):
-                                referrer.clear()
-                                cleared = True
-                                # break
-
-                    # repeat if referrers changes(due to frame clear), else exit loop
-                    if cleared:
-                        gc.collect()
-                    else:
-                        break
-
-            device = cache_entry.model.device if hasattr(cache_entry.model, "device") else None
-            self.logger.debug(
-                f"Model: {model_key}, locks: {cache_entry._locks}, device: {device}, loaded: {cache_entry.loaded},"
-                f" refs: {refs}"
-            )
-
-            # Expected refs:
-            # 1 from cache_entry
-            # 1 from getrefcount function
-            # 1 from onnx runtime object
-            if not cache_entry.locked and refs <= (3 if "onnx" in model_key else 2):
+        with self._lock:
+            # calculate how much memory this model will require
+            # multiplier = 2 if self.precision==torch.float32 else 1
+            bytes_needed = size
+            maximum_size = self.max_cache_size * GIG  # stored in GB, convert to bytes
+            current_size = self.cache_size()
+
+            if current_size + bytes_needed > maximum_size:
                 self.logger.debug(
-                    f"Removing {model_key} from RAM cache to free at least {(size/GIG):.2f} GB (-{(cache_entry.size/GIG):.2f} GB)"
+                    f"Max cache size exceeded: {(current_size/GIG):.2f}/{self.max_cache_size:.2f} GB, need an additional"
+                    f" {(bytes_needed/GIG):.2f} GB"
                 )
-                current_size -= cache_entry.size
-                models_cleared += 1
-                self._delete_cache_entry(cache_entry)
-                del cache_entry
 
-            else:
-                pos += 1
-
-        if models_cleared > 0:
-            # There would likely be some 'garbage' to be collected regardless of whether a model was cleared or not, but
-            # there is a significant time cost to calling `gc.collect()`, so we want to use it sparingly. (The time cost
-            # is high even if no garbage gets collected.)
-            #
-            # Calling gc.collect(...) when a model is cleared seems like a good middle-ground:
-            # - If models had to be cleared, it's a signal that we are close to our memory limit.
-            # - If models were cleared, there's a good chance that there's a significant amount of garbage to be
-            #   collected.
-            #
-            # Keep in mind that gc is only responsible for handling reference cycles. Most objects should be cleaned up
-            # immediately when their reference count hits 0.
-            if self.stats:
-                self.stats.cleared = models_cleared
-            gc.collect()
+            self.logger.debug(f"Before making_room: cached_models={len(self._cached_models)}")
+
+            pos = 0
+            models_cleared = 0
+            while current_size + bytes_needed > maximum_size and pos < len(self._cache_stack):
+                model_key = self._cache_stack[pos]
+                cache_entry = self._cached_models[model_key]
+
+                refs = sys.getrefcount(cache_entry.model)
+
+                # HACK: This is a workaround for a memory-management issue that we haven't tracked down yet. We are directly
+                # going against the advice in the Python docs by using `gc.get_referrers(...)` in this way:
+                # https://docs.python.org/3/library/gc.html#gc.get_referrers
+
+                # manualy clear local variable references of just finished function calls
+                # for some reason python don't want to collect it even by gc.collect() immidiately
+                if refs > 2:
+                    while True:
+                        cleared = False
+                        for referrer in gc.get_referrers(cache_entry.model):
+                            if type(referrer).__name__ == "frame":
+                                # RuntimeError: cannot clear an executing frame
+                                with suppress(RuntimeError):
+                                    referrer.clear()
+                                    cleared = True
+                                    # break
+
+                        # repeat if referrers changes(due to frame clear), else exit loop
+                        if cleared:
+                            gc.collect()
+                        else:
+                            break
+
+                device = cache_entry.model.device if hasattr(cache_entry.model, "device") else None
+                self.logger.debug(
+                    f"Model: {model_key}, locks: {cache_entry._locks}, device: {device}, loaded: {cache_entry.loaded},"
+                    f" refs: {refs}"
+                )
 
-        torch.cuda.empty_cache()
-        if choose_torch_device() == torch.device("mps"):
-            mps.empty_cache()
+                # Expected refs:
+                # 1 from cache_entry
+                # 1 from getrefcount function
+                # 1 from onnx runtime object
+                if not cache_entry.locked and refs <= (3 if "onnx" in model_key else 2):
+                    self.logger.debug(
+                        f"Removing {model_key} from RAM cache to free at least {(size/GIG):.2f} GB (-{(cache_entry.size/GIG):.2f} GB)"
+                    )
+                    current_size -= cache_entry.size
+                    models_cleared += 1
+                    self._counters.evictions += 1
+                    self._counters.evicted_bytes += cache_entry.size
+                    self._delete_cache_entry(cache_entry)
+                    del cache_entry
 
-        self.logger.debug(f"After making room: cached_models={len(self._cached_models)}")
+                else:
+                    pos += 1
+
+            if models_cleared > 0:
+                # There would likely be some 'garbage' to be collected regardless of whether a model was cleared or not, but
+                # there is a significant time cost to calling `gc.collect()`, so we want to use it sparingly. (The time cost
+                # is high even if no garbage gets collected.)
+                #
+                # Calling gc.collect(...) when a model is cleared seems like a good middle-ground:
+                # - If models had to be cleared, it's a signal that we are close to our memory limit.
+                # - If models were cleared, there's a good chance that there's a significant amount of garbage to be
+                #   collected.
+                #
+                # Keep in mind that gc is only responsible for handling reference cycles. Most objects should be cleaned up
+                # immediately when their reference count hits 0.
+                if self.stats:
+                    self.stats.cleared = models_cleared
+                gc.collect()
+
+            torch.cuda.empty_cache()
+            if choose_torch_device() == torch.device("mps"):
+                mps.empty_cache()
+
+            self.logger.debug(f"After making room: cached_models={len(self._cached_models)}")
 
     def _delete_cache_entry(self, cache_entry: CacheRecord[AnyModel]) -> None:
         self._cache_stack.remove(cache_entry.key)
@@ -33,23 +33,24 @@ class ModelLocker(ModelLockerBase):
             return self.model
 
         # NOTE that the model has to have the to() method in order for this code to move it into GPU!
-        self._cache_entry.lock()
-        try:
-            if self._cache.lazy_offloading:
-                self._cache.offload_unlocked_models(self._cache_entry.size)
+        with self._cache.lock:
+            self._cache_entry.lock()
+            try:
+                if self._cache.lazy_offloading:
+                    self._cache.offload_unlocked_models(self._cache_entry.size)
 
-            self._cache.move_model_to_device(self._cache_entry, self._cache.execution_device)
-            self._cache_entry.loaded = True
+                self._cache.move_model_to_device(self._cache_entry, self._cache.execution_device)
+                self._cache_entry.loaded = True
 
-            self._cache.logger.debug(f"Locking {self._cache_entry.key} in {self._cache.execution_device}")
-            self._cache.print_cuda_stats()
-        except torch.cuda.OutOfMemoryError:
-            self._cache.logger.warning("Insufficient GPU memory to load model. Aborting")
-            self._cache_entry.unlock()
-            raise
-        except Exception:
-            self._cache_entry.unlock()
-            raise
+                self._cache.logger.debug(f"Locking {self._cache_entry.key} in {self._cache.execution_device}")
+                self._cache.print_cuda_stats()
+            except torch.cuda.OutOfMemoryError:
+                self._cache.logger.warning("Insufficient GPU memory to load model. Aborting")
+                self._cache_entry.unlock()
+                raise
+            except Exception:
+                self._cache_entry.unlock()
+                raise
 
         return self.model
 
@@ -58,7 +59,8 @@ class ModelLocker(ModelLockerBase):
         if not hasattr(self.model, "to"):
             return
 
-        self._cache_entry.unlock()
-        if not self._cache.lazy_offloading:
-            self._cache.offload_unlocked_models(self._cache_entry.size)
-            self._cache.print_cuda_stats()
+        with self._cache.lock:
+            self._cache_entry.unlock()
+            if not self._cache.lazy_offloading:
+                self._cache.offload_unlocked_models(self._cache_entry.size)
+                self._cache.print_cuda_stats()
@@ -0,0 +1,45 @@
+import os
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from invokeai.app.api_app import app
+from invokeai.app.invocations.primitives import IntegerInvocation, IntegerOutput
+from invokeai.app.services.shared.graph import Graph
+
+
+@pytest.fixture(autouse=True, scope="module")
+def client(invokeai_root_dir: Path) -> TestClient:
+    os.environ["INVOKEAI_ROOT"] = invokeai_root_dir.as_posix()
+    return TestClient(app)
+
+
+@pytest.fixture
+def running_queue_item(monkeypatch: Any) -> None:
+    graph = Graph()
+    graph.add_node(IntegerInvocation(id="1", value=42))
+    queue_item = SimpleNamespace(
+        queue_id="default",
+        session=SimpleNamespace(execution_graph=graph, results={"1": IntegerOutput(value=42)}),
+    )
+    session_processor = SimpleNamespace(get_running_queue_item=lambda item_id: queue_item)
+    monkeypatch.setattr(
+        "invokeai.app.api.routers.session_queue.ApiDependencies",
+        SimpleNamespace(invoker=SimpleNamespace(services=SimpleNamespace(session_processor=session_processor))),
+    )
+
+
+def test_get_queue_item_node(running_queue_item: None, client: TestClient) -> None:
+    response = client.get("/api/v1/queue/default/i/1/nodes/1")
+    assert response.status_code == 200
+    assert response.json()["node"]["value"] == 42
+    assert response.json()["result"]["value"] == 42
+    assert client.get("/api/v1/queue/default/i/1/nodes/2").status_code == 404
+
+
+def test_get_queue_item_node_of_another_queue(running_queue_item: None, client: TestClient) -> None:
+    response = client.get("/api/v1/queue/other/i/1/nodes/1")
+    assert response.status_code == 404
@@ -0,0 +1,28 @@
+import threading
+
+import torch
+
+from invokeai.backend.model_manager.load.model_cache import CacheStats, ModelCache
+
+
+def test_model_cache_collects_stats_per_thread():
+    cache = ModelCache(execution_device=torch.device("cpu"), max_cache_size=1.0)
+    cache.put("a", torch.nn.Linear(2, 2), size=100)
+    main_stats = CacheStats()
+    cache.stats = main_stats
+
+    def get_in_thread() -> None:
+        thread_stats = CacheStats()
+        cache.stats = thread_stats
+        cache.get("a")
+        cache.get("a")
+        assert thread_stats.hits == 2
+
+    thread = threading.Thread(target=get_in_thread)
+    thread.start()
+    thread.join()
+    cache.get("a")
+
+    # Each thread's stats only count its own cache accesses, while the counters count all of them
+    assert main_stats.hits == 1
+    assert cache.counters.hits == 3
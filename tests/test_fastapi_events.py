@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from typing import Any
+
+import pytest
+
+from invokeai.app.api import events
+from invokeai.app.api.events import FastAPIEventService
+
+
+@pytest.fixture
+def dispatched(monkeypatch: pytest.MonkeyPatch) -> list[tuple[str, Any]]:
+    dispatched: list[tuple[str, Any]] = []
+    monkeypatch.setattr(
+        events, "dispatch", lambda event_name, payload, middleware_id: dispatched.append((event_name, payload))
+    )
+    return dispatched
+
+
+def test_fastapi_events_dispatches_events_from_threads(dispatched: list[tuple[str, Any]]):
+    async def run():
+        event_service = FastAPIEventService(event_handler_id=0)
+        threads = [
+            threading.Thread(target=lambda i=i: [event_service.dispatch("event", (i, j)) for j in range(50)])
+            for i in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The events are dispatched without polling, once the event loop is free
+        for _ in range(10):
+            await asyncio.sleep(0)
+        status = event_service.get_dispatch_status()
+        event_service.stop()
+        return status
+
+    status = asyncio.run(run())
+    assert status is not None
+    assert status.queue_depth == 0
+    assert status.dispatched == 200
+    # Bursts of events are dispatched in batches
+    assert status.batches < 200
+    assert len(dispatched) == 200
+    # Events from each thread are dispatched in order
+    for i in range(4):
+        assert [payload for _, payload in dispatched if payload[0] == i] == [(i, j) for j in range(50)]
+
+
+def test_fastapi_events_dispatches_pending_events_on_stop(dispatched: list[tuple[str, Any]]):
+    async def run():
+        event_service = FastAPIEventService(event_handler_id=0)
+        event_service.dispatch("foo", 1)
+        event_service.stop()
+        event_service.dispatch("bar", 2)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert dispatched == [("foo", 1), ("bar", 2)]
+
+
+def test_fastapi_events_wants_progress_images_of_subscribed_queues():
+    async def run():
+        event_service = FastAPIEventService(event_handler_id=0)
+        assert not event_service.wants_progress_images("default")
+        event_service.set_progress_image_subscribers("default", 2)
+        assert event_service.wants_progress_images("default")
+        assert not event_service.wants_progress_images("other")
+        event_service.stop()
+
+    asyncio.run(run())
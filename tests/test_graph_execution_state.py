@@ -1,3 +1,4 @@
+import time
 from typing import Optional
 from unittest.mock import Mock
 
@@ -12,12 +13,14 @@ from .test_nodes import (  # isort: split
 
 from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput, InvocationContext
 from invokeai.app.invocations.collections import RangeInvocation
+from invokeai.app.invocations.fields import ColorField, ConditioningField, ImageField, TensorField
 from invokeai.app.invocations.math import AddInvocation, MultiplyInvocation
 from invokeai.app.services.shared.graph import (
     CollectInvocation,
     Graph,
     GraphExecutionState,
     IterateInvocation,
+    copy_input,
 )
 
 from .test_nodes import create_edge
@@ -222,3 +225,103 @@ def test_graph_iterate_execution_order(execution_number: int):
     _ = invoke_next(g)
     assert _[1].item == "Dinosaur Sushi"
     _ = invoke_next(g)
+
+
+def test_copy_input_shares_immutable_values():
+    assert copy_input("Cat sushi") == "Cat sushi"
+    prompts = ["Cat sushi", "Dog sushi"]
+    copied_prompts = copy_input(prompts)
+    assert copied_prompts == prompts
+    assert copied_prompts is not prompts
+
+    image = ImageField(image_name="Banana sushi")
+    assert copy_input(image) == image
+    assert copy_input(image) is not image
+
+    images = [image, image]
+    copied_images = copy_input(images)
+    assert copied_images == images
+    assert all(i is not image for i in copied_images)
+
+    conditioning = ConditioningField(conditioning_name="Grape sushi", mask=TensorField(tensor_name="Rice"))
+    copied_conditioning = copy_input(conditioning)
+    assert copied_conditioning == conditioning
+    assert copied_conditioning.mask is not conditioning.mask
+
+    color = ColorField(r=0, g=0, b=0, a=255)
+    assert copy_input(color) == color
+    assert copy_input(color) is not color
+
+    nested = [[1, 2], [3]]
+    copied_nested = copy_input(nested)
+    assert copied_nested == nested
+    assert copied_nested[0] is not nested[0]
+
+
+def test_graph_state_sees_direct_mutations_of_its_graph():
+    graph = Graph()
+    graph.add_node(PromptTestInvocation(id="1", prompt="Banana sushi"))
+    graph.add_node(PromptTestInvocation(id="2", prompt="Grape sushi"))
+    g = GraphExecutionState(graph=graph)
+    while invoke_next(g)[0] is not None:
+        pass
+    assert g.is_complete()
+
+    # Same number of nodes and edges, but a different graph
+    g.graph.delete_node("2")
+    g.graph.add_node(PromptTestInvocation(id="3", prompt="Orange sushi"))
+    assert not g.is_complete()
+    n = invoke_next(g)[0]
+    assert n is not None and g.prepared_source_mapping[n.id] == "3"
+    assert g.is_complete()
+
+
+def create_iterate_collect_graph(prompts: list[str]) -> Graph:
+    graph = Graph()
+    graph.add_node(PromptCollectionTestInvocation(id="prompt_collection", collection=prompts))
+    graph.add_node(IterateInvocation(id="iterate"))
+    graph.add_node(PromptTestInvocation(id="prompt_iterated"))
+    graph.add_node(PromptTestInvocation(id="prompt_successor"))
+    graph.add_node(CollectInvocation(id="collect"))
+    graph.add_edge(create_edge("prompt_collection", "collection", "iterate", "collection"))
+    graph.add_edge(create_edge("iterate", "item", "prompt_iterated", "prompt"))
+    graph.add_edge(create_edge("prompt_iterated", "prompt", "prompt_successor", "prompt"))
+    graph.add_edge(create_edge("prompt_successor", "prompt", "collect", "item"))
+    return graph
+
+
+def test_graph_resumes_after_deserialization():
+    """Tests that a deserialized execution state continues where it left off"""
+    test_prompts = ["Banana sushi", "Cat sushi", "Strawberry Sushi"]
+    g = GraphExecutionState(graph=create_iterate_collect_graph(list(test_prompts)))
+    for _ in range(5):
+        invoke_next(g)
+
+    resumed = GraphExecutionState.model_validate_json(g.model_dump_json())
+    while (n := invoke_next(resumed))[0] is not None:
+        assert n[0].id not in g.executed
+        last = n
+
+    assert resumed.is_complete()
+    assert isinstance(last[0], CollectInvocation)
+    assert sorted(last[1].collection) == sorted(test_prompts)
+    assert len(resumed.executed_history) == 5
+
+
+@pytest.mark.slow
+def test_graph_execution_scheduling_throughput():
+    # 1000 iterations of 2 nodes each, plus the collection, iterate and collect nodes
+    iteration_count = 1000
+    g = GraphExecutionState(graph=create_iterate_collect_graph([f"Sushi {i}" for i in range(iteration_count)]))
+
+    node_count = 0
+    start = time.perf_counter()
+    while (n := g.next()) is not None:
+        g.complete(n.id, n.invoke(Mock(InvocationContext)))
+        node_count += 1
+    elapsed = time.perf_counter() - start
+
+    assert g.is_complete()
+    assert node_count == 3 * iteration_count + 2
+    # Scheduling a node must not scan the execution graph, which would make this quadratic in the node count
+    assert node_count / elapsed > 1000
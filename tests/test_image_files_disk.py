@@ -0,0 +1,346 @@
+# pyright: reportPrivateUsage=false
+import json
+import logging
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from invokeai.app.invocations.fields import MetadataField
+from invokeai.app.services.image_files.image_files_common import ImageFileNotFoundException, ImageFileSaveException
+from invokeai.app.services.image_files.image_files_disk import DiskImageFileStorage, get_decoded_size
+from invokeai.app.services.image_files.image_files_encoders import PngImageEncoder
+
+# 64x64 RGB images are 12 KiB decoded
+IMAGE_BYTES = 64 * 64 * 3
+
+
+def write_image(folder: Path, image_name: str, color: tuple[int, int, int] = (0, 0, 0)) -> None:
+    Image.new("RGB", (64, 64), color).save(folder / image_name)
+
+
+def create_invoker() -> SimpleNamespace:
+    return SimpleNamespace(
+        services=SimpleNamespace(
+            configuration=SimpleNamespace(pil_compress_level=1), logger=logging.getLogger("image_files")
+        )
+    )
+
+
+@pytest.fixture
+def image_files(tmp_path: Path) -> DiskImageFileStorage:
+    image_files = DiskImageFileStorage(tmp_path, max_cache_bytes=2 * IMAGE_BYTES)
+    image_files.start(create_invoker())  # type: ignore
+    return image_files
+
+
+def test_image_files_disk_loads_images_fully(tmp_path: Path, image_files: DiskImageFileStorage):
+    write_image(tmp_path, "foo.png", (255, 0, 0))
+    image = image_files.get("foo.png")
+    # The image was decoded and its file closed
+    assert getattr(image, "fp", None) is None
+    assert image.getpixel((0, 0)) == (255, 0, 0)
+
+
+def test_image_files_disk_raises_not_found(image_files: DiskImageFileStorage):
+    with pytest.raises(ImageFileNotFoundException):
+        image_files.get("missing.png")
+
+
+def test_image_files_disk_cache_is_lru(tmp_path: Path, image_files: DiskImageFileStorage):
+    for name in ["1.png", "2.png", "3.png"]:
+        write_image(tmp_path, name)
+    image_1 = image_files.get("1.png")
+    image_files.get("2.png")
+    # Reusing the first image makes the second the least recently used
+    assert image_files.get("1.png") is image_1
+    image_files.get("3.png")
+    assert image_files.get("1.png") is image_1
+    status = image_files.get_cache_status()
+    assert status.size == 2
+    assert status.size_bytes == 2 * IMAGE_BYTES
+    assert status.hits == 2
+    assert status.misses == 3
+    assert status.evictions == 1
+
+
+def test_image_files_disk_cache_skips_large_images(tmp_path: Path, image_files: DiskImageFileStorage):
+    write_image(tmp_path, "small.png")
+    Image.new("RGB", (128, 128)).save(tmp_path / "large.png")
+    image_files.get("small.png")
+    image_files.get("large.png")
+    assert image_files.get_cache_status().size == 1
+    assert image_files.get_cache_status().evictions == 0
+
+
+def test_image_files_disk_saves_and_deletes(tmp_path: Path, image_files: DiskImageFileStorage):
+    image = Image.new("RGB", (64, 64), (0, 255, 0))
+    image_files.save(image, "foo.png")
+    assert image_files.get("foo.png") is image
+    assert image_files.get_cache_status().hits == 1
+    image_files.delete("foo.png")
+    assert image_files.get_cache_status().size == 0
+    with pytest.raises(ImageFileNotFoundException):
+        image_files.get("foo.png")
+
+
+def test_image_files_disk_cache_is_thread_safe(tmp_path: Path, image_files: DiskImageFileStorage):
+    names = [f"{i}.png" for i in range(8)]
+    for i, name in enumerate(names):
+        write_image(tmp_path, name, (i, i, i))
+    errors: list[Exception] = []
+
+    def worker(offset: int):
+        try:
+            for i in range(100):
+                index = (i * 3 + offset) % len(names)
+                assert image_files.get(names[index]).getpixel((0, 0)) == (index, index, index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    status = image_files.get_cache_status()
+    assert status.hits + status.misses == 400
+    assert status.size_bytes == status.size * IMAGE_BYTES <= 2 * IMAGE_BYTES
+
+
+def test_image_files_disk_embeds_info_in_png(tmp_path: Path, image_files: DiskImageFileStorage):
+    image_files.save(Image.new("RGB", (64, 64)), "foo.png", metadata=MetadataField({"foo": "bar"}))
+    with Image.open(tmp_path / "foo.png") as image:
+        assert json.loads(image.info["invokeai_metadata"]) == {"foo": "bar"}
+
+
+def test_image_files_disk_saves_webp(tmp_path: Path, image_files: DiskImageFileStorage):
+    assert image_files.get_extension(Image.new("RGB", (64, 64)), "png") == ".png"
+    assert image_files.get_extension(Image.new("RGB", (64, 64)), "webp_lossless") == ".webp"
+    assert image_files.get_media_type("foo.webp") == "image/webp"
+    assert image_files.get_media_type("foo.png") == "image/png"
+    image_files.save(Image.new("RGBA", (64, 64), (1, 2, 3, 4)), "foo.webp", image_format="webp_lossless")
+    with Image.open(tmp_path / "foo.webp") as image:
+        assert image.format == "WEBP"
+        # Lossless, including the alpha channel
+        assert image.getpixel((0, 0)) == (1, 2, 3, 4)
+    assert image_files.get_path("foo.webp", thumbnail=True).exists()
+
+
+def test_image_files_disk_saves_unsupported_webp_modes_as_png(tmp_path: Path, image_files: DiskImageFileStorage):
+    mask = Image.new("L", (64, 64), 128)
+    assert image_files.get_extension(mask, "webp_lossless") == ".png"
+    image_files.save(mask, "foo.png", image_format="webp_lossless", metadata=MetadataField({"foo": "bar"}))
+    with Image.open(tmp_path / "foo.png") as image:
+        assert image.format == "PNG"
+        assert image.mode == "L"
+        assert json.loads(image.info["invokeai_metadata"]) == {"foo": "bar"}
+
+
+def test_image_files_disk_rejects_unknown_formats(image_files: DiskImageFileStorage):
+    with pytest.raises(ImageFileSaveException):
+        image_files.save(Image.new("RGB", (64, 64)), "foo.jxl", image_format="jpeg_xl")
+
+
+def test_get_decoded_size():
+    assert get_decoded_size(Image.new("RGBA", (10, 10))) == 400
+    assert get_decoded_size(Image.new("L", (10, 10))) == 100
+    assert get_decoded_size(Image.new("F", (10, 10))) == 400
+    assert get_decoded_size(Image.new("I;16", (10, 10))) == 200
+
+
+class GatedImageEncoder(PngImageEncoder):
+    """Blocks image writes until the gate is opened."""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+
+    def save(self, image: Image.Image, path: Path, info: dict[str, str]) -> None:
+        self.gate.wait()
+        super().save(image, path, info)
+
+
+@pytest.fixture
+def gated_encoder() -> GatedImageEncoder:
+    return GatedImageEncoder()
+
+
+@pytest.fixture
+def async_image_files(tmp_path: Path, gated_encoder: GatedImageEncoder):
+    image_files = DiskImageFileStorage(tmp_path, max_cache_bytes=0, write_workers=2, encoders={"png": gated_encoder})
+    invoker = create_invoker()
+    image_files.start(invoker)  # type: ignore
+    yield image_files
+    gated_encoder.gate.set()
+    image_files.stop(invoker)  # type: ignore
+
+
+def test_image_files_disk_writes_in_background(
+    tmp_path: Path, async_image_files: DiskImageFileStorage, gated_encoder: GatedImageEncoder
+):
+    image = Image.new("RGB", (64, 64), (0, 0, 255))
+    async_image_files.save(image, "foo.png")
+    assert not (tmp_path / "foo.png").exists()
+    # Changes made by the caller after saving do not affect the saved image
+    image.paste((255, 0, 0), (0, 0, 64, 64))
+    # The image is not cached, but is returned from memory until it is written
+    assert async_image_files.get("foo.png").getpixel((0, 0)) == (0, 0, 255)
+
+    paths: list[Path] = []
+    reader = threading.Thread(target=lambda: paths.append(async_image_files.get_path("foo.png")))
+    reader.start()
+    reader.join(timeout=0.1)
+    # The reader waits for the image to be written
+    assert reader.is_alive()
+    gated_encoder.gate.set()
+    reader.join()
+    assert paths == [tmp_path / "foo.png"]
+    assert paths[0].exists()
+    assert Image.open(paths[0]).getpixel((0, 0)) == (0, 0, 255)
+    assert async_image_files.get_path("foo.png", thumbnail=True).exists()
+    assert async_image_files.get("foo.png").getpixel((0, 0)) == (0, 0, 255)
+
+
+def test_image_files_disk_batches_thumbnails(
+    tmp_path: Path, async_image_files: DiskImageFileStorage, gated_encoder: GatedImageEncoder
+):
+    names = [f"{i}.png" for i in range(6)]
+    for name in names:
+        async_image_files.save(Image.new("RGB", (64, 64)), name)
+    # Once both write threads are blocked writing images, the remaining thumbnails are queued in a single batch
+    thumbnail_writes = async_image_files._DiskImageFileStorage__thumbnail_writes  # type: ignore
+    pending = [thumbnail_writes[name] for name in names if name in thumbnail_writes]
+    assert len(pending) >= len(names) - 2
+    assert len({id(write) for write in pending}) == 1
+    gated_encoder.gate.set()
+    for name in names:
+        assert async_image_files.get_path(name, thumbnail=True).exists()
+
+
+def test_image_files_disk_skips_writing_deleted_images(
+    tmp_path: Path, async_image_files: DiskImageFileStorage, gated_encoder: GatedImageEncoder
+):
+    # Block both write threads, so the remaining writes stay queued
+    async_image_files.save(Image.new("RGB", (64, 64)), "1.png")
+    async_image_files.save(Image.new("RGB", (64, 64)), "2.png")
+    async_image_files.save(Image.new("RGB", (64, 64)), "3.png")
+    deleter = threading.Thread(target=lambda: async_image_files.delete("3.png"))
+    deleter.start()
+    gated_encoder.gate.set()
+    deleter.join()
+    with pytest.raises(ImageFileNotFoundException):
+        async_image_files.get("3.png")
+    assert not async_image_files.get_path("3.png").exists()
+    assert not async_image_files.get_path("3.png", thumbnail=True).exists()
+    assert async_image_files.get_path("1.png").exists()
+
+
+def test_image_files_disk_writes_pending_images_on_stop(tmp_path: Path, gated_encoder: GatedImageEncoder):
+    image_files = DiskImageFileStorage(tmp_path, write_workers=1, encoders={"png": gated_encoder})
+    invoker = create_invoker()
+    image_files.start(invoker)  # type: ignore
+    gated_encoder.gate.set()
+    for i in range(4):
+        image_files.save(Image.new("RGB", (64, 64)), f"{i}.png")
+    image_files.stop(invoker)  # type: ignore
+    assert all((tmp_path / f"{i}.png").exists() for i in range(4))
+
+
+@pytest.fixture
+def deferred_image_files(tmp_path: Path) -> DiskImageFileStorage:
+    image_files = DiskImageFileStorage(tmp_path, max_cache_bytes=0, max_deferred_bytes=2 * IMAGE_BYTES)
+    image_files.start(create_invoker())  # type: ignore
+    return image_files
+
+
+def test_image_files_disk_writes_deferred_images_when_requested(
+    tmp_path: Path, deferred_image_files: DiskImageFileStorage
+):
+    image = Image.new("RGB", (64, 64), (0, 0, 255))
+    deferred_image_files.save(image, "foo.png", deferred=True)
+    image.paste((255, 0, 0), (0, 0, 64, 64))
+    assert not (tmp_path / "foo.png").exists()
+    # The deferred image is returned as a copy, so changes made to it do not affect the saved image
+    deferred_image_files.get("foo.png").paste((255, 0, 0), (0, 0, 64, 64))
+    assert deferred_image_files.get("foo.png").getpixel((0, 0)) == (0, 0, 255)
+    assert deferred_image_files.get_cache_status().deferred_bytes == IMAGE_BYTES
+    # Requesting the thumbnail writes the image too
+    assert deferred_image_files.get_path("foo.png", thumbnail=True).exists()
+    assert (tmp_path / "foo.png").exists()
+    assert deferred_image_files.get_cache_status().deferred == 0
+    assert deferred_image_files.get_cache_status().deferred_bytes == 0
+    assert deferred_image_files.get("foo.png").getpixel((0, 0)) == (0, 0, 255)
+
+
+def test_image_files_disk_spills_least_recently_used_deferred_images(
+    tmp_path: Path, deferred_image_files: DiskImageFileStorage
+):
+    deferred_image_files.save(Image.new("RGB", (64, 64)), "1.png", deferred=True)
+    deferred_image_files.save(Image.new("RGB", (64, 64)), "2.png", deferred=True)
+    # Using the first image makes the second the least recently used
+    deferred_image_files.get("1.png")
+    deferred_image_files.save(Image.new("RGB", (64, 64)), "3.png", deferred=True)
+    assert [(tmp_path / name).exists() for name in ["1.png", "2.png", "3.png"]] == [False, True, False]
+    assert deferred_image_files.get_cache_status().deferred == 2
+    # Images too large to defer are written immediately
+    deferred_image_files.save(Image.new("RGB", (128, 128)), "large.png", deferred=True)
+    assert (tmp_path / "large.png").exists()
+    assert deferred_image_files.get_cache_status().deferred_bytes == 2 * IMAGE_BYTES
+
+
+def test_image_files_disk_deletes_deferred_images(tmp_path: Path, deferred_image_files: DiskImageFileStorage):
+    deferred_image_files.save(Image.new("RGB", (64, 64)), "foo.png", deferred=True)
+    deferred_image_files.delete("foo.png")
+    assert deferred_image_files.get_cache_status().deferred_bytes == 0
+    with pytest.raises(ImageFileNotFoundException):
+        deferred_image_files.get("foo.png")
+    assert not (tmp_path / "foo.png").exists()
+
+
+def test_image_files_disk_flush_writes_deferred_images(tmp_path: Path):
+    image_files = DiskImageFileStorage(tmp_path, write_workers=2, max_deferred_bytes=4 * IMAGE_BYTES)
+    invoker = create_invoker()
+    image_files.start(invoker)  # type: ignore
+    image_files.save(Image.new("RGB", (64, 64)), "deferred.png", deferred=True)
+    image_files.save(Image.new("RGB", (64, 64)), "written.png")
+    assert image_files.is_deferred("deferred.png")
+    assert not image_files.is_deferred("written.png")
+    image_files.flush()
+    assert not image_files.is_deferred("deferred.png")
+    # Flushing waits for the background writes
+    assert (tmp_path / "deferred.png").exists() and (tmp_path / "written.png").exists()
+    assert image_files.get_cache_status().deferred == 0
+    image_files.stop(invoker)  # type: ignore
+
+
+def test_image_files_disk_writes_deferred_images_on_stop(tmp_path: Path):
+    image_files = DiskImageFileStorage(tmp_path, write_workers=2, max_deferred_bytes=4 * IMAGE_BYTES)
+    invoker = create_invoker()
+    image_files.start(invoker)  # type: ignore
+    for i in range(4):
+        image_files.save(Image.new("RGB", (64, 64)), f"{i}.png", deferred=True)
+    assert not any((tmp_path / f"{i}.png").exists() for i in range(4))
+    image_files.stop(invoker)  # type: ignore
+    assert all((tmp_path / f"{i}.png").exists() for i in range(4))
+    assert all(image_files.get_path(f"{i}.png", thumbnail=True).exists() for i in range(4))
+
+
+class FailingImageEncoder(PngImageEncoder):
+    def save(self, image: Image.Image, path: Path, info: dict[str, str]) -> None:
+        raise OSError("Disk full")
+
+
+def test_image_files_disk_raises_when_deferred_images_cannot_be_written(tmp_path: Path):
+    image_files = DiskImageFileStorage(
+        tmp_path, max_cache_bytes=0, max_deferred_bytes=IMAGE_BYTES, encoders={"png": FailingImageEncoder()}
+    )
+    image_files.start(create_invoker())  # type: ignore
+    image_files.save(Image.new("RGB", (64, 64)), "foo.png", deferred=True)
+    with pytest.raises(ImageFileSaveException, match="foo.png"):
+        image_files.get_path("foo.png")
+    assert image_files.get_cache_status().deferred == 0
+    assert not (tmp_path / "foo.png").exists()
@@ -0,0 +1,52 @@
+import pytest
+
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.image_records.image_records_common import (
+    ImageCategory,
+    ImageRecordNotFoundException,
+    ResourceOrigin,
+)
+from invokeai.app.services.image_records.image_records_sqlite import SqliteImageRecordStorage
+from invokeai.app.services.workflow_records.workflow_records_common import WorkflowMeta, WorkflowWithoutID
+from invokeai.backend.util.logging import InvokeAILogger
+from tests.fixtures.sqlite_database import create_mock_sqlite_database
+
+
+@pytest.fixture
+def image_records() -> SqliteImageRecordStorage:
+    db = create_mock_sqlite_database(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+    return SqliteImageRecordStorage(db=db)
+
+
+def save_image(image_records: SqliteImageRecordStorage, image_name: str, workflow: WorkflowWithoutID | None) -> None:
+    image_records.save(
+        image_name=image_name,
+        image_origin=ResourceOrigin.INTERNAL,
+        image_category=ImageCategory.GENERAL,
+        width=64,
+        height=64,
+        has_workflow=workflow is not None,
+        workflow=workflow,
+    )
+
+
+def test_image_records_sqlite_stores_workflows(image_records: SqliteImageRecordStorage):
+    workflow = WorkflowWithoutID(
+        name="foo",
+        author="",
+        description="",
+        version="1.0.0",
+        contact="",
+        tags="",
+        notes="",
+        exposedFields=[],
+        meta=WorkflowMeta(version="2.0.0"),
+        nodes=[{"id": "1"}],
+        edges=[],
+    )
+    save_image(image_records, "with_workflow.webp", workflow)
+    save_image(image_records, "without_workflow.webp", None)
+    assert image_records.get_workflow("with_workflow.webp") == workflow
+    assert image_records.get_workflow("without_workflow.webp") is None
+    with pytest.raises(ImageRecordNotFoundException):
+        image_records.get_workflow("missing.webp")
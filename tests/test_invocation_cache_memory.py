@@ -1,8 +1,20 @@
 # pyright: reportPrivateUsage=false
+import time
 from contextlib import suppress
 
-from invokeai.app.invocations.fields import ImageField
-from invokeai.app.invocations.primitives import ImageOutput
+import pytest
+
+from invokeai.app.invocations.baseinvocation import BaseInvocation
+from invokeai.app.invocations.fields import (
+    BoardField,
+    ColorField,
+    ConditioningField,
+    ImageField,
+    LatentsField,
+    MetadataField,
+)
+from invokeai.app.invocations.image import BlankImageInvocation
+from invokeai.app.invocations.primitives import ConditioningOutput, ImageOutput, LatentsOutput
 from invokeai.app.services.invocation_cache.invocation_cache_memory import MemoryInvocationCache
 from tests.test_nodes import PromptTestInvocation
 
@@ -25,6 +37,24 @@ def test_invocation_cache_memory_creates_deterministic_keys():
 
     assert hash1 == hash2
     assert hash1 != hash3
+    # Keys are digests rather than python's per-process salted `hash()`
+    assert isinstance(hash1, str) and len(hash1) == 32
+
+
+def test_invocation_cache_memory_keys_ignore_non_semantic_fields():
+    invocation = BlankImageInvocation(width=64)
+    key = MemoryInvocationCache.create_key(invocation)
+    assert MemoryInvocationCache.create_key(BlankImageInvocation(width=64)) == key
+    assert (
+        MemoryInvocationCache.create_key(BlankImageInvocation(width=64, metadata=MetadataField({"foo": "bar"}))) == key
+    )
+    # A cached output image is on the board it was saved to
+    assert MemoryInvocationCache.create_key(BlankImageInvocation(width=64, board=BoardField(board_id="foo"))) != key
+    assert MemoryInvocationCache.create_key(BlankImageInvocation(width=32)) != key
+    assert (
+        MemoryInvocationCache.create_key(BlankImageInvocation(width=64, color=ColorField(r=1, g=0, b=0, a=255))) != key
+    )
+    assert MemoryInvocationCache.create_key(BlankImageInvocation(width=64, is_intermediate=True)) != key
 
 
 def test_invocation_cache_memory_adds_invocation():
@@ -181,3 +211,77 @@ def test_invocation_cache_memory_status():
     assert status.hits == 0
     assert status.misses == 0
     assert status.max_size == 0
+
+
+def test_invocation_cache_memory_is_limited_by_bytes():
+    output_1 = ImageOutput(image=ImageField(image_name="foo"), width=512, height=512)
+    output_2 = ImageOutput(image=ImageField(image_name="bar"), width=512, height=512)
+    output_3 = ImageOutput(image=ImageField(image_name="baz"), width=512, height=512)
+    output_size = len(output_1.model_dump_json())
+    cache = MemoryInvocationCache(max_cache_size=5, max_cache_bytes=output_size * 2)
+    cache.save(1, output_1)
+    cache.save(2, output_2)
+    assert cache._size_bytes == output_size * 2
+    cache.save(3, output_3)
+    assert list(cache._cache.keys()) == [2, 3]
+    assert cache._size_bytes == output_size * 2
+    assert "foo" not in cache._references
+    status = cache.get_status()
+    assert status.size_bytes == output_size * 2
+    assert status.max_size_bytes == output_size * 2
+
+    # An output larger than the whole cache is not cached
+    cache.save(4, ImageOutput(image=ImageField(image_name="a" * output_size * 2), width=512, height=512))
+    assert list(cache._cache.keys()) == [2, 3]
+
+
+def test_invocation_cache_memory_indexes_references():
+    # The _delete_by_match method attempts to log but the logger is not set up in the test environment
+    with suppress(AttributeError):
+        cache = MemoryInvocationCache(max_cache_size=5)
+        cache.save(1, ImageOutput(image=ImageField(image_name="foo"), width=512, height=512))
+        cache.save(2, LatentsOutput(latents=LatentsField(latents_name="foo_latents"), width=512, height=512))
+        cache.save(3, ConditioningOutput(conditioning=ConditioningField(conditioning_name="foo_conditioning")))
+        assert cache._references == {"foo": {1}, "foo_latents": {2}, "foo_conditioning": {3}}
+        # Only exact references are matched
+        cache._delete_by_match("fo")
+        assert list(cache._cache.keys()) == [1, 2, 3]
+        cache._delete_by_match("foo_latents")
+        assert list(cache._cache.keys()) == [1, 3]
+        cache._delete_by_match("foo_conditioning")
+        assert list(cache._cache.keys()) == [1]
+        assert cache._references == {"foo": {1}}
+        assert cache.is_referenced("foo")
+        assert not cache.is_referenced("foo_latents")
+
+
+@pytest.mark.slow
+def test_invocation_cache_key_throughput():
+    invocations: list[BaseInvocation] = []
+    for invocation_class in BaseInvocation.get_invocations():
+        try:
+            invocation = invocation_class()
+        except Exception:
+            continue  # The invocation has required fields
+        if "metadata" in invocation_class.model_fields:
+            invocation.metadata = MetadataField({f"key_{i}": "value" * 20 for i in range(200)})
+        invocations.append(invocation)
+    rounds = 200
+
+    def old_create_key(invocation: BaseInvocation) -> int:
+        return hash(invocation.model_dump_json(exclude={"id"}, warnings=False))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for invocation in invocations:
+            old_create_key(invocation)
+    serialized_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for invocation in invocations:
+            MemoryInvocationCache.create_key(invocation)
+    fingerprint_elapsed = time.perf_counter() - start
+
+    # Hashing field by field avoids serializing large values that are not part of the key, e.g. the metadata
+    assert fingerprint_elapsed < serialized_elapsed / 2
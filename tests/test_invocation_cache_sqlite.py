@@ -0,0 +1,91 @@
+# pyright: reportPrivateUsage=false
+from unittest.mock import Mock
+
+import pytest
+
+from invokeai.app.invocations.fields import ImageField, LatentsField
+from invokeai.app.invocations.primitives import ImageOutput, LatentsOutput
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.invocation_cache.invocation_cache_sqlite import SqliteInvocationCache
+from invokeai.app.services.shared.sqlite.sqlite_database import SqliteDatabase
+from invokeai.backend.util.logging import InvokeAILogger
+from tests.fixtures.sqlite_database import create_mock_sqlite_database
+
+
+@pytest.fixture
+def db() -> SqliteDatabase:
+    return create_mock_sqlite_database(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+
+
+def create_cache(
+    db: SqliteDatabase, persist_tensors: bool = False, deferred_images: frozenset[str] = frozenset()
+) -> SqliteInvocationCache:
+    cache = SqliteInvocationCache(db=db, max_cache_size=5, persist_tensors=persist_tensors)
+    invoker = Mock()
+    invoker.services.image_files.is_deferred.side_effect = lambda image_name: image_name in deferred_images
+    cache.start(invoker)
+    return cache
+
+
+def test_invocation_cache_sqlite_survives_restart(db: SqliteDatabase):
+    output_1 = ImageOutput(image=ImageField(image_name="foo"), width=512, height=512)
+    output_2 = ImageOutput(image=ImageField(image_name="bar"), width=512, height=512)
+    cache = create_cache(db)
+    cache.save("1", output_1)
+    cache.save("2", output_2)
+    cache.get("1")
+
+    restarted = create_cache(db)
+    assert restarted.get("1") == output_1
+    assert restarted.get("2") == output_2
+    assert restarted._references == {"foo": {"1"}, "bar": {"2"}}
+
+
+def test_invocation_cache_sqlite_deletes_by_match(db: SqliteDatabase):
+    cache = create_cache(db)
+    cache.save("1", ImageOutput(image=ImageField(image_name="foo"), width=512, height=512))
+    cache.save("2", ImageOutput(image=ImageField(image_name="bar"), width=512, height=512))
+    cache._delete_by_match("foo")
+
+    restarted = create_cache(db)
+    assert list(restarted._cache.keys()) == ["2"]
+
+
+def test_invocation_cache_sqlite_evicts_and_clears(db: SqliteDatabase):
+    cache = create_cache(db)
+    for i in range(7):
+        cache.save(str(i), ImageOutput(image=ImageField(image_name=str(i)), width=512, height=512))
+    assert list(create_cache(db)._cache.keys()) == ["2", "3", "4", "5", "6"]
+
+    cache.clear()
+    assert len(create_cache(db)._cache) == 0
+
+
+def test_invocation_cache_sqlite_persists_tensors_only_if_enabled(db: SqliteDatabase):
+    output = LatentsOutput(latents=LatentsField(latents_name="foo_latents"), width=512, height=512)
+    cache = create_cache(db, persist_tensors=True)
+    cache.save("1", output)
+
+    # Tensors are deleted on shutdown, unless they are persisted
+    assert create_cache(db, persist_tensors=True).get("1") == output
+    assert create_cache(db).get("1") is None
+    assert create_cache(db, persist_tensors=True).get("1") is None
+
+    cache = create_cache(db)
+    cache.save("2", output)
+    assert cache.get("2") == output
+    assert create_cache(db, persist_tensors=True).get("2") is None
+
+
+def test_invocation_cache_sqlite_does_not_persist_deferred_images(db: SqliteDatabase):
+    deferred_output = ImageOutput(image=ImageField(image_name="foo"), width=512, height=512)
+    written_output = ImageOutput(image=ImageField(image_name="bar"), width=512, height=512)
+    cache = create_cache(db, deferred_images=frozenset({"foo"}))
+    cache.save("1", deferred_output)
+    cache.save("2", written_output)
+
+    # Deferred images may never be written, so outputs referencing them are only cached in memory
+    assert cache.get("1") == deferred_output
+    restarted = create_cache(db)
+    assert restarted.get("1") is None
+    assert restarted.get("2") == written_output
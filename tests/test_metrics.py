@@ -0,0 +1,46 @@
+from invokeai.app.util.metrics import Histogram, MetricsWriter
+
+
+def test_histogram_counts_observations_by_label():
+    histogram = Histogram(buckets=[1.0, 0.1])
+    histogram.observe(0.05, "a")
+    histogram.observe(0.1, "a")
+    histogram.observe(0.5, "a")
+    histogram.observe(5.0, "b")
+    assert histogram.buckets == (0.1, 1.0)
+    samples = histogram.collect()
+    assert samples["a"].bucket_counts == [2, 1, 0]
+    assert samples["a"].count == 3
+    assert samples["a"].sum == 0.65
+    assert samples["b"].bucket_counts == [0, 0, 1]
+
+
+def test_metrics_writer_renders_text_format():
+    histogram = Histogram(buckets=[0.1, 1.0])
+    histogram.observe(0.05, "noise")
+    histogram.observe(0.5, "noise")
+    writer = MetricsWriter()
+    writer.gauge("queue_items", "Queue items", {"pending": 2, 'in "progress"': 1}, label_name="status")
+    writer.counter("hits_total", "Hits", 3)
+    writer.summary("lag_seconds", "Lag", 1.5, 4)
+    writer.histogram("duration_seconds", "Duration", histogram, label_name="node_type")
+    assert writer.render().splitlines() == [
+        "# HELP queue_items Queue items",
+        "# TYPE queue_items gauge",
+        'queue_items{status="pending"} 2',
+        'queue_items{status="in \\"progress\\""} 1',
+        "# HELP hits_total Hits",
+        "# TYPE hits_total counter",
+        "hits_total 3",
+        "# HELP lag_seconds Lag",
+        "# TYPE lag_seconds summary",
+        "lag_seconds_sum 1.5",
+        "lag_seconds_count 4",
+        "# HELP duration_seconds Duration",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{node_type="noise",le="0.1"} 1',
+        'duration_seconds_bucket{node_type="noise",le="1"} 2',
+        'duration_seconds_bucket{node_type="noise",le="+Inf"} 2',
+        'duration_seconds_sum{node_type="noise"} 0.55',
+        'duration_seconds_count{node_type="noise"} 2',
+    ]
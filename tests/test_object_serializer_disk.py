@@ -1,13 +1,21 @@
 import tempfile
+import threading
 from dataclasses import dataclass
 from pathlib import Path
+from types import SimpleNamespace
+from typing import TypeVar
 
 import pytest
 import torch
 
 from invokeai.app.services.object_serializer.object_serializer_common import ObjectNotFoundError
 from invokeai.app.services.object_serializer.object_serializer_disk import ObjectSerializerDisk
-from invokeai.app.services.object_serializer.object_serializer_forward_cache import ObjectSerializerForwardCache
+from invokeai.app.services.object_serializer.object_serializer_forward_cache import (
+    ObjectSerializerForwardCache,
+    get_object_size,
+)
+
+T = TypeVar("T")
 
 
 @dataclass
@@ -154,8 +162,7 @@ def test_obj_serializer_fwd_cache_respects_cache_size(fwd_cache: ObjectSerialize
     assert obj_1_name not in fwd_cache._cache
     assert obj_2_name in fwd_cache._cache
     assert obj_3_name in fwd_cache._cache
-    # apparently qsize is "not reliable"?
-    assert fwd_cache._cache_ids.qsize() == 2
+    assert len(fwd_cache._cache) == 2
 
 
 def test_obj_serializer_fwd_cache_calls_delete_callback(fwd_cache: ObjectSerializerForwardCache[MockDataclass]):
@@ -170,3 +177,299 @@ def test_obj_serializer_fwd_cache_calls_delete_callback(fwd_cache: ObjectSeriali
     obj_1_name = fwd_cache.save(obj_1)
     fwd_cache.delete(obj_1_name)
     assert called_name == obj_1_name
+
+
+def test_obj_serializer_fwd_cache_evicts_least_recently_used(fwd_cache: ObjectSerializerForwardCache[MockDataclass]):
+    obj_1_name = fwd_cache.save(MockDataclass(foo="bar"))
+    obj_2_name = fwd_cache.save(MockDataclass(foo="baz"))
+    # Loading the first object makes the second one the least recently used
+    fwd_cache.load(obj_1_name)
+    obj_3_name = fwd_cache.save(MockDataclass(foo="qux"))
+    assert obj_1_name in fwd_cache._cache
+    assert obj_2_name not in fwd_cache._cache
+    assert obj_3_name in fwd_cache._cache
+
+
+def test_obj_serializer_fwd_cache_respects_cache_bytes(tmp_path: Path):
+    fwd_cache = ObjectSerializerForwardCache(
+        ObjectSerializerDisk[torch.Tensor](tmp_path), max_cache_size=None, max_cache_bytes=int(2.5 * 2**20)
+    )
+    small_names = [fwd_cache.save(torch.zeros(16)) for _ in range(2)]
+    # 1 MB each, so only two of them fit alongside the small tensors
+    large_names = [fwd_cache.save(torch.zeros(2**18)) for _ in range(2)]
+    # The small tensors are reused, so the large ones are evicted first
+    fwd_cache.load(small_names[0])
+    fwd_cache.load(small_names[1])
+    large_names.extend(fwd_cache.save(torch.zeros(2**18)) for _ in range(2))
+    assert all(name in fwd_cache._cache for name in small_names)
+    assert [name in fwd_cache._cache for name in large_names] == [False, False, True, True]
+    status = fwd_cache.get_status()
+    assert status.size == 4
+    assert status.size_bytes == 2 * 16 * 4 + 2 * 2**20
+    assert status.hits == 2
+    assert status.evictions == 2
+
+
+def test_obj_serializer_fwd_cache_counts_shared_storage_once():
+    tensor = torch.zeros(1024)
+    assert get_object_size([tensor, tensor[:512], tensor.view(32, 32)]) == 4096
+
+
+def test_obj_serializer_fwd_cache_counts_hits_and_misses(fwd_cache: ObjectSerializerForwardCache[MockDataclass]):
+    obj_1_name = fwd_cache.save(MockDataclass(foo="bar"))
+    fwd_cache.load(obj_1_name)
+    fwd_cache.load(obj_1_name)
+    fwd_cache._underlying_storage.save(MockDataclass(foo="baz"))
+    obj_2_name = fwd_cache._underlying_storage.save(MockDataclass(foo="qux"))
+    assert fwd_cache.load(obj_2_name).foo == "qux"
+    status = fwd_cache.get_status()
+    assert status.hits == 2
+    assert status.misses == 1
+
+
+def test_obj_serializer_fwd_cache_counts_pinned_objects(fwd_cache: ObjectSerializerForwardCache[MockDataclass]):
+    obj_1_name = fwd_cache.save(MockDataclass(foo="bar"))
+    fwd_cache.pin(obj_1_name, "session_1")
+    fwd_cache.pin(obj_1_name, "session_2")
+    assert fwd_cache.get_status().pinned == 1
+    # The object stays pinned until all its owners unpin it
+    fwd_cache.unpin("session_1")
+    assert fwd_cache.get_status().pinned == 1
+    fwd_cache.unpin("session_2")
+    assert fwd_cache.get_status().pinned == 0
+
+
+def test_obj_serializer_fwd_cache_evicts_unpinned_objects_first(tmp_path: Path):
+    fwd_cache = ObjectSerializerForwardCache(
+        ObjectSerializerDisk[torch.Tensor](tmp_path), max_cache_size=None, max_cache_bytes=int(2.5 * 2**20)
+    )
+    # 1 MB each
+    pinned_name = fwd_cache.save(torch.full((2**18,), 0.0))
+    fwd_cache.pin(pinned_name, "session")
+    names = [fwd_cache.save(torch.full((2**18,), float(i))) for i in range(1, 4)]
+    # The pinned object is the least recently used, but the unpinned objects are evicted before it
+    assert pinned_name in fwd_cache._cache
+    assert [name in fwd_cache._cache for name in names] == [False, False, True]
+    assert fwd_cache.get_status().size_bytes <= 2.5 * 2**20
+
+
+def test_obj_serializer_fwd_cache_respects_cache_bytes_while_pinned(tmp_path: Path):
+    fwd_cache = ObjectSerializerForwardCache(
+        ObjectSerializerDisk[torch.Tensor](tmp_path), max_cache_size=None, max_cache_bytes=int(2.5 * 2**20)
+    )
+    # 1 MB each, all pinned by the session using them
+    names = [fwd_cache.save(torch.full((2**18,), float(i))) for i in range(4)]
+    for name in names:
+        fwd_cache.pin(name, "session")
+        assert fwd_cache.get_status().size_bytes <= 2.5 * 2**20
+    # Once only pinned objects are left, the least recently used are evicted
+    assert fwd_cache.load(names[3])[0] == 3
+    assert fwd_cache.load(names[2])[0] == 2
+    assert [name in fwd_cache._cache for name in names] == [False, False, True, True]
+    assert fwd_cache.get_status().size_bytes <= 2.5 * 2**20
+
+
+def test_obj_serializer_fwd_cache_is_thread_safe(tmp_path: Path):
+    fwd_cache = ObjectSerializerForwardCache(ObjectSerializerDisk[torch.Tensor](tmp_path), max_cache_size=8)
+    names = [fwd_cache.save(torch.full((4,), i)) for i in range(32)]
+    errors: list[Exception] = []
+
+    def worker(offset: int):
+        try:
+            for i in range(200):
+                name = names[(i * 7 + offset) % len(names)]
+                fwd_cache.pin(name, f"session_{offset}")
+                assert fwd_cache.load(name)[0] == names.index(name)
+                if i % 10 == 0:
+                    fwd_cache.unpin(f"session_{offset}")
+            fwd_cache.unpin(f"session_{offset}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    status = fwd_cache.get_status()
+    assert status.size == len(fwd_cache._cache) == 8
+    assert status.size_bytes == sum(get_object_size(obj) for obj in fwd_cache._cache.values())
+    assert status.pinned == 0
+
+
+class GatedObjectSerializerDisk(ObjectSerializerDisk[T]):
+    """Writes objects only once the gate is opened, or fails to write them if `fail` is set."""
+
+    def __init__(self, output_dir: Path):
+        super().__init__(output_dir)
+        self.gate = threading.Event()
+        self.fail = False
+        self.written: list[str] = []
+
+    def save_as(self, name: str, obj: T) -> None:
+        self.gate.wait()
+        if self.fail:
+            raise OSError("Disk full")
+        super().save_as(name, obj)
+        self.written.append(name)
+
+
+@pytest.fixture
+def gated_storage(tmp_path: Path):
+    return GatedObjectSerializerDisk[MockDataclass](tmp_path)
+
+
+@pytest.fixture
+def write_behind_cache(gated_storage: GatedObjectSerializerDisk[MockDataclass]):
+    return ObjectSerializerForwardCache(gated_storage, max_cache_size=1, write_behind=True)
+
+
+def test_obj_serializer_fwd_cache_write_behind_loads_pending_objects(
+    gated_storage: GatedObjectSerializerDisk[MockDataclass],
+    write_behind_cache: ObjectSerializerForwardCache[MockDataclass],
+):
+    obj_1_name = write_behind_cache.save(MockDataclass(foo="bar"))
+    obj_2_name = write_behind_cache.save(MockDataclass(foo="baz"))
+    assert not Path(gated_storage._output_dir, obj_1_name).exists()
+    # The first object was evicted before it was written, but is still loaded from memory
+    assert obj_1_name not in write_behind_cache._cache
+    assert write_behind_cache.load(obj_1_name).foo == "bar"
+    # Objects loaded from memory before they are written are cache hits
+    assert write_behind_cache.get_status().hits == 1
+    assert write_behind_cache.get_status().misses == 0
+    gated_storage.gate.set()
+    write_behind_cache.flush()
+    assert sorted(gated_storage.written) == sorted([obj_1_name, obj_2_name])
+    assert not write_behind_cache._pending
+    assert not write_behind_cache._writes
+    assert gated_storage.load(obj_1_name).foo == "bar"
+
+
+def test_obj_serializer_fwd_cache_write_behind_drops_deleted_objects(
+    gated_storage: GatedObjectSerializerDisk[MockDataclass],
+    write_behind_cache: ObjectSerializerForwardCache[MockDataclass],
+):
+    # Block both write threads, so the remaining writes stay queued
+    blocking_names = [write_behind_cache.save(MockDataclass(foo=str(i))) for i in range(2)]
+    obj_name = write_behind_cache.save(MockDataclass(foo="bar"))
+    write_behind_cache.delete(obj_name)
+    with pytest.raises(ObjectNotFoundError):
+        write_behind_cache.load(obj_name)
+    gated_storage.gate.set()
+    write_behind_cache.flush()
+    assert sorted(gated_storage.written) == sorted(blocking_names)
+    assert not Path(gated_storage._output_dir, obj_name).exists()
+
+
+def test_obj_serializer_fwd_cache_write_behind_deletes_written_objects(
+    gated_storage: GatedObjectSerializerDisk[MockDataclass],
+    write_behind_cache: ObjectSerializerForwardCache[MockDataclass],
+):
+    gated_storage.gate.set()
+    obj_name = write_behind_cache.save(MockDataclass(foo="bar"))
+    write_behind_cache.flush()
+    write_behind_cache.delete(obj_name)
+    assert not Path(gated_storage._output_dir, obj_name).exists()
+
+
+def test_obj_serializer_fwd_cache_write_behind_reports_errors(
+    gated_storage: GatedObjectSerializerDisk[MockDataclass],
+    write_behind_cache: ObjectSerializerForwardCache[MockDataclass],
+):
+    gated_storage.fail = True
+    gated_storage.gate.set()
+    obj_name = write_behind_cache.save(MockDataclass(foo="bar"))
+    with pytest.raises(OSError):
+        write_behind_cache.flush()
+    # The error is only reported once, and the object is only kept in memory while it is cached
+    write_behind_cache.flush()
+    assert not write_behind_cache._pending
+    assert write_behind_cache.load(obj_name).foo == "bar"
+    gated_storage.fail = False
+    write_behind_cache.save(MockDataclass(foo="baz"))
+    with pytest.raises(ObjectNotFoundError):
+        write_behind_cache.load(obj_name)
+    # Deleting the object does not try to delete it from the underlying storage
+    write_behind_cache.delete(obj_name)
+    assert not write_behind_cache._failed_writes
+
+
+def test_obj_serializer_fwd_cache_write_behind_requires_disk_storage():
+    with pytest.raises(ValueError):
+        ObjectSerializerForwardCache(
+            ObjectSerializerForwardCache(ObjectSerializerDisk[MockDataclass](Path())), write_behind=True
+        )
+
+
+class MockInvocationCache:
+    def __init__(self, references: set[str]):
+        self.references = references
+
+    def is_referenced(self, name: str) -> bool:
+        return name in self.references
+
+
+def create_gc_cache(tmp_path: Path, references: set[str]) -> ObjectSerializerForwardCache[torch.Tensor]:
+    fwd_cache = ObjectSerializerForwardCache(ObjectSerializerDisk[torch.Tensor](tmp_path), collect_garbage=True)
+    invoker = SimpleNamespace(services=SimpleNamespace(invocation_cache=MockInvocationCache(references)))
+    fwd_cache.start(invoker)  # pyright: ignore [reportArgumentType]
+    return fwd_cache
+
+
+def test_obj_serializer_fwd_cache_collects_garbage(tmp_path: Path):
+    references: set[str] = set()
+    fwd_cache = create_gc_cache(tmp_path, references)
+    shared_name = fwd_cache.save(torch.zeros(4))
+    cached_name = fwd_cache.save(torch.zeros(4))
+    unpinned_name = fwd_cache.save(torch.zeros(4))
+    references.add(cached_name)
+    for name in [shared_name, cached_name]:
+        fwd_cache.pin(name, "session_1")
+    fwd_cache.pin(shared_name, "session_2")
+    fwd_cache.unpin("session_1")
+    # Still used by the second session, referenced by the invocation cache, or never pinned
+    assert all(Path(tmp_path, name).exists() for name in [shared_name, cached_name, unpinned_name])
+    fwd_cache.unpin("session_2")
+    assert not Path(tmp_path, shared_name).exists()
+    assert shared_name not in fwd_cache._cache
+    with pytest.raises(ObjectNotFoundError):
+        fwd_cache.load(shared_name)
+
+
+def test_obj_serializer_fwd_cache_keeps_objects_of_reused_cached_outputs(tmp_path: Path):
+    references: set[str] = set()
+    fwd_cache = create_gc_cache(tmp_path, references)
+    # The first session saves the object, and its output is cached
+    name = fwd_cache.save(torch.zeros(4))
+    fwd_cache.pin(name, "session_1")
+    references.add(name)
+    fwd_cache.unpin("session_1")
+    assert Path(tmp_path, name).exists()
+    # The second session reuses the cached output, pinning the objects it references, then the output is evicted from
+    # the invocation cache
+    fwd_cache.pin(name, "session_2")
+    references.discard(name)
+    assert torch.equal(fwd_cache.load(name), torch.zeros(4))
+    fwd_cache.unpin("session_2")
+    assert not Path(tmp_path, name).exists()
+
+
+def test_obj_serializer_fwd_cache_reports_storage_status(tmp_path: Path):
+    references: set[str] = set()
+    fwd_cache = create_gc_cache(tmp_path, references)
+    pinned_name = fwd_cache.save(torch.zeros(1024))
+    cached_name = fwd_cache.save(torch.zeros(1024))
+    fwd_cache.save(torch.zeros(1024))
+    fwd_cache.pin(pinned_name, "session")
+    references.add(cached_name)
+    file_size = Path(tmp_path, pinned_name).stat().st_size
+    status = fwd_cache.get_storage_status()
+    assert status is not None
+    assert status.count == 3
+    assert status.size_bytes == 3 * file_size
+    assert status.live_count == 2
+    assert status.live_size_bytes == 2 * file_size
+    assert status.garbage_count == 1
+    assert status.garbage_size_bytes == file_size
+    assert ObjectSerializerDisk[torch.Tensor](tmp_path).get_storage_status() is None
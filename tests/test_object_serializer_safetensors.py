@@ -0,0 +1,92 @@
+from pathlib import Path
+
+import pytest
+import torch
+
+from invokeai.app.services.object_serializer.object_serializer_common import ObjectNotFoundError
+from invokeai.app.services.object_serializer.object_serializer_disk import ObjectSerializerDisk
+from invokeai.app.services.object_serializer.object_serializer_safetensors import ObjectSerializerSafetensors
+from invokeai.backend.stable_diffusion.diffusion.conditioning_data import (
+    BasicConditioningInfo,
+    ConditioningFieldData,
+    SDXLConditioningInfo,
+)
+
+
+@pytest.fixture
+def tensor_serializer(tmp_path: Path):
+    return ObjectSerializerSafetensors[torch.Tensor](tmp_path)
+
+
+@pytest.fixture
+def conditioning_serializer(tmp_path: Path):
+    return ObjectSerializerSafetensors[ConditioningFieldData](tmp_path)
+
+
+def test_obj_serializer_safetensors_saves_and_loads_tensors(
+    tensor_serializer: ObjectSerializerSafetensors[torch.Tensor],
+):
+    tensor = torch.randn(1, 4, 32, 32, dtype=torch.float16)
+    name = tensor_serializer.save(tensor)
+    # The file is a safetensors file, which starts with the size of its header rather than a pickle or zip header
+    with open(Path(tensor_serializer._output_dir, name), "rb") as file:
+        assert file.read(2) != b"PK"
+    loaded = tensor_serializer.load(name)
+    assert loaded.dtype == torch.float16
+    assert torch.equal(loaded, tensor)
+
+
+def test_obj_serializer_safetensors_saves_non_contiguous_tensors(
+    tensor_serializer: ObjectSerializerSafetensors[torch.Tensor],
+):
+    tensor = torch.randn(4, 8).t()
+    assert not tensor.is_contiguous()
+    name = tensor_serializer.save(tensor)
+    assert torch.equal(tensor_serializer.load(name), tensor)
+
+
+def test_obj_serializer_safetensors_saves_and_loads_conditioning(
+    conditioning_serializer: ObjectSerializerSafetensors[ConditioningFieldData],
+):
+    embeds = torch.randn(1, 77, 32)
+    conditioning = ConditioningFieldData(
+        conditionings=[
+            BasicConditioningInfo(embeds=embeds),
+            SDXLConditioningInfo(
+                # Tensors sharing memory are not allowed by safetensors, so they are copied when saved
+                embeds=embeds,
+                pooled_embeds=torch.randn(1, 16),
+                add_time_ids=torch.tensor([[1024.0, 1024.0, 0.0, 0.0, 1024.0, 1024.0]]),
+            ),
+        ]
+    )
+    name = conditioning_serializer.save(conditioning)
+    loaded = conditioning_serializer.load(name)
+    assert len(loaded.conditionings) == 2
+    basic, sdxl = loaded.conditionings
+    assert type(basic) is BasicConditioningInfo
+    assert type(sdxl) is SDXLConditioningInfo
+    assert torch.equal(basic.embeds, embeds)
+    assert torch.equal(sdxl.embeds, embeds)
+    assert torch.equal(sdxl.pooled_embeds, conditioning.conditionings[1].pooled_embeds)
+    assert torch.equal(sdxl.add_time_ids, conditioning.conditionings[1].add_time_ids)
+
+
+def test_obj_serializer_safetensors_loads_pickled_objects(tmp_path: Path):
+    tensor = torch.randn(2, 3)
+    name = ObjectSerializerDisk[torch.Tensor](tmp_path).save(tensor)
+    assert torch.equal(ObjectSerializerSafetensors[torch.Tensor](tmp_path).load(name), tensor)
+
+
+def test_obj_serializer_safetensors_deletes(tensor_serializer: ObjectSerializerSafetensors[torch.Tensor]):
+    name = tensor_serializer.save(torch.zeros(2))
+    tensor_serializer.delete(name)
+    assert not Path(tensor_serializer._output_dir, name).exists()
+    with pytest.raises(ObjectNotFoundError):
+        tensor_serializer.load(name)
+
+
+def test_obj_serializer_safetensors_rejects_unsupported_types(tmp_path: Path):
+    obj_serializer = ObjectSerializerSafetensors[str](tmp_path)  # type: ignore
+    with pytest.raises(ValueError):
+        obj_serializer.save("foo")  # type: ignore
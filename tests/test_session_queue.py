@@ -1,6 +1,16 @@
+import sqlite3
+import time
+from pathlib import Path
+from threading import Thread
+from typing import Any, Callable
+
 import pytest
 from pydantic import TypeAdapter, ValidationError
 
+from invokeai.app.invocations.primitives import IntegerInvocation
+from invokeai.app.services.invocation_services import InvocationServices
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.session_queue import session_queue_sqlite
 from invokeai.app.services.session_queue.session_queue_common import (
     Batch,
     BatchDataCollection,
@@ -8,11 +18,18 @@ from invokeai.app.services.session_queue.session_queue_common import (
     NodeFieldValue,
     calc_session_count,
     create_session_nfv_tuples,
+    get_session,
+    iter_values_to_insert,
+    prepare_batch_to_insert,
     prepare_values_to_insert,
 )
+from invokeai.app.services.session_queue.session_queue_sqlite import ENQUEUE_CHUNK_SIZE, SqliteSessionQueue
 from invokeai.app.services.shared.graph import Graph, GraphExecutionState
+from invokeai.app.services.shared.sqlite.sqlite_database import SqliteDatabase
+from invokeai.backend.util.logging import InvokeAILogger
+from tests.fixtures.sqlite_database import create_mock_sqlite_database
 
-from .test_nodes import PromptTestInvocation
+from .test_nodes import PromptTestInvocation, TestEventService
 
 
 @pytest.fixture
@@ -123,7 +140,9 @@ def test_calc_session_count(batch_data_collection, batch_graph):
 
 def test_prepare_values_to_insert(batch_data_collection, batch_graph):
     b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
-    values = prepare_values_to_insert(queue_id="default", batch=b, priority=0, max_new_queue_items=1000)
+    values = prepare_values_to_insert(
+        queue_id="default", batch=b, priority=0, max_new_queue_items=1000, with_sessions=True
+    )
     assert len(values) == 8
 
     GraphExecutionStateValidator = TypeAdapter(GraphExecutionState)
@@ -153,6 +172,31 @@ def test_prepare_values_to_insert(batch_data_collection, batch_graph):
     assert all(v.priority == 0 for v in values)
 
 
+def test_prepare_values_to_insert_without_sessions(batch_data_collection, batch_graph):
+    b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
+    values = prepare_values_to_insert(queue_id="default", batch=b, priority=0, max_new_queue_items=1000)
+    assert len(values) == 8
+    # sessions are materialized from the batch graph and the field values
+    assert all(v.session is None for v in values)
+    assert all(v.workflow is None for v in values)
+
+    batch_to_insert = prepare_batch_to_insert(b)
+    assert batch_to_insert.batch_id == b.batch_id
+    ges = get_session(
+        {
+            "session": values[0].session,
+            "session_id": values[0].session_id,
+            "batch_graph": batch_to_insert.graph,
+            "field_values": TypeAdapter(list[NodeFieldValue]).validate_json(values[0].field_values or "[]"),
+        }
+    )
+    assert ges.id == values[0].session_id
+    assert ges.graph.get_node("1").prompt == "Banana sushi"
+    assert ges.graph.get_node("2").prompt == "Strawberry sushi"
+    assert ges.graph.get_node("3").prompt == "Orange sushi"
+    assert ges.graph.get_node("4").prompt == "Nissan"
+
+
 def test_prepare_values_to_insert_with_priority(batch_data_collection, batch_graph):
     b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
     values = prepare_values_to_insert(queue_id="default", batch=b, priority=1, max_new_queue_items=1000)
@@ -165,6 +209,26 @@ def test_prepare_values_to_insert_with_max(batch_data_collection, batch_graph):
     assert len(values) == 5
 
 
+def test_calc_session_count_matches_sessions_created(batch_data_collection, batch_graph):
+    for b in [
+        Batch(graph=batch_graph),
+        Batch(graph=batch_graph, runs=3),
+        Batch(graph=batch_graph, data=batch_data_collection),
+        Batch(graph=batch_graph, data=batch_data_collection[:1], runs=3),
+        Batch(graph=batch_graph, data=batch_data_collection, runs=2),
+    ]:
+        assert calc_session_count(batch=b) == len(list(create_session_nfv_tuples(batch=b, maximum=1000)))
+
+
+def test_iter_values_to_insert_is_lazy(batch_data_collection, batch_graph):
+    b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
+    values = iter_values_to_insert(queue_id="default", batch=b, priority=0, max_new_queue_items=1000)
+    first = next(values)
+    assert first.batch_id == b.batch_id
+    # 8 sessions in total, one of which has been created
+    assert len(list(values)) == 7
+
+
 def test_cannot_create_bad_batch_items_length(batch_graph):
     with pytest.raises(ValidationError, match="Zipped batch items must all have the same length"):
         Batch(
@@ -231,3 +295,365 @@ def test_cannot_create_bad_batch_fields_exist(
                 ],
             ],
         )
+
+
+def test_cannot_create_bad_batch_items_value():
+    graph = Graph()
+    graph.add_node(IntegerInvocation(id="1"))
+    with pytest.raises(ValidationError, match=r"Invalid item 'banana' for field value of node 1"):
+        Batch(graph=graph, data=[[BatchDatum(node_path="1", field_name="value", items=["1", "banana", "1"])]])
+
+
+@pytest.fixture
+def session_queue(mock_services: InvocationServices) -> SqliteSessionQueue:
+    db = create_mock_sqlite_database(mock_services.configuration, InvokeAILogger.get_logger())
+    session_queue = SqliteSessionQueue(db=db)
+    mock_services.session_queue = session_queue
+    session_queue.start(Invoker(services=mock_services))
+    return session_queue
+
+
+def test_dequeue_claims_items_in_order(session_queue: SqliteSessionQueue, batch_graph: Graph):
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph, runs=2), prepend=False)
+    prepended = session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph), prepend=True)
+
+    first = session_queue.dequeue()
+    assert first is not None
+    assert first.batch_id == prepended.batch.batch_id
+    assert first.status == "in_progress"
+    assert first.started_at is not None
+    assert session_queue.get_queue_item(first.item_id).status == "in_progress"
+
+    second = session_queue.dequeue()
+    third = session_queue.dequeue()
+    assert second is not None and third is not None
+    assert second.item_id < third.item_id
+    assert session_queue.dequeue() is None
+
+
+def test_cancel_notifies_every_worker_executing_a_canceled_item(
+    session_queue: SqliteSessionQueue, mock_services: InvocationServices, batch_graph: Graph
+):
+    batch = session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph, runs=3), prepend=False)
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph), prepend=False)
+    # Three workers are executing the items of the batch, and a fourth one the item of the other batch
+    in_progress = [session_queue.dequeue() for _ in range(4)]
+    assert all(queue_item is not None for queue_item in in_progress)
+    events: TestEventService = mock_services.events  # type: ignore
+    events.events.clear()
+
+    result = session_queue.cancel_by_batch_ids(queue_id="default", batch_ids=[batch.batch.batch_id])
+    assert result.canceled == 3
+    canceled = [e.payload["queue_item_id"] for e in events.events if e.event_name == "session_canceled"]
+    assert canceled == [queue_item.item_id for queue_item in in_progress[:3]]  # type: ignore
+
+    events.events.clear()
+    session_queue.cancel_by_queue_id(queue_id="default")
+    canceled = [e.payload["queue_item_id"] for e in events.events if e.event_name == "session_canceled"]
+    assert canceled == [in_progress[3].item_id]  # type: ignore
+
+
+@pytest.mark.parametrize("supports_returning", [True, False])
+def test_dequeue_never_claims_an_item_twice(
+    monkeypatch: pytest.MonkeyPatch,
+    mock_services: InvocationServices,
+    batch_graph: Graph,
+    tmp_path: Path,
+    supports_returning: bool,
+):
+    monkeypatch.setattr(session_queue_sqlite, "SQLITE_SUPPORTS_RETURNING", supports_returning)
+    mock_services.configuration.use_memory_db = False
+    mock_services.configuration.db_dir = tmp_path
+    create_mock_sqlite_database(mock_services.configuration, InvokeAILogger.get_logger())
+    # Each worker has its own connection and lock, so their dequeues race in the database
+    session_queues: list[SqliteSessionQueue] = []
+    for _ in range(4):
+        session_queue = SqliteSessionQueue(
+            db=SqliteDatabase(mock_services.configuration.db_path, InvokeAILogger.get_logger())
+        )
+        session_queue.start(Invoker(services=mock_services))
+        session_queues.append(session_queue)
+    session_queues[0].enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph, runs=100), prepend=False)
+    claimed: list[int] = []
+
+    def worker(session_queue: SqliteSessionQueue) -> None:
+        while (queue_item := session_queue.dequeue()) is not None:
+            claimed.append(queue_item.item_id)
+
+    threads = [Thread(target=worker, args=(session_queue,)) for session_queue in session_queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(claimed) == 100
+    assert len(set(claimed)) == 100
+
+
+def test_dequeue_fails_items_whose_session_cannot_be_built(session_queue: SqliteSessionQueue, batch_graph: Graph):
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph, runs=2), prepend=False)
+    # E.g. the node's fields changed since the item was enqueued
+    conn: sqlite3.Connection = session_queue._SqliteSessionQueue__conn  # type: ignore
+    bad_field_values = '[{"node_path": "1", "field_name": "batman", "value": "Banana sushi"}]'
+    conn.execute("UPDATE session_queue SET field_values = ? WHERE item_id = 1", (bad_field_values,))
+    conn.commit()
+
+    queue_item = session_queue.dequeue()
+    assert queue_item is not None
+    assert queue_item.item_id == 2
+    failed_item = session_queue.list_queue_items(queue_id="default", limit=10, priority=0, status="failed").items[0]
+    assert failed_item.item_id == 1
+    assert failed_item.error is not None and "batman" in failed_item.error
+    queue_status = session_queue.get_queue_status(queue_id="default")
+    assert queue_status.item_id == 2
+    assert queue_status.failed == 1
+
+
+@pytest.mark.slow
+def test_dequeue_throughput(session_queue: SqliteSessionQueue, batch_graph: Graph):
+    # 10k pending items, the default `max_queue_size`
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph, runs=10000), prepend=False)
+    dequeue_count = 1000
+
+    start = time.perf_counter()
+    for _ in range(dequeue_count):
+        assert session_queue.dequeue() is not None
+    elapsed = time.perf_counter() - start
+
+    # Claiming an item uses the status and priority indices, so it must not scan the 10k pending items
+    assert elapsed / dequeue_count < 0.005
+
+
+def get_query_plan(session_queue: SqliteSessionQueue, stmt: str) -> list[str]:
+    """Gets the details of each step of the query plan for a statement."""
+    rows = session_queue._SqliteSessionQueue__conn.execute(f"EXPLAIN QUERY PLAN {stmt}").fetchall()  # type: ignore
+    return [row[3] for row in rows]
+
+
+def trace_session_queue_statements(session_queue: SqliteSessionQueue, fn: Callable[[], Any]) -> list[str]:
+    """Gets the (expanded) statements on the `session_queue` table executed while calling a function."""
+    stmts: list[str] = []
+    conn: sqlite3.Connection = session_queue._SqliteSessionQueue__conn  # type: ignore
+    conn.set_trace_callback(stmts.append)
+    try:
+        fn()
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in stmts if "session_queue" in s and "INSERT INTO" not in s]
+
+
+@pytest.mark.parametrize(
+    ["method", "expected_index"],
+    [
+        ("dequeue", "idx_session_queue_status_priority_item_id"),
+        ("get_next", "idx_session_queue_queue_id_status_priority_item_id"),
+        ("get_current", "idx_session_queue_queue_id_status_priority_item_id"),
+        ("get_queue_status", "session_queue_status_counts USING PRIMARY KEY"),
+        ("get_batch_status", "session_queue_batch_status_counts USING PRIMARY KEY"),
+        ("prune", "idx_session_queue_queue_id_status_priority_item_id"),
+        ("_get_current_queue_size", "idx_session_queue_queue_id_status_priority_item_id"),
+    ],
+)
+def test_session_queue_query_plans(
+    session_queue: SqliteSessionQueue, batch_graph: Graph, method: str, expected_index: str
+):
+    enqueue_result = session_queue.enqueue_batch(
+        queue_id="default", batch=Batch(graph=batch_graph, runs=10), prepend=False
+    )
+    calls: dict[str, Callable[[], Any]] = {
+        "dequeue": lambda: session_queue.dequeue(),
+        "get_next": lambda: session_queue.get_next(queue_id="default"),
+        "get_current": lambda: session_queue.get_current(queue_id="default"),
+        "get_queue_status": lambda: session_queue.get_queue_status(queue_id="default"),
+        "get_batch_status": lambda: session_queue.get_batch_status(
+            queue_id="default", batch_id=enqueue_result.batch.batch_id
+        ),
+        "prune": lambda: session_queue.prune(queue_id="default"),
+        "_get_current_queue_size": lambda: session_queue._get_current_queue_size(queue_id="default"),
+    }
+
+    stmts = trace_session_queue_statements(session_queue, calls[method])
+    assert len(stmts) > 0
+
+    plans = [get_query_plan(session_queue, stmt) for stmt in stmts]
+    # The method's own statement is always the first, anything after that is incidental (e.g. event payloads)
+    assert any(expected_index in step for step in plans[0])
+    for plan in plans:
+        # No statement may scan the table or sort its results outside of an index
+        assert not any(step.startswith("SCAN session_queue") for step in plan), plan
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_status_counts_match_queue_items(session_queue: SqliteSessionQueue, batch_graph: Graph):
+    def assert_status_counts_match() -> None:
+        conn: sqlite3.Connection = session_queue._SqliteSessionQueue__conn  # type: ignore
+        for queue_id, batch_id in conn.execute("SELECT DISTINCT queue_id, batch_id FROM session_queue").fetchall():
+            expected = dict(
+                conn.execute(
+                    "SELECT status, count(*) FROM session_queue WHERE queue_id = ? AND batch_id = ? GROUP BY status",
+                    (queue_id, batch_id),
+                ).fetchall()
+            )
+            batch_status = session_queue.get_batch_status(queue_id=queue_id, batch_id=batch_id)
+            assert {s: getattr(batch_status, s) for s in expected} == expected
+            assert batch_status.total == sum(expected.values())
+        expected = dict(conn.execute("SELECT status, count(*) FROM session_queue GROUP BY status").fetchall())
+        queue_status = session_queue.get_queue_status(queue_id="default")
+        assert {s: getattr(queue_status, s) for s in expected} == expected
+        assert queue_status.total == sum(expected.values())
+        # The counts of statuses whose queue items were all removed are kept at 0
+        counts = session_queue.get_queue_status_counts(queue_id="default")
+        assert {s: count for s, count in counts.items() if count > 0} == expected
+
+    first = session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph, runs=5), prepend=False)
+    second = session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph, runs=5), prepend=False)
+    assert_status_counts_match()
+
+    queue_item = session_queue.dequeue()
+    assert queue_item is not None
+    session_queue._set_queue_item_status(item_id=queue_item.item_id, status="completed")
+    queue_item = session_queue.dequeue()
+    assert queue_item is not None
+    session_queue._set_queue_item_status(item_id=queue_item.item_id, status="failed", error="error")
+    queue_item = session_queue.dequeue()
+    assert queue_item is not None
+    session_queue.cancel_queue_item(item_id=queue_item.item_id)
+    queue_item = session_queue.get_next(queue_id="default")
+    assert queue_item is not None
+    session_queue.delete_queue_item(item_id=queue_item.item_id)
+    assert_status_counts_match()
+
+    session_queue.cancel_by_batch_ids(queue_id="default", batch_ids=[first.batch.batch_id])
+    assert_status_counts_match()
+
+    session_queue.prune(queue_id="default")
+    assert_status_counts_match()
+    assert session_queue.get_batch_status(queue_id="default", batch_id=first.batch.batch_id).total == 0
+
+    session_queue.clear(queue_id="default")
+    assert_status_counts_match()
+    assert session_queue.get_batch_status(queue_id="default", batch_id=second.batch.batch_id).total == 0
+    assert session_queue.get_queue_status(queue_id="default").total == 0
+
+
+def test_enqueue_batch_in_chunks(session_queue: SqliteSessionQueue, batch_graph: Graph):
+    runs = ENQUEUE_CHUNK_SIZE * 2 + 1
+    enqueue_result = session_queue.enqueue_batch(
+        queue_id="default", batch=Batch(graph=batch_graph, runs=runs), prepend=False
+    )
+    assert enqueue_result.requested == runs
+    assert enqueue_result.enqueued == runs
+    assert session_queue.get_queue_status(queue_id="default").pending == runs
+
+
+def test_enqueue_batch_stops_at_max_queue_size(
+    mock_services: InvocationServices, session_queue: SqliteSessionQueue, batch_graph: Graph
+):
+    mock_services.configuration.max_queue_size = ENQUEUE_CHUNK_SIZE + 10
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph, runs=10), prepend=False)
+    enqueue_result = session_queue.enqueue_batch(
+        queue_id="default", batch=Batch(graph=batch_graph, runs=ENQUEUE_CHUNK_SIZE * 2), prepend=False
+    )
+    assert enqueue_result.requested == ENQUEUE_CHUNK_SIZE * 2
+    assert enqueue_result.enqueued == ENQUEUE_CHUNK_SIZE
+    assert session_queue.get_queue_status(queue_id="default").pending == ENQUEUE_CHUNK_SIZE + 10
+
+
+def test_queue_items_share_batch_graph(session_queue: SqliteSessionQueue, batch_graph: Graph, batch_data_collection):
+    enqueue_result = session_queue.enqueue_batch(
+        queue_id="default", batch=Batch(graph=batch_graph, data=batch_data_collection), prepend=False
+    )
+    conn: sqlite3.Connection = session_queue._SqliteSessionQueue__conn  # type: ignore
+    assert conn.execute("SELECT count(*) FROM session_queue_batches").fetchone()[0] == 1
+    assert conn.execute("SELECT count(*) FROM session_queue WHERE session IS NOT NULL").fetchone()[0] == 0
+
+    # sessions are materialized on read, with the item's field values applied
+    queue_item = session_queue.get_next(queue_id="default")
+    assert queue_item is not None
+    assert queue_item.session.id == queue_item.session_id
+    assert queue_item.session.graph.get_node("1").prompt == "Banana sushi"
+    assert queue_item.session.graph.get_node("3").prompt == "Orange sushi"
+    dequeued = session_queue.dequeue()
+    assert dequeued is not None
+    assert dequeued.session.id == queue_item.session.id
+    assert dequeued.session.graph == queue_item.session.graph
+    assert session_queue.get_queue_item(dequeued.item_id).session.graph == queue_item.session.graph
+
+    # the batch is deleted along with its last queue item
+    session_queue.cancel_by_batch_ids(queue_id="default", batch_ids=[enqueue_result.batch.batch_id])
+    session_queue.prune(queue_id="default")
+    assert conn.execute("SELECT count(*) FROM session_queue_batches").fetchone()[0] == 0
+
+
+def test_enqueue_batch_with_reused_batch_id(session_queue: SqliteSessionQueue, batch_graph: Graph):
+    first = Batch(graph=batch_graph)
+    session_queue.enqueue_batch(queue_id="default", batch=first, prepend=False)
+    other_graph = batch_graph.model_copy(deep=True)
+    other_graph.get_node("1").prompt = "Ford"
+    session_queue.enqueue_batch(
+        queue_id="default", batch=Batch(batch_id=first.batch_id, graph=other_graph), prepend=False
+    )
+
+    first_item = session_queue.dequeue()
+    second_item = session_queue.dequeue()
+    assert first_item is not None and second_item is not None
+    assert first_item.session.graph.get_node("1").prompt == "Chevy"
+    assert second_item.session.graph.get_node("1").prompt == "Ford"
+
+
+def test_session_checkpoints_resume_after_restart(mock_services: InvocationServices, batch_graph: Graph):
+    mock_services.configuration.session_checkpoints = True
+    db = create_mock_sqlite_database(mock_services.configuration, InvokeAILogger.get_logger())
+    session_queue = SqliteSessionQueue(db=db)
+    mock_services.session_queue = session_queue
+    session_queue.start(Invoker(services=mock_services))
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph), prepend=False)
+
+    queue_item = session_queue.dequeue()
+    assert queue_item is not None
+    invocation = queue_item.session.next()
+    assert isinstance(invocation, PromptTestInvocation)
+    queue_item.session.complete(invocation.id, invocation.invoke(None))  # type: ignore
+    session_queue.set_queue_item_session(queue_item.item_id, queue_item.session)
+
+    # the app is restarted while the item is in progress
+    restarted_queue = SqliteSessionQueue(db=db)
+    mock_services.session_queue = restarted_queue
+    restarted_queue.start(Invoker(services=mock_services))
+
+    resumed = restarted_queue.dequeue()
+    assert resumed is not None
+    assert resumed.item_id == queue_item.item_id
+    assert resumed.session.executed == queue_item.session.executed
+    assert resumed.session.results == queue_item.session.results
+    assert resumed.session.source_prepared_mapping == queue_item.session.source_prepared_mapping
+    next_invocation = resumed.session.next()
+    assert next_invocation is not None
+    assert next_invocation.id not in resumed.session.executed
+
+
+def test_session_checkpoints_fail_items_after_max_resumes(mock_services: InvocationServices, batch_graph: Graph):
+    mock_services.configuration.session_checkpoints = True
+    mock_services.configuration.session_max_resumes = 2
+    db = create_mock_sqlite_database(mock_services.configuration, InvokeAILogger.get_logger())
+    session_queue = SqliteSessionQueue(db=db)
+    mock_services.session_queue = session_queue
+    session_queue.start(Invoker(services=mock_services))
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=batch_graph), prepend=False)
+
+    # the app crashes while the item is in progress, every time it is resumed
+    for _ in range(2):
+        queue_item = session_queue.dequeue()
+        assert queue_item is not None
+        session_queue = SqliteSessionQueue(db=db)
+        mock_services.session_queue = session_queue
+        session_queue.start(Invoker(services=mock_services))
+        assert session_queue.get_queue_item(queue_item.item_id).status == "pending"
+
+    assert session_queue.dequeue() is not None
+    session_queue = SqliteSessionQueue(db=db)
+    session_queue._set_in_progress_to_pending(max_resumes=2)  # start() would also prune the failed item
+    failed_item = session_queue.get_queue_item(queue_item.item_id)
+    assert failed_item.status == "failed"
+    assert failed_item.error == "Interrupted after being resumed 2 times"
+    assert session_queue.dequeue() is None
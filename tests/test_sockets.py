@@ -0,0 +1,237 @@
+# pyright: reportPrivateUsage=false
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Optional
+from unittest.mock import Mock
+
+import pytest
+from fastapi import FastAPI
+from PIL import Image
+
+from invokeai.app.api.dependencies import ApiDependencies
+from invokeai.app.api.sockets import SocketIO
+from invokeai.app.invocations.primitives import IntegerCollectionInvocation, IntegerCollectionOutput
+from invokeai.app.services.events.events_base import EventServiceBase
+from invokeai.app.services.session_processor.session_processor_common import ProgressPreview
+
+
+@pytest.fixture
+def events(monkeypatch: pytest.MonkeyPatch) -> Mock:
+    events = Mock()
+    monkeypatch.setattr(
+        ApiDependencies, "invoker", SimpleNamespace(services=SimpleNamespace(events=events)), raising=False
+    )
+    return events
+
+
+def create_socket_io(progress_events_per_second: float) -> tuple[SocketIO, list[tuple[str, Any]]]:
+    socket_io = SocketIO(FastAPI(), progress_events_per_second=progress_events_per_second)
+    emitted: list[tuple[str, Any]] = []
+
+    async def emit(event: str, data: Any, room: str) -> None:
+        emitted.append((event, data))
+
+    async def enter_or_leave_room(sid: str, room: str) -> None:
+        pass
+
+    socket_io._SocketIO__sio.emit = emit  # type: ignore
+    socket_io._SocketIO__sio.enter_room = enter_or_leave_room  # type: ignore
+    socket_io._SocketIO__sio.leave_room = enter_or_leave_room  # type: ignore
+    return socket_io, emitted
+
+
+def queue_event(event_name: str, queue_item_id: int, **data: Any) -> Any:
+    return (
+        "queue_event",
+        {"event": event_name, "data": {"queue_id": "default", "queue_item_id": queue_item_id, **data}},
+    )
+
+
+def progress_event(queue_item_id: int, step: int, progress_image: Optional[ProgressPreview] = None) -> Any:
+    return queue_event("generator_progress", queue_item_id, step=step, progress_image=progress_image)
+
+
+def progress(queue_item_id: int, step: int) -> tuple[str, Any]:
+    return (
+        "generator_progress",
+        {"queue_id": "default", "queue_item_id": queue_item_id, "step": step, "progress_image": None},
+    )
+
+
+def test_sockets_coalesce_progress_events(events: Mock):
+    async def run():
+        socket_io, emitted = create_socket_io(progress_events_per_second=10)
+        await socket_io._handle_sub_queue("sid", {"queue_id": "default"})
+        for step in range(10):
+            await socket_io._handle_queue_event(progress_event(1, step))
+            await socket_io._handle_queue_event(progress_event(2, step))
+        await asyncio.sleep(0.01)
+        # The first progress events are sent right away, only with the latest progress of each queue item
+        assert emitted == [progress(1, 9), progress(2, 9)]
+        await socket_io._handle_queue_event(progress_event(1, 10))
+        await asyncio.sleep(0.01)
+        # Later progress events wait for the rate limit
+        assert len(emitted) == 2
+        await asyncio.sleep(0.2)
+        assert emitted[2:] == [progress(1, 10)]
+
+    asyncio.run(run())
+
+
+def test_sockets_drop_progress_events_of_finished_queue_items(events: Mock):
+    async def run():
+        socket_io, emitted = create_socket_io(progress_events_per_second=20)
+        await socket_io._handle_sub_queue("sid", {"queue_id": "default"})
+        await socket_io._handle_queue_event(progress_event(1, 0))
+        await socket_io._handle_queue_event(queue_event("session_canceled", 1))
+        await asyncio.sleep(0.1)
+        assert emitted == [("session_canceled", {"queue_id": "default", "queue_item_id": 1})]
+
+    asyncio.run(run())
+
+
+def test_sockets_send_all_progress_events_without_rate_limit(events: Mock):
+    async def run():
+        socket_io, emitted = create_socket_io(progress_events_per_second=0)
+        await socket_io._handle_sub_queue("sid", {"queue_id": "default"})
+        for step in range(3):
+            await socket_io._handle_queue_event(progress_event(1, step))
+        assert emitted == [progress(1, 0), progress(1, 1), progress(1, 2)]
+
+    asyncio.run(run())
+
+
+def test_sockets_encode_progress_images_for_each_subscriber(events: Mock):
+    async def run():
+        socket_io, emitted = create_socket_io(progress_events_per_second=0)
+        await socket_io._handle_sub_queue("legacy", {"queue_id": "default"})
+        await socket_io._handle_sub_queue(
+            "binary", {"queue_id": "default", "progress_images": {"format": "rgb", "max_size": 32}}
+        )
+        await socket_io._handle_sub_queue(
+            "slow", {"queue_id": "default", "progress_images": {"format": "webp", "max_per_second": 0.001}}
+        )
+        preview = ProgressPreview(image=Image.new("RGB", (64, 32), (255, 0, 0)), width=512, height=256)
+        await socket_io._handle_queue_event(progress_event(1, 0, preview))
+        await socket_io._handle_queue_event(progress_event(1, 1, preview))
+        return emitted
+
+    emitted = asyncio.run(run())
+    images = [data["progress_image"] for _, data in emitted]
+    assert len(images) == 6
+    # Clients that do not ask for progress images get JPEG data URLs
+    assert images[0]["dataURL"].startswith("data:image/jpeg;base64,")
+    assert images[0]["width"] == 512
+    assert images[1]["data"] == b"\xff\x00\x00" * 32 * 16
+    assert (images[1]["image_width"], images[1]["image_height"]) == (32, 16)
+    assert images[2]["format"] == "webp"
+    assert images[2]["data"].startswith(b"RIFF")
+    # The next progress image is not due yet
+    assert images[5] is None
+
+
+def test_sockets_forget_progress_rooms_without_subscribers(events: Mock):
+    async def run():
+        socket_io, _ = create_socket_io(progress_events_per_second=0)
+        webp = {"queue_id": "default", "progress_images": {"format": "webp"}}
+        await socket_io._handle_sub_queue("a", webp)
+        await socket_io._handle_sub_queue("b", webp)
+        await socket_io._handle_sub_queue("c", {"queue_id": "default"})
+        preview = ProgressPreview(image=Image.new("RGB", (8, 8)), width=64, height=64)
+        await socket_io._handle_queue_event(progress_event(1, 0, preview))
+        sent_at = socket_io._SocketIO__progress_images_sent_at  # type: ignore
+        assert len(sent_at) == 2
+        # The room is still used by another subscriber
+        await socket_io._handle_unsub_queue("a", {"queue_id": "default"})
+        assert len(sent_at) == 2
+        await socket_io._handle_sub_queue("b", {"queue_id": "default"})
+        assert len(sent_at) == 1
+        await socket_io._handle_disconnect("c")
+        assert len(sent_at) == 1
+        await socket_io._handle_disconnect("b")
+        assert sent_at == {}
+
+    asyncio.run(run())
+
+
+def test_sockets_count_progress_image_subscribers(events: Mock):
+    async def run():
+        socket_io, _ = create_socket_io(progress_events_per_second=0)
+        await socket_io._handle_sub_queue("a", {"queue_id": "default"})
+        await socket_io._handle_sub_queue("b", {"queue_id": "default", "progress_images": {"format": "none"}})
+        events.set_progress_image_subscribers.assert_called_with("default", 1)
+        await socket_io._handle_sub_queue("b", {"queue_id": "default"})
+        events.set_progress_image_subscribers.assert_called_with("default", 2)
+        await socket_io._handle_unsub_queue("a", {"queue_id": "default"})
+        events.set_progress_image_subscribers.assert_called_with("default", 1)
+        await socket_io._handle_disconnect("b")
+        events.set_progress_image_subscribers.assert_called_with("default", 0)
+
+    asyncio.run(run())
+
+
+def test_sockets_forget_queues_without_subscribers(events: Mock):
+    async def run():
+        socket_io, _ = create_socket_io(progress_events_per_second=10)
+        await socket_io._handle_sub_queue("a", {"queue_id": "default"})
+        await socket_io._handle_sub_queue("b", {"queue_id": "default"})
+        await socket_io._handle_queue_event(queue_event("queue_item_status_changed", 1))
+        await socket_io._handle_queue_event(progress_event(1, 0))
+        await asyncio.sleep(0.01)
+        await socket_io._handle_unsub_queue("a", {"queue_id": "default"})
+        assert "default" in socket_io._SocketIO__queue_locks  # type: ignore
+        await socket_io._handle_disconnect("b")
+        assert socket_io._SocketIO__queue_locks == {}  # type: ignore
+        assert socket_io._SocketIO__progress_sent_at == {}  # type: ignore
+        assert socket_io._SocketIO__slim_events == {}  # type: ignore
+        assert socket_io._SocketIO__progress_image_settings == {}  # type: ignore
+
+    asyncio.run(run())
+
+
+def test_sockets_send_slim_invocation_events(events: Mock):
+    async def run():
+        socket_io, emitted = create_socket_io(progress_events_per_second=0)
+        await socket_io._handle_sub_queue("full", {"queue_id": "default"})
+        await socket_io._handle_sub_queue("slim", {"queue_id": "default", "slim_events": True})
+        node = IntegerCollectionInvocation(id="1", collection=list(range(1000)))
+        result = IntegerCollectionOutput(collection=list(range(1000)))
+        await socket_io._handle_queue_event(
+            queue_event(
+                "invocation_complete", 1, node=node.model_dump(mode="json"), result=result.model_dump(mode="json")
+            )
+        )
+        return emitted
+
+    emitted = asyncio.run(run())
+    assert emitted[0][1]["node"]["collection"] == list(range(1000))
+    assert emitted[0][1]["result"]["collection"] == list(range(1000))
+    assert emitted[1] == (
+        "invocation_complete",
+        {
+            "queue_id": "default",
+            "queue_item_id": 1,
+            "node": {"id": "1", "type": "integer_collection"},
+            "result": {"type": "integer_collection_output"},
+        },
+    )
+
+
+def test_invocation_events_carry_snapshots_of_the_node_and_output():
+    class RecordingEventService(EventServiceBase):
+        def __init__(self) -> None:
+            self.payloads: list[Any] = []
+
+        def dispatch(self, event_name: str, payload: Any) -> None:
+            self.payloads.append(payload)
+
+    events = RecordingEventService()
+    node = IntegerCollectionInvocation(id="1", collection=[1])
+    result = IntegerCollectionOutput(collection=[1])
+    events.emit_invocation_complete("default", 1, "batch", "session", result, node, "1")
+    # The processor may change the node and output before the event is sent from another thread
+    node.collection.append(2)
+    result.collection.append(2)
+    data = events.payloads[0]["data"]
+    assert data["node"]["collection"] == [1]
+    assert data["result"]["collection"] == [1]